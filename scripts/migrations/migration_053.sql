@@ -0,0 +1,87 @@
+/** Incremental maintenance for query cache tables
+  * Changes to (source, post_id) partitions of relevant tables are logged by
+    statement triggers so that QueryCacheToDb tasks can recompute only the
+    affected partitions since their last refresh.
+  */
+
+BEGIN;
+
+    -- 1. Create change log and watermark relations
+    CREATE TABLE cache_partition_change (
+        change_id BIGSERIAL PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        -- NULL key means that the whole table has been changed (TRUNCATE)
+        source TEXT,
+        post_id TEXT,
+        changed_at TIMESTAMP DEFAULT now()
+    );
+    CREATE INDEX cache_partition_change_table_name_change_id_idx
+        ON cache_partition_change (table_name, change_id);
+
+    CREATE TABLE cache_watermark (
+        cache_table TEXT PRIMARY KEY,
+        last_change_id BIGINT NOT NULL,
+        refreshed_at TIMESTAMP
+    );
+
+
+    -- 2. Create trigger functions
+    CREATE FUNCTION log_partition_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO cache_partition_change (table_name, source, post_id)
+                SELECT DISTINCT
+                    TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME,
+                    source, post_id
+                FROM changed_row;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE FUNCTION log_partition_truncate() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO cache_partition_change (table_name)
+                VALUES (TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+    $$ LANGUAGE plpgsql;
+
+    -- Install all triggers required to log changes of the given table
+    CREATE FUNCTION track_partition_changes(tracked_table regclass)
+    RETURNS void AS $$
+        BEGIN
+            EXECUTE format('
+                CREATE TRIGGER log_partition_insert
+                AFTER INSERT ON %s
+                REFERENCING NEW TABLE AS changed_row
+                FOR EACH STATEMENT EXECUTE FUNCTION log_partition_change()
+            ', tracked_table);
+            EXECUTE format('
+                CREATE TRIGGER log_partition_update
+                AFTER UPDATE ON %s
+                REFERENCING NEW TABLE AS changed_row
+                FOR EACH STATEMENT EXECUTE FUNCTION log_partition_change()
+            ', tracked_table);
+            EXECUTE format('
+                CREATE TRIGGER log_partition_delete
+                AFTER DELETE ON %s
+                REFERENCING OLD TABLE AS changed_row
+                FOR EACH STATEMENT EXECUTE FUNCTION log_partition_change()
+            ', tracked_table);
+            EXECUTE format('
+                CREATE TRIGGER log_partition_truncate
+                AFTER TRUNCATE ON %s
+                FOR EACH STATEMENT EXECUTE FUNCTION log_partition_truncate()
+            ', tracked_table);
+        END;
+    $$ LANGUAGE plpgsql;
+
+
+    -- 3. Track all tables that are read by ABSA cache tables
+    SELECT track_partition_changes('absa.post_aspect');
+    SELECT track_partition_changes('absa.post_ngram');
+    SELECT track_partition_changes('absa.post_phrase_polarity');
+    SELECT track_partition_changes('absa.post_phrase_aspect_polarity');
+    SELECT track_partition_changes(
+        'absa.post_phrase_aspect_polarity_linear_distance');
+
+COMMIT;
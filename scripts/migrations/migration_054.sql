@@ -0,0 +1,41 @@
+/** Per-table processing watermarks for posts
+  * Replace the max(post_date) probe of the ABSA collectors with an explicit
+    record of all posts that have been processed into a derived table.
+  * A post is claimed (processed_at IS NULL) when a task starts to process it
+    and confirmed once its results have been stored.
+  */
+
+BEGIN;
+
+    CREATE TABLE pipeline_watermark (
+        table_name TEXT,
+        source TEXT,
+        post_id TEXT,
+        claimed_at TIMESTAMP NOT NULL DEFAULT now(),
+        processed_at TIMESTAMP,
+        PRIMARY KEY (table_name, source, post_id)
+    );
+    CREATE INDEX pipeline_watermark_pending_idx
+        ON pipeline_watermark (table_name)
+        WHERE processed_at IS NULL;
+
+    -- Preserve the state of the old probe for all existing derived tables
+    INSERT INTO pipeline_watermark (table_name, source, post_id, processed_at)
+        SELECT derived_table.table_name, source, post_id, now()
+        FROM (VALUES
+            ('absa.post_word', (
+                SELECT max(post_date)
+                FROM absa.post_word NATURAL JOIN post
+            )),
+            ('absa.post_ngram', (
+                SELECT max(post_date)
+                FROM absa.post_ngram NATURAL JOIN post
+            )),
+            ('absa.post_aspect', (
+                SELECT max(post_date)
+                FROM absa.post_aspect NATURAL JOIN post
+            ))
+        ) AS derived_table(table_name, max_post_date)
+            JOIN post ON post_date <= max_post_date;
+
+COMMIT;
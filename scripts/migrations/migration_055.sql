@@ -0,0 +1,61 @@
+/** Materialize post view
+  * The post view unions all review and social media tables and is scanned
+    by every topic modeling and ABSA stage. Store its contents in an indexed
+    table instead and keep the old definition as post_view.
+  * The post table is kept in sync by the CsvToDb tasks of all underlying
+    tables (see CsvToDb.post_sources). If you modify any of these tables
+    manually or in a later migration, don't forget to call refresh_post()!
+  */
+
+BEGIN;
+
+    -- 1. Keep old view for refreshing and consistency checks
+    ALTER VIEW post RENAME TO post_view;
+
+
+    -- 2. Create materialized post table
+    CREATE TABLE post AS
+        SELECT * FROM post_view;
+    ALTER TABLE post
+        ADD PRIMARY KEY (source, post_id);
+    CREATE INDEX post_post_date_idx
+        ON post (post_date);
+
+
+    -- 3. Create refresh function
+    -- Synchronize all posts of the given sources (all sources if NULL)
+    CREATE FUNCTION refresh_post(post_sources TEXT[] DEFAULT NULL)
+    RETURNS void AS $$
+        BEGIN
+            DELETE FROM post
+            WHERE (post_sources IS NULL OR source = ANY(post_sources))
+                AND NOT EXISTS (
+                    SELECT *
+                    FROM post_view
+                    WHERE (post_sources IS NULL
+                            OR post_view.source = ANY(post_sources))
+                        AND (post_view.source, post_view.post_id)
+                        = (post.source, post.post_id)
+                );
+
+            INSERT INTO post
+                SELECT *
+                FROM post_view
+                WHERE post_sources IS NULL OR source = ANY(post_sources)
+            ON CONFLICT (source, post_id) DO UPDATE
+                SET context = EXCLUDED.context,
+                    text = EXCLUDED.text,
+                    post_date = EXCLUDED.post_date,
+                    rating = EXCLUDED.rating,
+                    is_from_museum = EXCLUDED.is_from_museum,
+                    is_response = EXCLUDED.is_response,
+                    likes = EXCLUDED.likes,
+                    comments = EXCLUDED.comments,
+                    shares = EXCLUDED.shares,
+                    permalink = EXCLUDED.permalink
+                -- Don't touch unchanged posts
+                WHERE (post.*) IS DISTINCT FROM (EXCLUDED.*);
+        END;
+    $$ LANGUAGE plpgsql;
+
+COMMIT;
@@ -0,0 +1,15 @@
+-- ABSA: Drop intermediate linear distance relation
+
+BEGIN;
+
+    -- Linear distances are now computed in CollectPostAspectSentimentsLinearDistance
+    DROP TABLE absa.post_phrase_aspect_polarity_linear_distance;
+
+    DELETE FROM cache_watermark
+    WHERE cache_table IN (
+        'absa.post_phrase_aspect_polarity_linear_distance',
+        'absa.post_aspect_sentiment_linear_distance_limit',
+        'absa.post_aspect_sentiment_linear_distance_weight'
+    );
+
+COMMIT;
@@ -0,0 +1,16 @@
+/** Cache detected languages of posts for the topic modeling (see
+    src/topic_modeling/languages.py)
+  * text_hash identifies changed posts which have to be detected again.
+  */
+
+BEGIN;
+
+    CREATE TABLE topic_modeling.post_language (
+        source TEXT,
+        post_id TEXT,
+        text_hash TEXT NOT NULL,
+        language TEXT,
+        PRIMARY KEY (source, post_id)
+    );
+
+COMMIT;
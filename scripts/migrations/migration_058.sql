@@ -0,0 +1,42 @@
+/** Incremental topic modeling
+  * Remember the corpus hash of every topic model so that only models with
+    changed input need to be retrained.
+  * Results are replaced per model, so ids are no longer assigned by the
+    pipeline but generated by the database.
+  */
+
+BEGIN;
+
+    CREATE TABLE topic_modeling.model (
+        model_name TEXT PRIMARY KEY,
+        corpus_hash TEXT NOT NULL
+    );
+
+
+    CREATE SEQUENCE topic_modeling.topic_text_id_seq
+        OWNED BY topic_modeling.topic_text.id;
+    SELECT setval(
+        'topic_modeling.topic_text_id_seq',
+        coalesce(max(id), 0) + 1,
+        false
+    ) FROM topic_modeling.topic_text;
+    ALTER TABLE topic_modeling.topic_text
+        ALTER COLUMN id
+        SET DEFAULT nextval('topic_modeling.topic_text_id_seq');
+    CREATE INDEX topic_text_model_name_idx
+        ON topic_modeling.topic_text (model_name);
+
+    CREATE SEQUENCE topic_modeling.topic_id_seq
+        OWNED BY topic_modeling.topic.id;
+    SELECT setval(
+        'topic_modeling.topic_id_seq',
+        coalesce(max(id), 0) + 1,
+        false
+    ) FROM topic_modeling.topic;
+    ALTER TABLE topic_modeling.topic
+        ALTER COLUMN id
+        SET DEFAULT nextval('topic_modeling.topic_id_seq');
+    CREATE INDEX topic_model_idx
+        ON topic_modeling.topic (model);
+
+COMMIT;
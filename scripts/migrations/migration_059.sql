@@ -0,0 +1,18 @@
+/** Incremental Facebook comments
+  * Remember the number of comments and the time of the latest comment of
+    every post so that only posts with changed comments need to be fetched.
+  */
+
+BEGIN;
+
+    CREATE TABLE fb_post_comment_summary (
+        page_id TEXT,
+        post_id TEXT,
+        PRIMARY KEY (page_id, post_id),
+        comment_count INT,
+        last_comment_time TIMESTAMP,
+
+        FOREIGN KEY (page_id, post_id) REFERENCES fb_post
+    );
+
+COMMIT;
@@ -0,0 +1,12 @@
+/** Incremental Google Play reviews
+  * Remember the language that every review has been fetched for so that
+    only reviews newer than the latest known review of each language need
+    to be fetched.
+  */
+
+BEGIN;
+
+    ALTER TABLE gplay_review
+        ADD COLUMN language TEXT;
+
+COMMIT;
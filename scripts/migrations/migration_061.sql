@@ -0,0 +1,72 @@
+/** Keep post table in sync by triggers
+  * Until now, the post table was only refreshed by the CsvToDb tasks of the
+    underlying tables, so posts written by any other means (manual fixes,
+    tests, later migrations) were missing from it.
+  * Refresh the affected sources after every statement that modifies one of
+    the underlying tables instead. If you add another table to post_view,
+    don't forget to create a trigger for it as well!
+  */
+
+BEGIN;
+
+    -- 1. Create trigger function
+    -- The sources to refresh are passed as trigger arguments
+    CREATE FUNCTION refresh_post_trigger()
+    RETURNS trigger AS $$
+        BEGIN
+            PERFORM refresh_post(TG_ARGV);
+            RETURN NULL;
+        END;
+    $$ LANGUAGE plpgsql;
+
+
+    -- 2. Create triggers for all tables underlying post_view
+    CREATE TRIGGER appstore_review_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON appstore_review
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Apple Appstore');
+    CREATE TRIGGER gplay_review_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON gplay_review
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Google Play');
+    CREATE TRIGGER google_maps_review_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON google_maps_review
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Google Maps');
+
+    CREATE TRIGGER fb_post_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON fb_post
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Facebook Post');
+    CREATE TRIGGER fb_post_performance_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON fb_post_performance
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Facebook Post');
+    CREATE TRIGGER fb_post_comment_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON fb_post_comment
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Facebook Comment');
+
+    CREATE TRIGGER ig_post_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON ig_post
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Instagram');
+    CREATE TRIGGER ig_post_performance_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON ig_post_performance
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Instagram');
+
+    CREATE TRIGGER tweet_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tweet
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Twitter');
+    CREATE TRIGGER tweet_performance_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tweet_performance
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Twitter');
+    CREATE TRIGGER tweet_author_refresh_post
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tweet_author
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION refresh_post_trigger('Twitter');
+
+COMMIT;
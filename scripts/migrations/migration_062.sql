@@ -0,0 +1,152 @@
+/** Refresh only changed posts
+  * The triggers of migration 061 refreshed all posts of a source after every
+    statement, which is expensive for the frequent loads of performance
+    values. Collect the IDs of the affected posts from the transition tables
+    instead and only refresh these posts. After a TRUNCATE, all posts of the
+    source are still refreshed.
+  * If you add another table to post_view, install the triggers for it using
+    sync_post() as well!
+  */
+
+BEGIN;
+
+    -- 1. Drop old triggers
+    DROP TRIGGER appstore_review_refresh_post ON appstore_review;
+    DROP TRIGGER gplay_review_refresh_post ON gplay_review;
+    DROP TRIGGER google_maps_review_refresh_post ON google_maps_review;
+    DROP TRIGGER fb_post_refresh_post ON fb_post;
+    DROP TRIGGER fb_post_performance_refresh_post ON fb_post_performance;
+    DROP TRIGGER fb_post_comment_refresh_post ON fb_post_comment;
+    DROP TRIGGER ig_post_refresh_post ON ig_post;
+    DROP TRIGGER ig_post_performance_refresh_post ON ig_post_performance;
+    DROP TRIGGER tweet_refresh_post ON tweet;
+    DROP TRIGGER tweet_performance_refresh_post ON tweet_performance;
+    DROP TRIGGER tweet_author_refresh_post ON tweet_author;
+
+
+    -- 2. Create refresh functions
+    -- Synchronize the given posts of a single source
+    CREATE FUNCTION refresh_post_ids(post_source TEXT, post_ids TEXT[])
+    RETURNS void AS $$
+        BEGIN
+            DELETE FROM post
+            WHERE source = post_source AND post_id = ANY(post_ids)
+                AND NOT EXISTS (
+                    SELECT *
+                    FROM post_view
+                    WHERE post_view.source = post_source
+                        AND post_view.post_id = post.post_id
+                );
+
+            INSERT INTO post
+                SELECT *
+                FROM post_view
+                WHERE source = post_source AND post_id = ANY(post_ids)
+            ON CONFLICT (source, post_id) DO UPDATE
+                SET context = EXCLUDED.context,
+                    text = EXCLUDED.text,
+                    post_date = EXCLUDED.post_date,
+                    rating = EXCLUDED.rating,
+                    is_from_museum = EXCLUDED.is_from_museum,
+                    is_response = EXCLUDED.is_response,
+                    likes = EXCLUDED.likes,
+                    comments = EXCLUDED.comments,
+                    shares = EXCLUDED.shares,
+                    permalink = EXCLUDED.permalink
+                -- Don't touch unchanged posts
+                WHERE (post.*) IS DISTINCT FROM (EXCLUDED.*);
+        END;
+    $$ LANGUAGE plpgsql;
+
+    -- Arguments: the source and a query template that selects the IDs of
+    -- all affected posts from the transition table (%1$s)
+    CREATE FUNCTION refresh_changed_post_trigger()
+    RETURNS trigger AS $$
+        DECLARE
+            post_ids TEXT[];
+        BEGIN
+            EXECUTE format(
+                'SELECT array_agg(DISTINCT post_id) FROM (%s) AS post(post_id)',
+                CASE TG_OP
+                    WHEN 'INSERT' THEN format(TG_ARGV[1], 'new_row')
+                    WHEN 'DELETE' THEN format(TG_ARGV[1], 'old_row')
+                    -- The IDs of updated rows might have changed
+                    ELSE format(TG_ARGV[1], 'old_row')
+                        || ' UNION ' || format(TG_ARGV[1], 'new_row')
+                END
+            ) INTO post_ids;
+            IF post_ids IS NOT NULL THEN
+                PERFORM refresh_post_ids(TG_ARGV[0], post_ids);
+            END IF;
+            RETURN NULL;
+        END;
+    $$ LANGUAGE plpgsql;
+
+    -- Install all triggers required to keep the post table in sync with the
+    -- given table
+    CREATE FUNCTION sync_post(
+        synced_table regclass,
+        post_source TEXT,
+        post_id_query TEXT)
+    RETURNS void AS $$
+        BEGIN
+            EXECUTE format('
+                CREATE TRIGGER refresh_post_insert
+                AFTER INSERT ON %s
+                REFERENCING NEW TABLE AS new_row
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION refresh_changed_post_trigger(%L, %L)
+            ', synced_table, post_source, post_id_query);
+            EXECUTE format('
+                CREATE TRIGGER refresh_post_update
+                AFTER UPDATE ON %s
+                REFERENCING OLD TABLE AS old_row NEW TABLE AS new_row
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION refresh_changed_post_trigger(%L, %L)
+            ', synced_table, post_source, post_id_query);
+            EXECUTE format('
+                CREATE TRIGGER refresh_post_delete
+                AFTER DELETE ON %s
+                REFERENCING OLD TABLE AS old_row
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION refresh_changed_post_trigger(%L, %L)
+            ', synced_table, post_source, post_id_query);
+            EXECUTE format('
+                CREATE TRIGGER refresh_post_truncate
+                AFTER TRUNCATE ON %s
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION refresh_post_trigger(%L)
+            ', synced_table, post_source);
+        END;
+    $$ LANGUAGE plpgsql;
+
+
+    -- 3. Install triggers for all tables underlying post_view
+    SELECT sync_post('appstore_review', 'Apple Appstore',
+        'SELECT appstore_review_id FROM %1$s');
+    SELECT sync_post('gplay_review', 'Google Play',
+        'SELECT playstore_review_id FROM %1$s');
+    SELECT sync_post('google_maps_review', 'Google Maps',
+        'SELECT google_maps_review_id FROM %1$s');
+
+    SELECT sync_post('fb_post', 'Facebook Post',
+        'SELECT fb_post_id FROM %1$s');
+    SELECT sync_post('fb_post_performance', 'Facebook Post',
+        'SELECT page_id || ''_'' || post_id FROM %1$s');
+    SELECT sync_post('fb_post_comment', 'Facebook Comment',
+        'SELECT fb_post_comment_id FROM %1$s');
+
+    SELECT sync_post('ig_post', 'Instagram',
+        'SELECT ig_post_id FROM %1$s');
+    SELECT sync_post('ig_post_performance', 'Instagram',
+        'SELECT ig_post_id FROM %1$s');
+
+    SELECT sync_post('tweet', 'Twitter',
+        'SELECT tweet_id FROM %1$s');
+    SELECT sync_post('tweet_performance', 'Twitter',
+        'SELECT tweet_id FROM %1$s');
+    SELECT sync_post('tweet_author', 'Twitter',
+        'SELECT tweet_id FROM tweet WHERE user_id IN '
+        '(SELECT user_id FROM %1$s)');
+
+COMMIT;
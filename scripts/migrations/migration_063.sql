@@ -0,0 +1,16 @@
+/** Record full syncs of incrementally fetched data
+  * Fetch tasks used to fetch all data when the ordinal of the current day
+    was divisible by their full_sync_interval, so skipped runs also skipped
+    the full sync. Record the time of the last full sync instead and repeat
+    it once it is older than the interval (see _utils/full_sync.py).
+  */
+
+BEGIN;
+
+    CREATE TABLE full_sync (
+        -- task family, optionally followed by a part such as a store front
+        sync_key TEXT PRIMARY KEY,
+        synced_at TIMESTAMP NOT NULL
+    );
+
+COMMIT;
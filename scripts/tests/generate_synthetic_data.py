@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Generate a database with synthetic data for profiling the pipeline.
+
+The database is created from the migrations and filled with referentially
+consistent random data for all posts, performance values, gomus data and ABSA
+lexica. Row counts approximate the production database and are multiplied
+with the given scale factor (lexica are not scaled). The structure of every
+table (columns, keys, and foreign keys) is read from the database itself, so
+new columns will be populated automatically. If you add a constraint that
+cannot be satisfied by random values, add an override below.
+
+Usage example:
+    scripts/tests/generate_synthetic_data.py --scale 10
+"""
+
+import argparse
+import datetime as dt
+import io
+import os
+import subprocess as sp
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from _utils import db_connector, logger
+
+
+# Approximate row counts in production (scale 1)
+TABLE_SIZES = {
+    'fb_post': 1_000,
+    'fb_post_performance': 20_000,
+    'fb_post_comment': 5_000,
+    'ig_post': 800,
+    'ig_post_performance': 15_000,
+    'tweet_author': 10,
+    'tweet': 5_000,
+    'tweet_performance': 30_000,
+    'google_maps_review': 3_000,
+    'appstore_review': 300,
+    'gplay_review': 1_000,
+
+    'gomus_customer': 50_000,
+    'gomus_to_customer_mapping': 60_000,
+    'gomus_order': 60_000,
+    'gomus_order_contains': 120_000,
+    'gomus_booking': 10_000,
+    'gomus_quota': 50,
+    'gomus_capacity': 50_000,
+    'gomus_daily_entry': 20_000,
+    'gomus_expected_daily_entry': 20_000,
+}
+
+# Lexica are independent of the amount of crawled data
+LEXICON_SIZES = {
+    'absa.stopword': 600,
+    'absa.phrase_polarity_sentiws': 3_500,
+    'absa.phrase_polarity_sepl': 14_000,
+    'absa.target_aspect': 50,
+    'absa.target_aspect_word': 200,
+}
+
+"""Columns that are no foreign keys but must be consistent anyway."""
+SOFT_REFERENCES = {
+    ('tweet', 'user_id'): ('tweet_author', 'user_id'),
+}
+
+MIN_DATE = np.datetime64('2016-01-01')
+MAX_DATE = np.datetime64('2021-01-01')
+
+VOCABULARY_SIZE = 20_000
+SYLLABLES = [
+    consonant + vowel
+    for consonant in 'bdfghklmnprstwz'
+    for vowel in ['a', 'e', 'i', 'o', 'u', 'au', 'ei', 'ie']
+]
+
+
+class SyntheticDataGenerator:
+
+    def __init__(self, connector, scale: float, seed: int):
+
+        self.db_connector = connector
+        self.scale = scale
+        self.random = np.random.default_rng(seed)
+        self.vocabulary = self.generate_vocabulary()
+        # Zipf-like word frequencies
+        self.word_weights = 1 / np.arange(1, len(self.vocabulary) + 1)
+        self.word_weights /= self.word_weights.sum()
+
+        # Generated values of all columns that are referenced by other tables
+        self.keys: Dict[str, pd.DataFrame] = {}
+
+        self.column_overrides: Dict[str, Callable[[int], object]] = {
+            'rating': lambda n: self.random.integers(1, 6, n),
+            'weight': lambda n: np.round(self.random.uniform(-1, 1, n), 4),
+            'permalink': lambda n: [
+                f'https://example.com/{value}'
+                for value in self.random.integers(0, 10 ** 9, n)],
+            'text': self.generate_texts,
+            'title': lambda n: self.generate_texts(n, max_words=6),
+        }
+        self.table_overrides: Dict[str, Dict[str, Callable]] = {
+            'appstore_review': {'app_id': lambda n: '1150432552'},
+            'gplay_review': {
+                'app_id': lambda n: 'com.barberini.museum.barberinidigital'},
+            'google_maps_review': {
+                'place_id': lambda n: 'ChIJyV9mg0lfqEcRnbhJji6c17E'},
+            # Lexica should match the words in the posts
+            'absa.stopword': {'word': self.take_vocabulary},
+            'absa.phrase_polarity_sentiws': {
+                'word': self.take_vocabulary,
+                'weight': lambda n: np.round(
+                    self.random.choice([-1, 1], n)
+                    * self.random.uniform(0.01, 1, n), 4)},
+            'absa.phrase_polarity_sepl': {'phrase': self.take_vocabulary},
+            # Aspects should not be stopwords
+            'absa.target_aspect_word': {'word': lambda n: self.take_vocabulary(
+                n, offset=LEXICON_SIZES['absa.stopword'])},
+        }
+        self.row_overrides: Dict[str, Callable[[pd.DataFrame], None]] = {
+            'gomus_capacity': self.fix_capacities,
+        }
+
+    def generate(self, tables: Iterable[str] = None):
+        """
+        Fill the given tables (all tables by default) with synthetic data.
+
+        References to tables that are not generated are left empty.
+        """
+        sizes = {
+            **{
+                table: max(1, int(size * self.scale))
+                for table, size in TABLE_SIZES.items()
+            },
+            **LEXICON_SIZES
+        }
+        if tables is not None:
+            sizes = {
+                table: size
+                for table, size in sizes.items()
+                if table in tables
+            }
+        schemas = {table: self.read_schema(table) for table in sizes}
+
+        for table in self.sort_tables(schemas):
+            logger.info(f"Generating {sizes[table]} rows for {table} ...")
+            df = self.generate_table(table, schemas[table], sizes[table])
+            self.copy_df(table, df)
+            self.store_keys(table, df, schemas)
+
+        self.db_connector.execute(*(
+            f'''
+                SELECT setval(
+                    pg_get_serial_sequence('{table}', '{column}'),
+                    (SELECT max({column}) FROM {table}))
+            '''
+            for table, schema in schemas.items()
+            for column, _type, default in schema['columns']
+            if column in self.keys.get(table, {})
+            and str(default).startswith('nextval(')
+        ))
+
+    def read_schema(self, table: str) -> Dict:
+
+        schema, name = table.split('.') if '.' in table else ('public', table)
+        columns = self.db_connector.query(f'''
+            SELECT column_name, data_type, column_default
+            FROM information_schema.columns
+            WHERE (table_schema, table_name) = ('{schema}', '{name}')
+                AND is_generated = 'NEVER'
+            ORDER BY ordinal_position
+        ''')
+        constraints = self.db_connector.query(f'''
+            SELECT
+                contype,
+                ARRAY(
+                    SELECT attname
+                    FROM unnest(conkey) WITH ORDINALITY AS k(attnum, i)
+                        JOIN pg_attribute
+                        ON (attrelid, pg_attribute.attnum)
+                            = (conrelid, k.attnum)
+                    ORDER BY i
+                )::text[],
+                confrelid::regclass::text,
+                ARRAY(
+                    SELECT attname
+                    FROM unnest(confkey) WITH ORDINALITY AS k(attnum, i)
+                        JOIN pg_attribute
+                        ON (attrelid, pg_attribute.attnum)
+                            = (confrelid, k.attnum)
+                    ORDER BY i
+                )::text[]
+            FROM pg_constraint
+            WHERE conrelid = '{table}'::regclass
+                AND contype IN ('p', 'u', 'f')
+        ''')
+        foreign_keys = [
+            (columns, ref_table, ref_columns)
+            for contype, columns, ref_table, ref_columns in constraints
+            if contype == 'f'
+        ] + [
+            ([column], ref_table, [ref_column])
+            for (soft_table, column), (ref_table, ref_column)
+            in SOFT_REFERENCES.items()
+            if soft_table == table
+        ]
+        return dict(
+            columns=columns,
+            unique_keys=[
+                columns
+                for contype, columns, _ref_table, _ref_columns in constraints
+                if contype in ('p', 'u')
+            ],
+            foreign_keys=foreign_keys)
+
+    def sort_tables(self, schemas: Dict[str, Dict]) -> List[str]:
+        """Sort the tables so that all referenced tables come first."""
+        ordered = []
+
+        def visit(table, path=()):
+            if table in ordered:
+                return
+            if table in path:
+                raise ValueError(f"Cyclic references: {path}")
+            for _columns, ref_table, _ref_columns \
+                    in schemas[table]['foreign_keys']:
+                if ref_table in schemas and ref_table != table:
+                    visit(ref_table, (*path, table))
+            ordered.append(table)
+
+        for table in schemas:
+            visit(table)
+        return ordered
+
+    def generate_table(self, table: str, schema: Dict, size: int):
+
+        foreign_keys = [
+            (columns, ref_table, ref_columns)
+            for columns, ref_table, ref_columns in schema['foreign_keys']
+            if ref_table in self.keys
+        ]
+        key_columns = {
+            column
+            for columns in schema['unique_keys']
+            for column in columns
+        }
+        # Leave self references and references to other tables empty
+        unresolved_columns = {
+            column
+            for columns, ref_table, _ref_columns in schema['foreign_keys']
+            if ref_table not in self.keys
+            for column in columns
+        }
+
+        # Distribute rows evenly across the parents of the first foreign key
+        # that is part of a unique key, e.g. for performance time series
+        index = np.arange(size)
+        rounds = index
+        driving_key = next(
+            (
+                foreign_key for foreign_key in foreign_keys
+                if set(foreign_key[0]) <= key_columns
+            ),
+            None)
+
+        df = pd.DataFrame(index=index)
+        for foreign_key in foreign_keys:
+            columns, ref_table, ref_columns = foreign_key
+            parents = self.keys[ref_table][ref_columns]
+            if foreign_key is driving_key:
+                parent_index = index % len(parents)
+                rounds = index // len(parents)
+            else:
+                parent_index = self.random.integers(0, len(parents), size)
+            for column, ref_column in zip(columns, ref_columns):
+                df[column] = parents[ref_column].values[parent_index]
+
+        overrides = self.table_overrides.get(table, {})
+        for column, data_type, default in schema['columns']:
+            if column in df:
+                continue
+            if column in overrides:
+                df[column] = overrides[column](size)
+            elif column in unresolved_columns:
+                df[column] = None
+            elif column in key_columns:
+                df[column] = self.generate_unique(data_type, column, rounds)
+            elif default is not None:
+                continue
+            elif column in self.column_overrides:
+                df[column] = self.column_overrides[column](size)
+            else:
+                df[column] = self.generate_values(data_type, column, size)
+
+        if table in self.row_overrides:
+            self.row_overrides[table](df)
+
+        for columns in schema['unique_keys']:
+            # Generated columns are derived from the others
+            df.drop_duplicates(
+                subset=[column for column in columns if column in df],
+                inplace=True)
+        return df
+
+    def generate_unique(self, data_type: str, column: str, rounds):
+
+        if data_type in ('integer', 'bigint', 'smallint', 'numeric'):
+            return rounds + 1
+        if data_type == 'date':
+            return MIN_DATE + rounds.astype('timedelta64[D]')
+        if data_type.startswith('timestamp'):
+            return MIN_DATE + rounds.astype('timedelta64[D]') \
+                + np.timedelta64(12, 'h')
+        if data_type.startswith('time'):
+            return pd.to_timedelta((rounds * 15) % (24 * 60), unit='min') \
+                .map(self.format_time)
+        return [f'{column}{value}' for value in rounds]
+
+    def generate_values(self, data_type: str, column: str, size: int):
+
+        if data_type in ('integer', 'bigint', 'smallint'):
+            return self.random.integers(0, 1000, size)
+        if data_type in ('real', 'double precision', 'numeric'):
+            return np.round(self.random.uniform(0, 100, size), 2)
+        if data_type == 'boolean':
+            return self.random.random(size) < 0.5
+        if data_type == 'date':
+            return self.random_dates(size).astype('datetime64[D]')
+        if data_type.startswith('timestamp'):
+            return self.random_dates(size)
+        if data_type.startswith('time'):
+            return pd.to_timedelta(
+                self.random.integers(0, 24 * 60 * 60, size), unit='s'
+            ).map(self.format_time)
+        if data_type == 'ARRAY':
+            return '{}'
+        if data_type in ('text', 'character varying'):
+            return [
+                f'{column}_{value}'
+                for value in self.random.integers(0, 100, size)]
+        return None
+
+    def random_dates(self, size: int):
+
+        seconds = (MAX_DATE - MIN_DATE) // np.timedelta64(1, 's')
+        return MIN_DATE + self.random.integers(0, seconds, size) \
+            .astype('timedelta64[s]')
+
+    def generate_vocabulary(self) -> List[str]:
+
+        words = set()
+        while len(words) < VOCABULARY_SIZE:
+            length = self.random.integers(1, 5)
+            words.add(''.join(self.random.choice(SYLLABLES, length)))
+        return sorted(words, key=len)
+
+    def generate_texts(self, size: int, max_words: int = 60) -> List[str]:
+
+        lengths = self.random.integers(1, max_words + 1, size)
+        words = self.random.choice(
+            self.vocabulary, lengths.sum(), p=self.word_weights)
+        sentence_ends = self.random.random(lengths.sum()) < 0.1
+        tokens = np.where(sentence_ends, np.char.add(words, '.'), words)
+        bounds = np.cumsum(lengths)
+        return [
+            ' '.join(tokens[end - length:end])
+            for end, length in zip(bounds, lengths)
+        ]
+
+    def take_vocabulary(self, size: int, offset: int = 0) -> List[str]:
+
+        return self.vocabulary[offset:offset + size]
+
+    def fix_capacities(self, df: pd.DataFrame):
+
+        df['max'] = self.random.integers(0, 100, len(df))
+        df['sold'] = (df['max'] * self.random.random(len(df))).astype(int)
+        df['reserved'] = ((df['max'] - df['sold'])
+                          * self.random.random(len(df))).astype(int)
+        df['available'] = df['max'] - df['sold'] - df['reserved']
+
+    def store_keys(self, table: str, df: pd.DataFrame, schemas: Dict):
+
+        referenced_columns = {
+            ref_column
+            for schema in schemas.values()
+            for _columns, ref_table, ref_columns in schema['foreign_keys']
+            if ref_table == table
+            for ref_column in ref_columns
+        }
+        if referenced_columns:
+            self.keys[table] = df[sorted(referenced_columns)] \
+                .reset_index(drop=True)
+
+    def copy_df(self, table: str, df: pd.DataFrame):
+
+        connection = psycopg2.connect(
+            host=self.db_connector.host,
+            database=self.db_connector.database,
+            user=self.db_connector.user,
+            password=self.db_connector.password)
+        try:
+            with connection, connection.cursor() as cursor:
+                for start in range(0, len(df), 100_000):
+                    csv = io.StringIO()
+                    df.iloc[start:start + 100_000].to_csv(
+                        csv, index=False, header=False)
+                    csv.seek(0)
+                    cursor.copy_expert(
+                        f'''
+                            COPY {table} ({", ".join(df.columns)})
+                            FROM STDIN WITH (FORMAT CSV)
+                        ''',
+                        csv)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def format_time(delta: pd.Timedelta) -> str:
+
+        return str(dt.timedelta(seconds=delta.total_seconds()))
+
+
+def create_database(database: str):
+    """Create a new database and apply all migrations."""
+    connection = psycopg2.connect(
+        host=os.environ['POSTGRES_HOST'],
+        user=os.environ['POSTGRES_USER'],
+        password=os.environ['POSTGRES_PASSWORD'],
+        database='postgres')
+    try:
+        connection.autocommit = True  # required for meta queries
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {database}')
+            cursor.execute(f'CREATE DATABASE {database}')
+    finally:
+        connection.close()
+
+    sp.run(
+        './scripts/migrations/migrate.sh',
+        check=True,
+        env=dict(os.environ, POSTGRES_DB=database))
+
+
+def main():  # noqa: D103
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--scale', type=float, default=1,
+        help="Factor for the amount of data compared to production")
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help="Seed for the random generator")
+    parser.add_argument(
+        '--database', default='barberini_test_synthetic',
+        help="Name of the database to be (re)created")
+    parser.add_argument(
+        '--no-create', dest='create', action='store_false',
+        help="Fill an existing (migrated and empty) database")
+    args = parser.parse_args()
+
+    if args.create:
+        create_database(args.database)
+    generator = SyntheticDataGenerator(
+        db_connector(args.database), args.scale, args.seed)
+    generator.generate()
+    logger.info(f"Database {args.database} has been filled.")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,8 @@
 import luigi
 
 from apple_appstore import AppstoreReviewsToDb
-from facebook import FbPostsToDb, FbPostCommentsToDb, FbPostPerformanceToDb
+from facebook import FbPostsToDb, FbPostCommentsToDb, \
+    FbPostCommentSummariesToDb, FbPostPerformanceToDb
 from google_maps import GoogleMapsReviewsToDb
 from gplay import GooglePlaystoreReviewsToDb
 from instagram import IgToDb, IgPostPerformanceToDb
@@ -23,6 +24,7 @@ class PostsToDb(luigi.WrapperTask):
         yield AppstoreReviewsToDb()
         yield FbPostsToDb()
         yield FbPostCommentsToDb()
+        yield FbPostCommentSummariesToDb()
         yield GoogleMapsReviewsToDb()
         yield GooglePlaystoreReviewsToDb()
         yield IgToDb()
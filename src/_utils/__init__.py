@@ -18,12 +18,26 @@ def output_dir() -> str:
     return os.environ['OUTPUT_DIR']
 
 
-from .utils import ObjectParameter, StreamToLogger             # noqa: E402
+def cache_dir() -> str:
+    """
+    Answer the path to the root of the cache directory for all tasks.
+
+    Unlike the output directory, the cache directory is kept between runs.
+    """
+    return os.getenv('CACHE_DIR', 'cache')
+
+
+from .utils import (                                            # noqa: E402
+    ObjectParameter, StreamToLogger, parallel_map)
 from .data_preparation import ConcatCsvs, DataPreparationTask  # noqa: E402
 from ._database import DbConnector                             # noqa: E402
 from .database import CsvToDb, QueryDb, QueryCacheToDb         # noqa: E402
+from .full_sync import FullSyncTask                            # noqa: E402
 from .json_converters import JsonToCsv, JsoncToJson            # noqa: E402
 from .museum_facts import MuseumFacts                          # noqa: E402
+from .pipeline_watermark import (                              # noqa: E402
+    ClaimPosts,
+    claim_posts_query, pending_posts_query, unprocessed_posts_query)
 
 # Backwards compatibility
 from ._database import db_connector                            # noqa: E402
@@ -31,11 +45,13 @@ from ._database import db_connector                            # noqa: E402
 
 
 __all__ = [
-    DataPreparationTask,
+    DataPreparationTask, FullSyncTask,
     ConcatCsvs, CsvToDb, DbConnector, QueryCacheToDb, QueryDb,
     JsonToCsv, JsoncToJson,
-    MuseumFacts,
+    ClaimPosts, MuseumFacts,
     ObjectParameter, StreamToLogger,
 
-    db_connector, minimal_mode, output_dir
+    claim_posts_query, pending_posts_query, unprocessed_posts_query,
+
+    cache_dir, db_connector, minimal_mode, output_dir, parallel_map
 ]
@@ -10,6 +10,7 @@ import pandas as pd
 from psycopg2.errors import UndefinedTable
 
 import _utils
+from .pipeline_watermark import confirm_posts_query
 
 logger = _utils.logger
 
@@ -98,6 +99,23 @@ class CsvToDb(CopyToTable):
     """
     replace_content = False
 
+    def claim_posts(self):
+        """
+        Answer the task that claims the posts processed into the table.
+
+        If a ClaimPosts task is answered, it is required in addition to
+        requires(), and all posts listed in its output will be marked as
+        processed after copying the new values (see pipeline_watermark).
+        """
+        return None
+
+    def _requires(self):
+
+        return luigi.task.flatten([
+            super()._requires(),
+            self.claim_posts()
+        ])
+
     @property
     def columns(self):
 
@@ -153,6 +171,15 @@ class CsvToDb(CopyToTable):
         logger.debug(f"{self.__class__}: Executing query: {query}")
         cursor.copy_expert(query, file)
 
+        claim = self.claim_posts()
+        if claim:
+            with claim.output().open('r') as claim_file:
+                posts = pd.read_csv(
+                    claim_file, dtype=str, keep_default_na=False)
+            cursor.execute(
+                confirm_posts_query(self.table),
+                (posts['source'].tolist(), posts['post_id'].tolist()))
+
     def create_table(self):
         """Overridden from superclass to forbid dynamical schema changes."""
         raise Exception(
@@ -288,22 +315,168 @@ class QueryCacheToDb(QueryDb):
 
     This task is optimized. The query results won't leave the DBMS at any
     point during updating the cache table.
+
+    Subclasses can enable incremental maintenance by declaring a
+    partition_key and all upstream_tables the query reads from. Changes to
+    these tables are logged by triggers (see track_partition_changes() in
+    migration 053), so only partitions that have been changed since the last
+    refresh need to be recomputed. Upstream tables must be tracked and have
+    to be specified including their schema name. To avoid reading unchanged
+    partitions at all, the query should restrict every scan of an upstream
+    table using changed_partition_filter().
     """
 
+    full_rebuild = luigi.BoolParameter(
+        default=False,
+        description="If True, the whole cache table will be recomputed even "
+                    "if incremental maintenance is supported")
+
+    """
+    The columns of the cache table that correspond to the (source, post_id)
+    key of the change log. If None, the whole cache table will be recomputed
+    on every run.
+    """
+    partition_key = None
+
+    """The tracked tables the cache query depends on."""
+    upstream_tables = []
+
+    change_table = 'cache_partition_change'
+    watermark_table = 'cache_watermark'
+
+    incremental = False
+
     def run(self):
 
         assert not self.args or not self.kwargs, \
             "cannot combine args and kwargs"
         all_args = next(filter(bool, [self.args, self.kwargs]), None)
 
+        if self.partition_key:
+            # Only respect the changes that exist before the refresh starts
+            self.last_change_id, = self.db_connector.query(
+                f'SELECT coalesce(max(change_id), 0) FROM {self.change_table}',
+                only_first=True)
+            self.incremental = self.is_incremental()
+
         query = self.build_query()
-        self.db_connector.execute(
-            f'TRUNCATE TABLE {self.table}',
-            (f'INSERT INTO {self.table} {query}', all_args)
-        )
+        if self.incremental:
+            logger.info(f"Refreshing changed partitions of {self.table}")
+            queries = self.build_incremental_queries(query, all_args)
+        else:
+            queries = [
+                f'TRUNCATE TABLE {self.table}',
+                (f'INSERT INTO {self.table} {query}', all_args)
+            ]
+        if self.partition_key:
+            queries += [
+                self.build_watermark_query(),
+                self.build_prune_query()
+            ]
+        self.db_connector.execute(*queries)
 
         count = self.db_connector.query(f'SELECT COUNT(*) FROM {self.table}')
 
         # Write dummy output for sake of complete()
         with self.output().open('w') as file:
             file.write(f"Cache of {count} rows")
+
+    def is_incremental(self):
+        """
+        Answer whether only the changed partitions need to be recomputed.
+
+        If the table has never been refreshed or any upstream table has been
+        truncated since then, all partitions are recomputed.
+        """
+        if self.full_rebuild:
+            return False
+        watermarks = self.db_connector.query(f'''
+            SELECT last_change_id FROM {self.watermark_table}
+            WHERE cache_table = '{self.table}'
+        ''')
+        if not watermarks:
+            return False
+        self.last_refresh_id = watermarks[0][0]
+        return not self.db_connector.exists(f'''
+            {self.build_changes_query()}
+                AND source IS NULL
+        ''')
+
+    def changed_partition_filter(self, alias):
+        """
+        Answer an SQL condition that matches the changed partitions only.
+
+        alias refers to a relation with the columns source and post_id. If
+        the whole table is recomputed, all partitions are matched.
+        """
+        if not self.incremental:
+            return 'TRUE'
+        return f'''
+            ({alias}.source, {alias}.post_id) IN (
+                SELECT source, post_id FROM changed_partition
+            )
+        '''
+
+    def build_changes_query(self):
+
+        upstream_tables = ', '.join(
+            f"'{table}'" for table in self.upstream_tables)
+        return f'''
+            SELECT source, post_id
+            FROM {self.change_table}
+            WHERE table_name IN ({upstream_tables})
+                AND change_id > {self.last_refresh_id}
+                AND change_id <= {self.last_change_id}
+        '''
+
+    def build_incremental_queries(self, query, all_args):
+        """Build the queries to recompute all changed partitions only."""
+        key = ', '.join(self.partition_key)
+        partition_filter = f'''
+            ({key}) IN (SELECT source, post_id FROM changed_partition)
+        '''
+
+        return [
+            f'''
+                CREATE TEMPORARY TABLE changed_partition ON COMMIT DROP AS
+                SELECT DISTINCT source, post_id
+                FROM ({self.build_changes_query()}) AS changes
+            ''',
+            'ANALYZE changed_partition',
+            f'''
+                DELETE FROM {self.table}
+                WHERE {partition_filter}
+            ''',
+            # The outer filter only guards against queries that do not
+            # restrict their upstream scans
+            (f'''
+                INSERT INTO {self.table}
+                SELECT * FROM ({query}) AS cache_query
+                WHERE {partition_filter}
+            ''', all_args)
+        ]
+
+    def build_watermark_query(self):
+
+        return f'''
+            INSERT INTO {self.watermark_table}
+            VALUES ('{self.table}', {self.last_change_id}, now())
+            ON CONFLICT (cache_table) DO UPDATE
+                SET last_change_id = EXCLUDED.last_change_id,
+                    refreshed_at = EXCLUDED.refreshed_at
+        '''
+
+    @classmethod
+    def build_prune_query(cls):
+        """
+        Build a query to remove all changes that every cache has respected.
+
+        Caches that have never been refreshed do not hold back pruning because
+        they are recomputed completely anyway.
+        """
+        return f'''
+            DELETE FROM {cls.change_table}
+            WHERE change_id <= (
+                SELECT min(last_change_id) FROM {cls.watermark_table}
+            )
+        '''
@@ -0,0 +1,107 @@
+"""
+Provides helpers for scheduling full syncs of incrementally fetched data.
+
+Most fetch tasks only request data that are newer than the stored data. To
+catch changed, deleted or otherwise missed data, they fetch all data again
+every full_sync_interval days. The time of the last full sync is recorded in
+the full_sync table once the task has succeeded, so a full sync that has been
+skipped or has failed is repeated by the next run.
+
+Tasks can sync parts of their data separately (for example, single store
+fronts). Every part has its own record.
+"""
+
+import datetime as dt
+from typing import Dict, Iterable, Optional
+
+import luigi
+
+from .data_preparation import DataPreparationTask
+
+FULL_SYNC_TABLE = 'full_sync'
+
+
+class FullSyncTask(DataPreparationTask):
+    """
+    The abstract superclass for tasks that fetch all data regularly.
+
+    Subclasses call plan_full_sync() to decide whether to fetch all data.
+    """
+
+    full_sync_interval = luigi.IntParameter(
+        default=7,
+        description="Every how many days all data should be fetched "
+                    "(0 to fetch new data only)")
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+        self.planned_full_syncs = set()
+
+    def plan_full_sync(self, part: str = None) -> bool:
+        """
+        Answer whether all data (of part) should be fetched in this run.
+
+        If so, the full sync is recorded once the task has succeeded.
+        """
+        if not self.is_overdue(self.last_full_syncs([part])[part]):
+            return False
+        self.planned_full_syncs.add(part)
+        return True
+
+    def cancel_full_syncs(self):
+        """Do not record the planned full syncs, e.g. if fetching failed."""
+        self.planned_full_syncs.clear()
+
+    def last_full_syncs(
+            self,
+            parts: Iterable[str]
+            ) -> Dict[str, Optional[dt.datetime]]:
+        """Answer the time of the last full sync of every part, or None."""
+        parts = list(parts)
+        synced_at = dict(self.db_connector.query(
+            f'''
+                SELECT sync_key, synced_at
+                FROM {FULL_SYNC_TABLE}
+                WHERE sync_key = ANY(%s)
+            ''',
+            [self.full_sync_key(part) for part in parts]))
+        return {
+            part: synced_at.get(self.full_sync_key(part))
+            for part in parts
+        }
+
+    def is_overdue(self, synced_at: Optional[dt.datetime]) -> bool:
+        """Answer whether a full sync at synced_at is too old."""
+        if not self.full_sync_interval:
+            return False
+        return synced_at is None or synced_at.date() <= \
+            dt.date.today() - dt.timedelta(days=self.full_sync_interval)
+
+    def full_sync_key(self, part: str = None) -> str:
+
+        if part is None:
+            return self.task_family
+        return f'{self.task_family}/{part}'
+
+    def record_full_syncs(self):
+
+        if not self.planned_full_syncs:
+            return
+        self.db_connector.execute((
+            f'''
+                INSERT INTO {FULL_SYNC_TABLE} (sync_key, synced_at)
+                SELECT sync_key, now()
+                FROM unnest(%s::text[]) AS sync_key
+                ON CONFLICT (sync_key) DO UPDATE
+                    SET synced_at = EXCLUDED.synced_at
+            ''',
+            ([self.full_sync_key(part) for part in self.planned_full_syncs],)
+        ))
+        self.planned_full_syncs.clear()
+
+
+@FullSyncTask.event_handler(luigi.Event.SUCCESS)
+def record_full_syncs(task):
+    """Record the full syncs of a task once all data have been fetched."""
+    task.record_full_syncs()
@@ -0,0 +1,144 @@
+"""
+Provides helpers for tracking which posts have been processed into a table.
+
+Every task that derives data from posts first claims all posts it is going to
+process in the pipeline_watermark table (see ClaimPosts). After the derived
+data has been stored, the claimed posts are confirmed as processed. Thus,
+posts that arrive late or whose processing failed will be picked up by the
+next run.
+
+Tables that are derived from another derived table (the upstream table) only
+claim posts that have been confirmed for the upstream table. Otherwise, a
+post could be confirmed before the upstream data it depends on exist.
+"""
+
+import luigi
+from luigi.format import UTF8
+import pandas as pd
+
+from .data_preparation import DataPreparationTask
+
+WATERMARK_TABLE = 'pipeline_watermark'
+
+
+def unprocessed_posts_query(
+        table: str,
+        post_table: str = 'post',
+        upstream_table: str = None) -> str:
+    """
+    Answer a query for all posts that have not been claimed for table.
+
+    If upstream_table is given, only posts that have been processed into
+    upstream_table are respected. Otherwise, all posts from post_table are
+    respected.
+    """
+    candidates = post_table if not upstream_table else f'''(
+        SELECT source, post_id
+        FROM {WATERMARK_TABLE}
+        WHERE table_name = '{upstream_table}' AND processed_at IS NOT NULL
+    )'''
+    return f'''
+        SELECT post.source, post.post_id
+        FROM {candidates} AS post
+        WHERE NOT EXISTS (
+            SELECT *
+            FROM {WATERMARK_TABLE} AS watermark
+            WHERE (watermark.table_name, watermark.source, watermark.post_id)
+                = ('{table}', post.source, post.post_id)
+        )
+    '''
+
+
+def pending_posts_query(table: str) -> str:
+    """Answer a query for all posts that have been claimed for table."""
+    return f'''
+        SELECT source, post_id
+        FROM {WATERMARK_TABLE}
+        WHERE table_name = '{table}' AND processed_at IS NULL
+    '''
+
+
+def claim_posts_query(
+        table: str,
+        limit: int = -1,
+        shuffle: bool = False,
+        post_table: str = 'post',
+        upstream_table: str = None) -> str:
+    """
+    Answer a query to claim unprocessed posts for table.
+
+    Posts that have been claimed earlier but not been confirmed yet remain
+    claimed.
+    """
+    query = unprocessed_posts_query(table, post_table, upstream_table)
+    if shuffle:
+        query += ' ORDER BY RANDOM()'
+    if limit != -1:
+        query += f' LIMIT {limit}'
+    return f'''
+        INSERT INTO {WATERMARK_TABLE} (table_name, source, post_id)
+        SELECT '{table}', source, post_id
+        FROM ({query}) AS unprocessed_post
+        ON CONFLICT DO NOTHING
+    '''
+
+
+def confirm_posts_query(table: str) -> str:
+    """
+    Answer a query to mark the given claimed posts for table as processed.
+
+    The query expects two arguments: an array of the sources and an array of
+    the IDs of all posts to confirm.
+    """
+    return f'''
+        UPDATE {WATERMARK_TABLE}
+        SET processed_at = now()
+        WHERE table_name = '{table}' AND processed_at IS NULL
+            AND (source, post_id) IN (
+                SELECT * FROM unnest(%s::text[], %s::text[])
+            )
+    '''
+
+
+class ClaimPosts(DataPreparationTask):
+    """
+    Claim all unprocessed posts for a table and list the pending posts.
+
+    The output contains all posts that are pending for the table after
+    claiming, i.e., the posts the tasks of the current run are going to
+    process. Claiming happens once per run, so tasks that are run multiple
+    times by luigi (because of dynamic dependencies) do not claim further
+    posts. Subclasses can override requires() to claim posts only after the
+    upstream table has been updated, and build_claim_query() to restrict the
+    claimed posts.
+    """
+
+    post_table = 'post'
+
+    """
+    If set, only posts that have been processed into this table are claimed.
+    """
+    upstream_table = None
+
+    def output(self):
+
+        return luigi.LocalTarget(
+            f'{self.output_dir}/pipeline_watermark/{self.table}.csv',
+            format=UTF8)
+
+    def run(self):
+
+        self.db_connector.execute(self.build_claim_query())
+
+        posts = pd.DataFrame(
+            self.db_connector.query(pending_posts_query(self.table)),
+            columns=['source', 'post_id'])
+        with self.output().open('w') as output_file:
+            posts.to_csv(output_file, index=False, header=True)
+
+    def build_claim_query(self):
+
+        return claim_posts_query(
+            self.table,
+            post_table=self.post_table,
+            upstream_table=self.upstream_table)
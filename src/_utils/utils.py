@@ -1,8 +1,9 @@
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
 import logging
 import os
 import sys
-from typing import Union
+from typing import Callable, Iterable, List, TypeVar, Union
 
 import jsonpickle
 import luigi
@@ -10,6 +11,8 @@ import luigi
 from backports.datetime_fromisoformat import MonkeyPatch
 MonkeyPatch.patch_fromisoformat()
 
+T = TypeVar('T')
+
 
 class ObjectParameter(luigi.Parameter):
     """A luigi parameter that takes an arbitrary object."""
@@ -76,3 +79,26 @@ def set_log_level_temporarily(logger: logging.Logger, level: Union[int, str]):
         yield
     finally:
         logger.setLevel(old_level)
+
+
+def parallel_map(
+        function: Callable[[T], object],
+        items: Iterable[T],
+        min_parallel_items: int = 1,
+        processes: int = None
+        ) -> List:
+    """
+    Apply the function to all items using a process pool.
+
+    Function and items need to be picklable. If there are less than
+    min_parallel_items, the items are processed in the current process to
+    avoid the overhead of the pool.
+    """
+    items = list(items)
+    if len(items) < min_parallel_items:
+        return list(map(function, items))
+    processes = processes or os.cpu_count()
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(
+            function, items,
+            chunksize=max(1, len(items) // (4 * processes))))
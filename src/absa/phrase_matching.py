@@ -62,7 +62,7 @@ class FuzzyJoinPhrases(QueryDb):
                 source, post_id, word_index, n,
                 {self.algorithm.aggregate_query('match_value')} AS match_value
             FROM
-                /*<REPORT_PROGRESS>*/phrase_match
+                phrase_match
                     NATURAL JOIN {self.primary_table} AS phrase
             WHERE
                 {self.algorithm.post_filter_query(
@@ -88,7 +88,7 @@ class FuzzyJoinPhrases(QueryDb):
                 MIN(reference.{self.reference_phrase}) AS reference_word,
                 '{self.algorithm.name}' AS match_algorithm
             FROM
-                /*<REPORT_PROGRESS>*/best_phrase_match
+                best_phrase_match
                     NATURAL JOIN phrase_match
                     JOIN {self.reference_table} AS reference
                         USING ({self.reference_key})
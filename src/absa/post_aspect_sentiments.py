@@ -1,8 +1,13 @@
 """Provides tasks for determining the aspect-wise sentiments of user posts."""
 
+import json
+
 import luigi
+from luigi.format import UTF8
+import numpy as np
+import pandas as pd
 
-from _utils import QueryCacheToDb
+from _utils import CsvToDb, DataPreparationTask, QueryCacheToDb
 from .post_aspects import PostAspectsToDb
 from .post_ngrams import PostNgramsToDb
 from .post_sentiments import PostPhrasePolaritiesToDb
@@ -28,6 +33,10 @@ class PostPhraseAspectPolaritiesToDb(QueryCacheToDb):
 
     phrase_table = 'absa.post_ngram'
 
+    partition_key = ('source', 'post_id')
+
+    upstream_tables = [aspect_table, polarity_table, phrase_table]
+
     def requires(self):
 
         yield PostAspectsToDb()
@@ -71,6 +80,10 @@ class PostPhraseAspectPolaritiesToDb(QueryCacheToDb):
                         {self.aspect_table}.post_id,
                         {self.aspect_table}.word_index
                     )
+            WHERE {self.changed_partition_filter('post_phrase_polarity')}
+                AND {self.changed_partition_filter('polarity_phrase')}
+                AND {self.changed_partition_filter(self.aspect_table)}
+                AND {self.changed_partition_filter('aspect_phrase')}
             GROUP BY
                 polarity_phrase.source, polarity_phrase.post_id,
                 aspect_id,
@@ -91,163 +104,381 @@ class PostAspectSentimentsLinearDistanceToDb(luigi.WrapperTask):
         yield PostAspectSentimentsLinearDistanceWeightToDb()
 
 
-class PostAspectSentimentsLinearDistanceLimitToDb(QueryCacheToDb):
+class PostAspectSentimentsLinearDistanceToDbAbstract(CsvToDb):
+    """
+    Store the aspect sentiments computed from the linear distance.
 
-    table = 'absa.post_aspect_sentiment_linear_distance_limit'
+    Only posts whose aspects, phrases, or polarities have changed since the
+    last refresh are recomputed (see FindChangedLinearDistancePartitions).
+    """
 
-    phrase_aspect_table = 'absa.post_phrase_aspect_polarity_linear_distance'
+    full_rebuild = luigi.BoolParameter(
+        default=False,
+        description="If True, the sentiments of all posts will be recomputed")
 
-    def requires(self):
+    def changes(self):
 
-        return PostPhraseAspectPolaritiesLinearDistanceToDb()
+        return FindChangedLinearDistancePartitions(
+            table=self.table,
+            full_rebuild=self.full_rebuild)
 
-    @property
-    def kwargs(self):
+    def _requires(self):
+
+        return luigi.task.flatten([
+            super()._requires(),
+            self.changes()
+        ])
+
+    def copy(self, cursor, file):
+
+        changes = self.changes()
+        cursor.execute(f'''
+            DELETE FROM {self.table}
+            WHERE {changes.partition_filter()}
+        ''')
+
+        super().copy(cursor, file)
+
+        cursor.execute(
+            f'''
+                INSERT INTO {QueryCacheToDb.watermark_table}
+                VALUES (%s, %s, now())
+                ON CONFLICT (cache_table) DO UPDATE
+                    SET last_change_id = EXCLUDED.last_change_id,
+                        refreshed_at = EXCLUDED.refreshed_at
+            ''',
+            (self.table, changes.load()['last_change_id']))
+        cursor.execute(QueryCacheToDb.build_prune_query())
 
-        return dict(threshold=self.threshold)
+
+class PostAspectSentimentsLinearDistanceLimitToDb(
+        PostAspectSentimentsLinearDistanceToDbAbstract):
+
+    table = 'absa.post_aspect_sentiment_linear_distance_limit'
 
     threshold = 4
 
-    @property
-    def query(self):
+    def requires(self):
 
-        return f'''
-            WITH linear_distance AS (
-                SELECT *
-                FROM {self.phrase_aspect_table}
-                WHERE linear_distance <= %(threshold)s
-            )
-            SELECT
-                source, post_id,
-                aspect_id,
-                avg(linear_distance) AS linear_distance,
-                CASE
-                    WHEN sum(polarity) = 0 THEN NULL
-                    ELSE sum(polarity ^ 2) / sum(polarity)
-                END AS sentiment,
-                count(DISTINCT aspect_word_index) AS aspect_count,
-                count(DISTINCT polarity_word_index) AS polarity_count,
-                dataset,
-                aspect_match_algorithm,
-                sentiment_match_algorithm
-            FROM linear_distance
-            GROUP BY
-                source, post_id, aspect_id,
-                dataset, aspect_match_algorithm,
-                sentiment_match_algorithm
-        '''
+        return CollectPostAspectSentimentsLinearDistance(
+            table=self.table,
+            full_rebuild=self.full_rebuild,
+            distance_method='limit',
+            max_distance=self.threshold)
 
 
-class PostAspectSentimentsLinearDistanceWeightToDb(QueryCacheToDb):
+class PostAspectSentimentsLinearDistanceWeightToDb(
+        PostAspectSentimentsLinearDistanceToDbAbstract):
 
     table = 'absa.post_aspect_sentiment_linear_distance_weight'
 
-    phrase_aspect_table = 'absa.post_phrase_aspect_polarity_linear_distance'
+    weight_alpha = 5
 
     def requires(self):
 
-        return PostPhraseAspectPolaritiesLinearDistanceToDb()
+        return CollectPostAspectSentimentsLinearDistance(
+            table=self.table,
+            full_rebuild=self.full_rebuild,
+            distance_method='weight',
+            weight_alpha=self.weight_alpha,
+            # Weights below 1e-6 are rounded to zero
+            max_distance=int(self.weight_alpha * np.sqrt(-np.log(1e-6))))
 
-    @property
-    def kwargs(self):
 
-        return dict(weight_alpha=self.weight_alpha)
+class FindChangedLinearDistancePartitions(DataPreparationTask):
+    """
+    Find the posts whose linear distance sentiments need to be recomputed.
 
-    weight_alpha = 5
+    Like QueryCacheToDb, this uses the change log of all upstream tables
+    (see migration 053). The output stores the range of changes that are
+    respected by the current run. If the table has never been refreshed or
+    any upstream table has been truncated, all posts are recomputed.
+    """
+
+    full_rebuild = luigi.BoolParameter(
+        default=False,
+        description="If True, all posts will be recomputed")
+
+    aspect_table = 'absa.post_aspect'
+
+    polarity_table = 'absa.post_phrase_polarity'
+
+    phrase_table = 'absa.post_ngram'
 
-    # TODO: Decide whether we want to square polarity
-    # (See commit 99193460503243ae893d837a58470e7c93995448)
     @property
-    def query(self):
+    def upstream_tables(self):
+
+        return [self.aspect_table, self.polarity_table, self.phrase_table]
 
+    def requires(self):
+
+        yield PostAspectsToDb()
+        yield PostPhrasePolaritiesToDb()
+        yield PostNgramsToDb()
+
+    def output(self):
+
+        return luigi.LocalTarget(
+            f'{self.output_dir}/cache_watermark/{self.table}.json',
+            format=UTF8)
+
+    def run(self):
+
+        last_change_id, = self.db_connector.query(f'''
+            SELECT coalesce(max(change_id), 0)
+            FROM {QueryCacheToDb.change_table}
+        ''', only_first=True)
+        changes = {
+            'last_refresh_id':
+                None if self.full_rebuild else self.find_last_refresh_id(),
+            'last_change_id': last_change_id
+        }
+        if changes['last_refresh_id'] is not None and \
+                self.db_connector.exists(f'''
+                    {self.build_changes_query(changes)}
+                        AND source IS NULL
+                '''):
+            # An upstream table has been truncated
+            changes['last_refresh_id'] = None
+
+        with self.output().open('w') as output_file:
+            json.dump(changes, output_file)
+
+    def find_last_refresh_id(self):
+
+        watermarks = self.db_connector.query(f'''
+            SELECT last_change_id
+            FROM {QueryCacheToDb.watermark_table}
+            WHERE cache_table = %s
+        ''', self.table)
+        return watermarks[0][0] if watermarks else None
+
+    def load(self):
+
+        with self.output().open('r') as changes_file:
+            return json.load(changes_file)
+
+    def partition_filter(self):
+        """Answer an SQL condition matching all posts to recompute."""
+        changes = self.load()
+        if changes['last_refresh_id'] is None:
+            return 'TRUE'
         return f'''
-            WITH linear_weight AS (
-                SELECT
-                    *,
-                    (CASE WHEN
-                        linear_distance <= %(weight_alpha)s * sqrt(-ln(1e-6))
-                    THEN round(
-                        exp(-(
-                            (linear_distance::numeric / %(weight_alpha)s) ^ 2
-                        )),
-                        6
-                    )
-                    ELSE
-                        0
-                    END) AS linear_weight
-                FROM {self.phrase_aspect_table}
-            )
-            SELECT
-                source, post_id,
-                aspect_id,
-                avg(linear_distance) AS linear_distance,
-                CASE
-                    WHEN sum(polarity) = 0 THEN NULL
-                    ELSE sum(polarity ^ 2 * linear_weight)
-                        / sum(polarity * linear_weight)
-                END AS sentiment,
-                count(DISTINCT aspect_word_index) AS aspect_count,
-                count(DISTINCT polarity_word_index) AS polarity_count,
-                dataset,
-                aspect_match_algorithm,
-                sentiment_match_algorithm
-            FROM linear_weight
-            WHERE linear_weight > 0
-            GROUP BY
-                source, post_id, aspect_id,
-                dataset, aspect_match_algorithm,
-                sentiment_match_algorithm
+            (source, post_id) IN ({self.build_changes_query(changes)})
+        '''
+
+    def build_changes_query(self, changes):
+
+        upstream_tables = ', '.join(
+            f"'{table}'" for table in self.upstream_tables)
+        return f'''
+            SELECT source, post_id
+            FROM {QueryCacheToDb.change_table}
+            WHERE table_name IN ({upstream_tables})
+                AND change_id > {changes['last_refresh_id']}
+                AND change_id <= {changes['last_change_id']}
         '''
 
 
-class PostPhraseAspectPolaritiesLinearDistanceToDb(QueryCacheToDb):
+class CollectPostAspectSentimentsLinearDistance(DataPreparationTask):
+    """
+    Compute aspect sentiments from the polarity phrases near each aspect.
 
-    table = 'absa.post_phrase_aspect_polarity_linear_distance'
+    Instead of building the cross product of all aspects and polarity phrases
+    of a post, the polarity phrases of all posts are sorted by their word
+    index once. Then the window of polarity phrases within max_distance is
+    looked up for every aspect using a binary search. Only posts that have
+    changed since the last refresh of the table are respected.
+    """
 
-    phrase_aspect_table = 'absa.post_phrase_aspect_polarity'
+    full_rebuild = luigi.BoolParameter(
+        default=False,
+        description="If True, all posts will be respected")
+
+    distance_method = luigi.ChoiceParameter(
+        choices=['limit', 'weight'],
+        description="Whether to respect all polarities within max_distance "
+                    "equally or to weight them by their distance")
+
+    max_distance = luigi.IntParameter(
+        description="The maximum linear distance between aspect and polarity")
+
+    weight_alpha = luigi.IntParameter(
+        default=5,
+        description="The standard deviation of the gaussian weight function "
+                    "(times sqrt(2)), if distance_method is 'weight'")
+
+    aspect_table = 'absa.post_aspect'
+
+    polarity_table = 'absa.post_phrase_polarity'
+
+    phrase_table = 'absa.post_ngram'
 
     def requires(self):
 
-        return PostPhraseAspectPolaritiesToDb()
+        return FindChangedLinearDistancePartitions(
+            table=self.table,
+            full_rebuild=self.full_rebuild)
 
-    @property
-    def query(self):
+    def output(self):
 
-        return f'''
-            WITH linear_distance AS (
-                SELECT
-                    post_phrase_aspect_polarity.source,
-                    post_phrase_aspect_polarity.post_id,
-                    aspect_id,
-                    aspect_word_index,  -- TODO: Add missing n
-                    polarity_phrase_n, polarity_word_index,
-                    CASE
-                        WHEN sum(polarity) = 0 THEN NULL
-                        ELSE sum(polarity ^ 2) / sum(polarity)
-                    END AS sentiment,
-                    least(
-                        min(abs(polarity_word_index - (
-                            aspect_word_index + aspect_phrase_n - 1)
-                        )),
-                        min(abs(aspect_word_index - (
-                            polarity_word_index + polarity_phrase_n - 1)
-                        ))
-                    ) AS linear_distance,
-                    sum(count) AS sum,
-                    dataset,
-                    aspect_match_algorithm,
-                    sentiment_match_algorithm
-                FROM
-                    {self.phrase_aspect_table}
-                GROUP BY
-                    post_phrase_aspect_polarity.source,
-                    post_phrase_aspect_polarity.post_id,
-                    aspect_id,
-                    aspect_word_index,
-                    polarity_phrase_n, polarity_word_index,
-                    dataset, aspect_match_algorithm,
-                    sentiment_match_algorithm
-            )
-            SELECT *
-            FROM linear_distance
-        '''
+        return luigi.LocalTarget(
+            f'{self.output_dir}/absa/post_aspect_sentiments_linear_distance_'
+            f'{self.distance_method}.csv',
+            format=UTF8)
+
+    def run(self):
+
+        partition_filter = self.requires().partition_filter()
+        # TODO: Add missing n to post_aspect. Until then, all phrases
+        # starting at the aspect word are considered as aspect phrases.
+        aspects = self.query_df(f'''
+            SELECT
+                source, post_id, aspect_id,
+                word_index AS aspect_word_index,
+                n AS aspect_phrase_n,
+                match_algorithm AS aspect_match_algorithm
+            FROM {self.aspect_table}
+                JOIN {self.phrase_table} USING (source, post_id, word_index)
+            WHERE {partition_filter}
+        ''')
+        polarities = self.query_df(f'''
+            SELECT
+                source, post_id,
+                n AS polarity_phrase_n,
+                word_index AS polarity_word_index,
+                NULLIF(polarity, 0) AS polarity,
+                dataset,
+                match_algorithm AS sentiment_match_algorithm
+            FROM {self.polarity_table}
+            WHERE {partition_filter}
+        ''')
+
+        pairs = self.find_near_pairs(aspects, polarities)
+        sentiments = self.aggregate_sentiments(pairs)
+
+        with self.output().open('w') as output_stream:
+            sentiments.to_csv(output_stream, index=False, header=True)
+
+    def query_df(self, query):
+
+        rows, columns = self.db_connector.query_with_header(query)
+        return pd.DataFrame(rows, columns=columns)
+
+    def find_near_pairs(self, aspects, polarities):
+        """
+        Find all pairs of aspects and polarity phrases within max_distance.
+
+        The distance of a pair is the number of words between the end of the
+        first phrase and the start of the second phrase, minimized over all
+        aspect phrases starting at the same word.
+        """
+        if aspects.empty or polarities.empty:
+            return pd.DataFrame(columns=[
+                *aspects.columns, *polarities.columns[2:], 'linear_distance'])
+
+        # Map every post to a disjoint range of positions
+        post_codes, _ = pd.factorize(pd.MultiIndex.from_frame(pd.concat([
+            aspects[['source', 'post_id']],
+            polarities[['source', 'post_id']]
+        ])))
+        aspect_post = post_codes[:len(aspects)]
+        polarity_post = post_codes[len(aspects):]
+        max_n = max(
+            aspects['aspect_phrase_n'].max(),
+            polarities['polarity_phrase_n'].max())
+        stride = max(
+            aspects['aspect_word_index'].max(),
+            polarities['polarity_word_index'].max()
+        ) + max_n + 2 * self.max_distance + 2
+
+        polarity_position = \
+            polarity_post * stride + polarities['polarity_word_index'].values
+        order = np.argsort(polarity_position, kind='stable')
+        polarities = polarities.iloc[order].reset_index(drop=True)
+        polarity_position = polarity_position[order]
+
+        # Look up the window of candidate polarities for every aspect
+        aspect_start = aspects['aspect_word_index'].values
+        aspect_end = aspect_start + aspects['aspect_phrase_n'].values - 1
+        window_start = np.searchsorted(
+            polarity_position,
+            aspect_post * stride + aspect_start
+            - self.max_distance - (max_n - 1),
+            side='left')
+        window_end = np.searchsorted(
+            polarity_position,
+            aspect_post * stride + aspect_end + self.max_distance,
+            side='right')
+        window_size = window_end - window_start
+        aspect_index = np.repeat(np.arange(len(aspects)), window_size)
+        polarity_index = np.repeat(window_start, window_size) + (
+            np.arange(window_size.sum())
+            - np.repeat(np.cumsum(window_size) - window_size, window_size))
+
+        pairs = pd.concat([
+            aspects.iloc[aspect_index].reset_index(drop=True),
+            polarities.iloc[polarity_index, 2:].reset_index(drop=True)
+        ], axis=1)
+        polarity_start = pairs['polarity_word_index'].values
+        polarity_end = polarity_start + pairs['polarity_phrase_n'].values - 1
+        pairs['linear_distance'] = np.minimum(
+            np.abs(polarity_start - aspect_end[aspect_index]),
+            np.abs(aspect_start[aspect_index] - polarity_end))
+        pairs = pairs[pairs['linear_distance'] <= self.max_distance]
+
+        return pairs.groupby(
+            [
+                'source', 'post_id', 'aspect_id', 'aspect_word_index',
+                'polarity_phrase_n', 'polarity_word_index',
+                'dataset', 'aspect_match_algorithm',
+                'sentiment_match_algorithm'
+            ],
+            as_index=False, sort=False, dropna=False
+        ).agg(
+            polarity=('polarity', 'first'),
+            linear_distance=('linear_distance', 'min'))
+
+    def aggregate_sentiments(self, pairs):
+
+        columns = [
+            'source', 'post_id', 'aspect_id',
+            'linear_distance', 'sentiment',
+            'aspect_count', 'polarity_count',
+            'dataset', 'aspect_match_algorithm', 'sentiment_match_algorithm'
+        ]
+        if self.distance_method == 'weight':
+            weight = np.round(
+                np.exp(-(pairs['linear_distance'] / self.weight_alpha) ** 2),
+                6)
+            pairs = pairs.assign(weight=weight)[weight > 0]
+        else:
+            pairs = pairs.assign(weight=1)
+        if pairs.empty:
+            return pd.DataFrame(columns=columns)
+        pairs = pairs.assign(
+            weighted_polarity=pairs['polarity'] * pairs['weight'],
+            weighted_square=pairs['polarity'] ** 2 * pairs['weight'])
+
+        sentiments = pairs.groupby(
+            [
+                'source', 'post_id', 'aspect_id',
+                'dataset', 'aspect_match_algorithm',
+                'sentiment_match_algorithm'
+            ],
+            as_index=False, sort=False, dropna=False
+        ).agg(
+            linear_distance=('linear_distance', 'mean'),
+            polarity_sum=('polarity', 'sum'),
+            weighted_polarity=('weighted_polarity', 'sum'),
+            weighted_square=('weighted_square', 'sum'),
+            aspect_count=('aspect_word_index', 'nunique'),
+            polarity_count=('polarity_word_index', 'nunique'))
+
+        sentiments['linear_distance'] = np.floor(
+            sentiments['linear_distance'] + 0.5)
+        sentiments['sentiment'] = (
+            sentiments['weighted_square'] / sentiments['weighted_polarity']
+        ).where(sentiments['polarity_sum'] != 0)
+
+        return sentiments[columns]
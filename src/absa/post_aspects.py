@@ -3,7 +3,8 @@
 import luigi
 from luigi.format import UTF8
 
-from _utils import CsvToDb, ConcatCsvs, QueryDb
+from _utils import ClaimPosts, CsvToDb, ConcatCsvs, QueryDb, \
+    pending_posts_query
 from .post_ngrams import PostNgramsToDb
 from .target_aspects import TargetAspectsToDb
 
@@ -15,6 +16,18 @@ class PostAspectsToDb(CsvToDb):
     def requires(self):
         return CollectPostAspects(table=self.table)
 
+    def claim_posts(self):
+        return ClaimPostAspects(table=self.table)
+
+
+class ClaimPostAspects(ClaimPosts):
+    """Claim all posts whose n-grams have been collected."""
+
+    upstream_table = 'absa.post_ngram'
+
+    def requires(self):
+        return PostNgramsToDb()
+
 
 class CollectPostAspects(ConcatCsvs):
     """
@@ -47,7 +60,7 @@ class CollectPostAspectsAlgorithm(QueryDb):
 
     def _requires(self):
         return luigi.task.flatten([
-            PostNgramsToDb(),
+            ClaimPostAspects(table=self.table),
             TargetAspectsToDb(),
             super()._requires()
         ])
@@ -59,21 +72,15 @@ class CollectPostAspectsAlgorithm(QueryDb):
         return f'''
             CREATE TEMPORARY TABLE aspect_match AS (
                 WITH
-                    new_post_id AS (
-                        SELECT post_id
-                        FROM post
-                        WHERE post_date > ANY(
-                            SELECT max(post_date)
-                            FROM {self.table}
-                            NATURAL JOIN post
-                        ) IS NOT FALSE
+                    new_post AS (
+                        {pending_posts_query(self.table)}
                     ),
                     post_ngram AS (
                         SELECT
                             *
                         FROM
                             absa.post_ngram
-                                NATURAL JOIN new_post_id
+                                NATURAL JOIN new_post
                         WHERE
                             {self.pre_filter_query('phrase')}
                     )
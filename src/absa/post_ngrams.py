@@ -4,7 +4,8 @@ import luigi
 import luigi.format
 import pandas as pd
 
-from _utils import CsvToDb, DataPreparationTask, QueryDb, logger
+from _utils import ClaimPosts, CsvToDb, DataPreparationTask, QueryDb, \
+    logger, pending_posts_query
 from .post_words import PostWordsToDb
 from .stopwords import StopwordsToDb
 
@@ -47,6 +48,40 @@ class PostNgramsToDb(CsvToDb):
             shuffle=self.shuffle,
             standalone=self.standalone)
 
+    def claim_posts(self):
+
+        return ClaimPostNgrams(
+            table=self.table,
+            limit=self.limit,
+            shuffle=self.shuffle,
+            standalone=self.standalone)
+
+
+class ClaimPostNgrams(ClaimPosts):
+    """Claim all posts whose words have been collected."""
+
+    upstream_table = 'absa.post_word'
+
+    limit = luigi.IntParameter(
+        default=-1,
+        description="The maximum number posts to collect words for.")
+
+    shuffle = luigi.BoolParameter(
+        default=False,
+        description="If True, words will be collected for random posts.")
+
+    standalone = luigi.BoolParameter(
+        default=False,
+        description="If False, the post database will be updated before the"
+                    "words will be collected.")
+
+    def requires(self):
+
+        return PostWordsToDb(
+            limit=self.limit,
+            shuffle=self.shuffle,
+            standalone=self.standalone)
+
 
 class CollectPostNgrams(DataPreparationTask):
 
@@ -80,14 +115,18 @@ class CollectPostNgrams(DataPreparationTask):
     def _requires(self):
 
         return luigi.task.flatten([
-            PostWordsToDb(
-                limit=self.limit,
-                shuffle=self.shuffle,
-                standalone=self.standalone),
             StopwordsToDb(),
             super()._requires()
         ])
 
+    def requires(self):
+
+        return ClaimPostNgrams(
+            table=self.table,
+            limit=self.limit,
+            shuffle=self.shuffle,
+            standalone=self.standalone)
+
     def output(self):
 
         return luigi.LocalTarget(
@@ -131,21 +170,15 @@ class CollectPostNgrams(DataPreparationTask):
 
         return f'''
             WITH
-                new_post_id AS (
-                    SELECT post_id
-                    FROM post
-                    WHERE post_date > ANY(
-                        SELECT max(post_date)
-                        FROM {self.table}
-                        NATURAL JOIN post
-                    ) IS NOT FALSE
+                new_post AS (
+                    {pending_posts_query(self.table)}
                 )
                 /* TODO Discuss: Do we really want to drop ngrams such as
                 "van Gogh" that include stopwords ("in") at any place? */,
                 word_relevant AS (
                     SELECT  *
                     FROM    {self.word_table}
-                    WHERE   post_id IN (SELECT * FROM new_post_id)
+                    WHERE   (source, post_id) IN (SELECT * FROM new_post)
                     AND     word NOT IN (
                         SELECT word
                         FROM {self.stopword_table}
@@ -164,5 +197,4 @@ class CollectPostNgrams(DataPreparationTask):
             WHERE   {mult_join_constraint(
                         'word{i}.word_index + 1 = word{j}.word_index'
                     )}
-            AND     word{0}.post_id IN (SELECT * FROM new_post_id)
         '''
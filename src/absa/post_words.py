@@ -7,7 +7,8 @@ import luigi
 import pandas as pd
 import regex
 
-from _utils import CsvToDb, DataPreparationTask, QueryDb
+from _utils import ClaimPosts, CsvToDb, DataPreparationTask, QueryDb, \
+    claim_posts_query, pending_posts_query
 from _posts import PostsToDb
 
 
@@ -69,6 +70,48 @@ class PostWordsToDb(CsvToDb):
             shuffle=self.shuffle,
             standalone=self.standalone)
 
+    def claim_posts(self):
+
+        return ClaimPostWords(
+            table=self.table,
+            limit=self.limit,
+            shuffle=self.shuffle,
+            standalone=self.standalone)
+
+
+class ClaimPostWords(ClaimPosts):
+    """Claim all new posts after the post database has been updated."""
+
+    limit = luigi.IntParameter(
+        default=-1,
+        description="The maximum number posts to claim. Optional. If -1, "
+                    "all posts will be claimed.")
+
+    shuffle = luigi.BoolParameter(
+        default=False,
+        description="If True, random posts will be claimed.")
+
+    standalone = luigi.BoolParameter(
+        default=False,
+        description="If False, the post database will be updated before the"
+                    "posts will be claimed.")
+
+    def requires(self):
+
+        if not self.standalone:
+            yield PostsToDb()
+
+    def build_claim_query(self):
+
+        limit = self.limit
+        if self.minimal_mode and limit == -1:
+            limit = 50
+        return claim_posts_query(
+            self.table,
+            limit=limit,
+            shuffle=self.shuffle,
+            post_table=self.post_table)
+
 
 class CollectPostWords(DataPreparationTask):
 
@@ -90,6 +133,14 @@ class CollectPostWords(DataPreparationTask):
 
     post_table = 'post'
 
+    def requires(self):
+
+        return ClaimPostWords(
+            table=self.table,
+            limit=self.limit,
+            shuffle=self.shuffle,
+            standalone=self.standalone)
+
     def output(self):
 
         return luigi.LocalTarget(
@@ -99,27 +150,13 @@ class CollectPostWords(DataPreparationTask):
 
     def run(self):
 
-        if not self.standalone:
-            yield PostsToDb()
-
         posts_target = yield QueryDb(
             query=f'''
-                WITH new_post_id AS (
-                    SELECT post_id
-                    FROM post
-                    WHERE post_date > ANY(
-                        SELECT max(post_date)
-                        FROM {self.table}
-                        NATURAL JOIN post
-                    ) IS NOT FALSE
-                )
                 SELECT source, post_id, text
                 FROM {self.post_table}
-                NATURAL JOIN new_post_id
+                NATURAL JOIN ({pending_posts_query(self.table)}) AS new_post
                 WHERE text <> ''
-            ''',
-            limit=self.limit,
-            shuffle=self.shuffle)
+            ''')
         with posts_target.open('r') as posts_stream:
             posts = pd.read_csv(posts_stream)
 
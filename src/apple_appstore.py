@@ -1,8 +1,11 @@
 """Provides tasks for downloading all Apple App Store reviews about the app."""
 
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
 import json
+import math
 import random
+import threading
 from time import sleep
 
 import luigi
@@ -11,7 +14,7 @@ import pandas as pd
 import requests
 import xmltodict
 
-from _utils import CsvToDb, DataPreparationTask, MuseumFacts, logger
+from _utils import CsvToDb, FullSyncTask, MuseumFacts, logger
 
 
 class AppstoreReviewsToDb(CsvToDb):
@@ -23,22 +26,34 @@ class AppstoreReviewsToDb(CsvToDb):
         return FetchAppstoreReviews()
 
 
-class FetchAppstoreReviews(DataPreparationTask):
+class FetchAppstoreReviews(FullSyncTask):
     """
     Download all reviews related to the museum app from the Apple App Store.
 
-    The data is accessed by scanning an RSS feed.
+    The data is accessed by scanning an RSS feed for every country (store
+    front). Store fronts that have returned reviews before are scanned until
+    the first known review on every run. All store fronts are scanned
+    completely every full_sync_interval days, spread over the days of the
+    interval (see FullSyncTask). Multiple store fronts are scanned
+    concurrently, but all requests share a common rate limit.
     """
 
     table = 'appstore_review'
 
+    full_sync_interval = luigi.IntParameter(
+        default=7,
+        description="Every how many days each store front should be scanned "
+                    "completely (0 to scan known store fronts only)")
+
+    countries_file = 'data/appstore_countries.csv'
     requests_per_minute = 20
-    worker_timeout = 1200
+    max_workers = 4
 
     def __init__(self, *args, **kwargs):
 
         super().__init__(*args, **kwargs)
         self.latest_request_time = dt.datetime.min
+        self.request_lock = threading.Lock()
 
     def requires(self):
 
@@ -58,29 +73,36 @@ class FetchAppstoreReviews(DataPreparationTask):
 
     def fetch_all(self):
 
-        data = []
         country_codes = sorted(self.get_country_codes())
         if self.minimal_mode:
             random_num = random.randint(0, len(country_codes) - 2)  # nosec
             country_codes = country_codes[random_num:random_num + 2]
             country_codes.append('CA')
 
-        tbar = self.tqdm(country_codes, desc="Fetching appstore reviews")
-        for country_code in tbar:
-            tbar.set_description(
-                f"Fetching appstore reviews ({country_code})"
-            )
+        known_ids = self.load_known_review_ids()
+        scans = self.plan_scans(country_codes, known_ids)
+        logger.info(f"Scanning {len(scans)} of {len(country_codes)} "
+                    f"store fronts for appstore reviews")
+
+        def fetch(scan):
+            country_code, stop_ids = scan
             try:
-                data_for_country = self.fetch_for_country(country_code)
-                if not data_for_country.empty:
-                    data.append(data_for_country)
-                logger.debug(f'Fetching appstore reviews for {country_code}')
+                return self.fetch_for_country(country_code, known_ids=stop_ids)
             except requests.HTTPError as error:
                 if error.response.status_code == 400:
                     # not all countries are available
-                    pass
-                else:
-                    raise
+                    return None
+                raise
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            data = [
+                data_for_country
+                for data_for_country in self.tqdm(
+                    executor.map(fetch, scans),
+                    total=len(scans),
+                    desc="Fetching appstore reviews")
+                if data_for_country is not None and not data_for_country.empty
+            ]
         try:
             ret = pd.concat(data)
         except ValueError:
@@ -88,15 +110,88 @@ class FetchAppstoreReviews(DataPreparationTask):
 
         return ret.drop_duplicates(subset=['app_id', 'appstore_review_id'])
 
+    def plan_scans(self, country_codes, known_ids):
+        """
+        Answer the store fronts to scan and the known IDs to stop at.
+
+        Every store front is scanned completely once its last complete scan
+        is older than full_sync_interval days. To spread the complete scans
+        over the days of the interval, the store fronts with the oldest
+        complete scans are also scanned completely before they are due,
+        up to a share of 1/full_sync_interval of all store fronts per run.
+        Other store fronts are only scanned if they have returned reviews
+        before, and only until the first known review.
+        """
+        if not known_ids:
+            logger.info("No known reviews, scanning all store fronts")
+            self.planned_full_syncs.update(country_codes)
+            return [(country_code, set()) for country_code in country_codes]
+
+        full_scans = set()
+        if self.full_sync_interval:
+            last_scans = self.last_full_syncs(country_codes)
+            share = math.ceil(len(country_codes) / self.full_sync_interval)
+            full_scans = {
+                country_code
+                for i, country_code in enumerate(sorted(
+                    country_codes,
+                    key=lambda code: last_scans[code] or dt.datetime.min))
+                if i < share or self.is_overdue(last_scans[country_code])
+            }
+            self.planned_full_syncs.update(full_scans)
+
+        active_countries = self.load_active_country_codes()
+        scans = []
+        for country_code in country_codes:
+            if country_code in full_scans:
+                scans.append((country_code, set()))
+            elif country_code in active_countries:
+                scans.append((country_code, known_ids))
+        return scans
+
+    def load_known_review_ids(self):
+        """Answer the IDs of all stored reviews about the app."""
+        return {
+            review_id
+            for [review_id] in self.db_connector.query(f'''
+                SELECT review_id
+                FROM {self.table}
+                WHERE app_id = '{self.app_id()}'
+            ''')
+        }
+
+    def load_active_country_codes(self):
+        """Answer the codes of all store fronts that have returned reviews."""
+        return {
+            country_code
+            for [country_code] in self.db_connector.query(f'''
+                SELECT DISTINCT country_code
+                FROM {self.table}
+                WHERE app_id = '{self.app_id()}'
+            ''')
+        }
+
     def get_country_codes(self):
 
-        return requests.get('http://country.io/names.json').json().keys()
+        return pd.read_csv(
+            self.countries_file,
+            keep_default_na=False  # NA is the code of Namibia
+        )['code'].tolist()
 
-    def fetch_for_country(self, country_code):
+    def app_id(self):
 
         with self.input().open('r') as facts_file:
             facts = json.load(facts_file)
-            app_id = facts['ids']['apple']['appId']
+        return facts['ids']['apple']['appId']
+
+    def fetch_for_country(self, country_code, known_ids=()):
+        """
+        Fetch the reviews from the store front of the given country.
+
+        Reviews are sorted by their date, so no further pages are fetched
+        once a page contains any of the known_ids.
+        """
+        app_id = self.app_id()
         url = (f'https://itunes.apple.com/{country_code}/rss/customerreviews/'
                f'page=1/id={app_id}/sortby=mostrecent/xml')
         data_list = []
@@ -105,6 +200,10 @@ class FetchAppstoreReviews(DataPreparationTask):
             try:
                 data, url = self.fetch_page(url)
                 data_list += data
+                if any(
+                        review['appstore_review_id'] in known_ids
+                        for review in data):
+                    break
             except requests.exceptions.HTTPError as error:
                 if error.response is not None and (
                     error.response.status_code == 503 or (
@@ -173,12 +272,13 @@ class FetchAppstoreReviews(DataPreparationTask):
 
     def get_metered_request(self, *args, **kwargs):
 
-        sleep(max(0, (
-            60 / self.requests_per_minute - (
-                dt.datetime.now() - self.latest_request_time
-            ).total_seconds())
-        ))
-        try:
-            return requests.get(*args, **kwargs)
-        finally:
-            self.latest_request_time = dt.datetime.now()
+        # reserve the next free slot so that concurrent requests respect the
+        # rate limit as well
+        with self.request_lock:
+            request_time = max(
+                dt.datetime.now(),
+                self.latest_request_time + dt.timedelta(
+                    minutes=1 / self.requests_per_minute))
+            self.latest_request_time = request_time
+        sleep(max(0, (request_time - dt.datetime.now()).total_seconds()))
+        return requests.get(*args, **kwargs)
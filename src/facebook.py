@@ -2,12 +2,19 @@
 Provides tasks and utilities for fetching Facebook posts and linked details.
 
 All data are fetched using the Facebook Graph API. An access token has to be
-available in the /etc/secrets/keys.env file.
+available in the /etc/secrets/keys.env file. Details for many posts are
+fetched using batch requests (see request_batch()). All requests share a
+single client that repeats failed requests and respects the rate limits of
+the API (see GraphApiClient).
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import datetime as dt
 import json
 import os
+import random
+import threading
+import time
 
 import luigi
 import numpy as np
@@ -15,10 +22,15 @@ import pandas as pd
 import requests
 from luigi.format import UTF8
 
-from _utils import CsvToDb, DataPreparationTask, MuseumFacts, logger
+from _utils import CsvToDb, DataPreparationTask, FullSyncTask, MuseumFacts, \
+    logger
 
 API_VER = 'v6.0'
 API_BASE = f'https://graph.facebook.com/{API_VER}'
+# Maximum number of requests in a batch request accepted by the Graph API
+BATCH_SIZE = 50
+# Maximum number of batch requests that are sent at the same time
+MAX_CONCURRENT_BATCHES = 4
 
 # ======= ToDb Tasks =======
 
@@ -52,12 +64,66 @@ class FbPostCommentsToDb(CsvToDb):
 
         return FetchFbPostComments(table=self.table)
 
+
+class FbPostCommentSummariesToDb(CsvToDb):
+    """Store the comment summaries of all fetched posts into the database."""
+
+    table = 'fb_post_comment_summary'
+
+    def _requires(self):
+
+        # Only remember the summaries once the comments have been stored
+        return luigi.task.flatten([
+            FbPostCommentsToDb(),
+            super()._requires()
+        ])
+
+    def requires(self):
+
+        return FetchFbPostCommentSummaries(table=self.table)
+
 # ======= FetchTasks =======
 
 
-class FetchFbPosts(DataPreparationTask):
+class FetchGraphApiPosts(FullSyncTask):
+    """
+    The abstract superclass for tasks fetching posts from the Graph API.
+
+    Posts are fetched incrementally: Only posts newer than the latest known
+    post in post_table are requested. Posts of the last overlap are fetched
+    again anyway to update their details and to provide all recent posts to
+    dependent tasks. Every full_sync_interval days, all posts are fetched
+    (see FullSyncTask).
+    """
+
+    post_table = None
+
+    overlap = luigi.parameter.TimeDeltaParameter(
+        default=dt.timedelta(days=60),
+        description="For how much time known posts should be fetched again")
+
+    def since(self):
+        """Answer the UTC time of the oldest post to fetch, or None for all."""
+        if self.plan_full_sync():
+            logger.info("Fetching all posts")
+            return None
+
+        latest_post_date, = self.db_connector.query(
+            f'SELECT MAX(post_date) FROM {self.post_table}',
+            only_first=True)
+        if latest_post_date is None:
+            return None
+
+        since = min(latest_post_date, dt.datetime.utcnow() - self.overlap)
+        logger.info(f"Fetching posts since {since}")
+        return since.replace(tzinfo=dt.timezone.utc)
+
+
+class FetchFbPosts(FetchGraphApiPosts):
     """Fetch all Facebook post from the museum's profile page."""
 
+    post_table = 'fb_post'
+
     def requires(self):
 
         return MuseumFacts()
@@ -83,6 +149,9 @@ class FetchFbPosts(DataPreparationTask):
 
         limit = 100
         url = f'{API_BASE}/{page_id}/published_posts?limit={limit}'
+        since = self.since()
+        if since:
+            url += f'&since={int(since.timestamp())}'
 
         response = try_request_multiple_times(url)
         response_content = response.json()
@@ -106,25 +175,30 @@ class FetchFbPosts(DataPreparationTask):
 
     def transform_posts(self, posts):
 
+        columns = ['page_id', 'post_id', 'post_date', 'text']
         df = pd.DataFrame(posts)
+        if df.empty:
+            # no new posts since the last run
+            return pd.DataFrame(columns=columns)
         fb_post_ids = df['id'].str.split('_', n=1, expand=True)
         df = df.filter(['created_time', 'message'])
         df = fb_post_ids.join(df)
-        df.columns = ['page_id', 'post_id', 'post_date', 'text']
+        df.columns = columns
         return df
 
 
 class FetchFbPostDetails(DataPreparationTask):
-    """The abstract superclass for tasks fetching post-related information."""
+    """
+    The abstract superclass for tasks fetching post-related information.
+
+    All posts of the timespan are fetched again (see FetchGraphApiPosts), so
+    posts that are already known are not skipped.
+    """
 
     timespan = luigi.parameter.TimeDeltaParameter(
         default=dt.timedelta(days=60),
         description="For how much time posts should be fetched")
 
-    # Override the default timeout of 10 minutes to allow
-    # FetchFbPostPerformance to take up to 20 minutes.
-    worker_timeout = 1200
-
     def __init__(self, *args, **kwargs):
 
         super().__init__(*args, **kwargs)
@@ -139,7 +213,7 @@ class FetchFbPostDetails(DataPreparationTask):
 
     def requires(self):
 
-        return FetchFbPosts()
+        return FetchFbPosts(overlap=self.timespan)
 
     @staticmethod
     def post_date(df, index):
@@ -149,6 +223,13 @@ class FetchFbPostDetails(DataPreparationTask):
             '%Y-%m-%dT%H:%M:%S+%f'
         )
 
+    def relevant_posts(self, df):
+        """Answer the page and post IDs of all posts within the timespan."""
+        for index in df.index:
+            if self.post_date(df, index) < self.minimum_relevant_date:
+                continue
+            yield str(df['page_id'][index]), str(df['post_id'][index])
+
 
 class FetchFbPostPerformance(FetchFbPostDetails):
     """
@@ -174,40 +255,31 @@ class FetchFbPostPerformance(FetchFbPostDetails):
         if self.minimal_mode:
             df = df.head(5)
 
+        posts = list(self.relevant_posts(df))
+        metrics = ','.join([
+            'post_reactions_by_type_total',
+            'post_activity_by_action_type',
+            'post_clicks_by_type',
+            'post_negative_feedback',
+            'post_impressions_paid',
+            'post_impressions',
+            'post_impressions_unique'  # "reach"
+        ])
+        responses = request_batch([
+            f'{page_id}_{post_id}/insights?metric={metrics}'
+            for page_id, post_id in posts
+        ])
+
         invalid_count = 0
         pbar = self.tqdm(
-            df.index,
+            zip(posts, responses),
+            total=len(posts),
             desc="Fetching performance data for facebook posts"
         )
-        for index in pbar:
-            page_id, post_id = \
-                str(df['page_id'][index]), str(df['post_id'][index])
-            fb_post_id = f'{page_id}_{post_id}'
-            post_date = self.post_date(df, index)
-            if post_date < self.minimum_relevant_date:
-                continue
-
-            logger.debug(
-                f"Loading performance data for FB post {fb_post_id}")
-
-            metrics = ','.join([
-                'post_reactions_by_type_total',
-                'post_activity_by_action_type',
-                'post_clicks_by_type',
-                'post_negative_feedback',
-                'post_impressions_paid',
-                'post_impressions',
-                'post_impressions_unique'  # "reach"
-            ])
-            url = f'{API_BASE}/{fb_post_id}/insights?metric={metrics}'
-
-            response = try_request_multiple_times(url)
-
-            if response.status_code == 400:
+        for (page_id, post_id), response_content in pbar:
+            if response_content is None:
                 invalid_count += 1
                 continue
-            response.raise_for_status()  # in case of another error
-            response_content = response.json()
 
             post_perf = {
                 'timestamp': current_timestamp,
@@ -272,12 +344,84 @@ class FetchFbPostPerformance(FetchFbPostDetails):
             df.to_csv(output_file, index=False, header=True)
 
 
+class FetchFbPostCommentSummaries(FetchFbPostDetails):
+    """
+    Fetch the number of comments and the time of the latest comment.
+
+    The summaries of all posts are requested in batch requests. Comments are
+    only fetched for posts whose summary has changed since the last run (see
+    FetchFbPostComments).
+    """
+
+    def output(self):
+
+        return luigi.LocalTarget(
+            f'{self.output_dir}/facebook/fb_post_comment_summaries.csv',
+            format=UTF8)
+
+    def run(self):
+
+        with self.input().open('r') as csv_in:
+            df = pd.read_csv(csv_in)
+
+        if self.minimal_mode:
+            df = df.head(15)
+
+        # Posts can appear multiple times (see #227)
+        posts = list(dict.fromkeys(self.relevant_posts(df)))
+        # The latest comment or reply and the total number of them
+        fields = ('comments.filter(stream).order(reverse_chronological)'
+                  '.limit(1).summary(total_count){created_time}')
+        responses = request_batch([
+            f'{page_id}_{post_id}?fields={fields}'
+            for page_id, post_id in posts
+        ])
+
+        summaries = []
+        invalid_count = 0
+        for (page_id, post_id), response_content in zip(posts, responses):
+            if response_content is None:
+                invalid_count += 1
+                continue
+            comments = response_content.get('comments', {})
+            latest_comments = comments.get('data', [])
+            summaries.append({
+                'page_id': page_id,
+                'post_id': post_id,
+                'comment_count':
+                    comments.get('summary', {}).get('total_count', 0),
+                'last_comment_time':
+                    latest_comments[0]['created_time']
+                    if latest_comments else None
+            })
+        if invalid_count:
+            logger.warning(f"Skipped {invalid_count} posts")
+
+        df = pd.DataFrame(summaries, columns=[
+            'page_id',
+            'post_id',
+            'comment_count',
+            'last_comment_time'
+        ])
+        df = self.filter_fkey_violations(df)
+
+        with self.output().open('w') as output_file:
+            df.to_csv(output_file, index=False, header=True)
+
+
 class FetchFbPostComments(FetchFbPostDetails):
-    """Fetch all user comments to Facebook posts."""
+    """
+    Fetch all user comments to Facebook posts.
+
+    Only comments of posts whose comment summary has changed since the last
+    run are fetched.
+    """
 
     def requires(self):
 
-        yield super().requires()
+        yield FetchFbPostCommentSummaries(
+            table=FbPostCommentSummariesToDb.table,
+            timespan=self.timespan)
         yield MuseumFacts()
 
     def output(self):
@@ -289,16 +433,20 @@ class FetchFbPostComments(FetchFbPostDetails):
     def run(self):
 
         input_ = list(self.input())
-        with input_[0].open() as fb_post_file:
-            df = pd.read_csv(fb_post_file)
+        with input_[0].open() as summaries_file:
+            summaries = pd.read_csv(
+                summaries_file,
+                dtype={'page_id': str, 'post_id': str},
+                parse_dates=['last_comment_time'])
         with input_[1].open() as facts_file:
             self.facts = json.load(facts_file)
-        comments = []
 
-        if self.minimal_mode:
-            df = df.head(15)
+        posts = self.changed_posts(summaries)
+        logger.info(
+            f"Comments of {len(posts)} out of {len(summaries)} posts have "
+            f"changed")
 
-        comments = self.fetch_comments(df)
+        comments = self.fetch_comments(posts)
         df = pd.DataFrame(comments)
 
         if not df.empty:
@@ -337,46 +485,74 @@ class FetchFbPostComments(FetchFbPostDetails):
         with self.output().open('w') as output_file:
             df.to_csv(output_file, index=False, header=True)
 
-    def fetch_comments(self, df):
-
-        invalid_count = 0
-
-        # Handle each post
-        for i in df.index:
-            page_id, post_id = df['page_id'][i], df['post_id'][i]
-            fb_post_id = f'{page_id}_{post_id}'
-            post_date = self.post_date(df, i)
-            if post_date < self.minimum_relevant_date:
-                continue
-
-            # Grab up to 100 comments for the post (maximum)
-            limit = 100
-
-            # 'toplevel' or 'stream' (toplevel doesn't include replies)
-            # Using 'toplevel' here allows us to safely
-            # set parent to None for all comments returned
-            # by the first query
-            filt = 'toplevel'
+    def changed_posts(self, summaries):
+        """Answer all posts whose comment summary has changed."""
+        known_summaries = pd.DataFrame(
+            self.db_connector.query('''
+                SELECT page_id, post_id, comment_count, last_comment_time
+                FROM fb_post_comment_summary
+            '''),
+            columns=[
+                'page_id',
+                'post_id',
+                'comment_count',
+                'last_comment_time'
+            ])
+        summaries = summaries.merge(
+            known_summaries,
+            how='left',
+            on=['page_id', 'post_id'],
+            suffixes=('', '_known'))
+
+        last_comment_times = pd.to_datetime(
+            summaries['last_comment_time'], utc=True).dt.tz_localize(None)
+        known_last_comment_times = pd.to_datetime(
+            summaries['last_comment_time_known'])
+        changed = (summaries['comment_count'] > 0) & (
+            (summaries['comment_count']
+                != summaries['comment_count_known'])
+            | (last_comment_times != known_last_comment_times))
+
+        return list(zip(
+            summaries['page_id'][changed],
+            summaries['post_id'][changed]))
+
+    def fetch_comments(self, posts):
+
+        # Grab up to 100 comments per request (maximum)
+        limit = 100
 
-            # 'chronological' or 'reverse_chronolocial'
-            order = 'chronological'
+        # 'toplevel' or 'stream' (toplevel doesn't include replies)
+        # Using 'toplevel' here allows us to safely
+        # set parent to None for all comments returned
+        # by the first query
+        filt = 'toplevel'
+
+        # 'chronological' or 'reverse_chronolocial'
+        order = 'chronological'
+
+        fields = ','.join([
+            'id',
+            'created_time',
+            'comment_count',
+            'message',
+            'comments'
+            ])
 
-            fields = ','.join([
-                'id',
-                'created_time',
-                'comment_count',
-                'message',
-                'comments'
-                ])
+        responses = request_batch([
+            f'{page_id}_{post_id}/comments?limit={limit}'
+            f'&filter={filt}&order={order}&fields={fields}'
+            for page_id, post_id in posts
+        ])
 
-            url = (f'{API_BASE}/{fb_post_id}/comments?limit={limit}'
-                   f'filter={filt}&order={order}&fields={fields}')
+        invalid_count = 0
 
-            response = try_request_multiple_times(url)
-            if response.status_code == 400:
+        # Handle each post
+        for (page_id, post_id), response_content in zip(posts, responses):
+            if response_content is None:
                 invalid_count += 1
                 continue
-            response_data = response.json().get('data')
+            response_data = list(paginate(response_content))
 
             logger.info(f"Fetched {len(response_data)} "
                         f"comments for post {post_id}")
@@ -399,7 +575,7 @@ class FetchFbPostComments(FetchFbPostDetails):
                     continue
                 try:
                     # Handle each reply for the comment
-                    for reply in comment['comments']['data']:
+                    for reply in paginate(comment['comments']):
                         yield {
                             'comment_id': reply.get('id').split('_')[1],
                             'page_id': str(page_id),
@@ -425,43 +601,297 @@ class FetchFbPostComments(FetchFbPostDetails):
         return comment_json.get('from', {}).get('name') == self.facts['name']
 
 
-def try_request_multiple_times(url, **kwargs):
+def request_batch(relative_urls, max_workers=MAX_CONCURRENT_BATCHES):
+    """
+    Request many objects from the Facebook Graph API in batch requests.
+
+    Up to BATCH_SIZE relative URLs (e.g., '<post_id>/insights?metric=...') are
+    combined into a single request, and up to max_workers batch requests are
+    sent concurrently. Yield the decoded response for every URL in the same
+    order, or None if the object cannot be accessed (i.e., the API answers
+    400, usually because it is a foreign object). Sub-requests that were not
+    processed by the API (e.g., due to a timeout or a rate limit) are retried
+    individually.
+    """
+    chunks = [
+        relative_urls[start:start + BATCH_SIZE]
+        for start in range(0, len(relative_urls), BATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for results in executor.map(_request_batch_chunk, chunks):
+            yield from results
+
+
+def _request_batch_chunk(urls):
+
+    response = try_request_multiple_times(
+        API_BASE,
+        method='post',
+        data={
+            'batch': json.dumps([
+                {'method': 'GET', 'relative_url': url}
+                for url in urls
+            ]),
+            'include_headers': 'false'
+        })
+    response.raise_for_status()
+
+    results = []
+    for url, result in zip(urls, response.json()):
+        if result is None or GRAPH_API.is_transient_error(
+                result['code'], result['body']):
+            logger.warning(f"Retrying unprocessed batch request {url}")
+            single_response = try_request_multiple_times(f'{API_BASE}/{url}')
+            status_code, body = \
+                single_response.status_code, single_response.text
+        else:
+            status_code, body = result['code'], result['body']
+
+        if status_code == 400:
+            logger.debug(f"Cannot access {url}: {body}")
+            results.append(None)
+            continue
+        if status_code >= 400:
+            raise requests.HTTPError(
+                f"{status_code} Error in batch request for {url}: {body}")
+        results.append(json.loads(body))
+    return results
+
+
+def paginate(response_content):
+    """Yield all items of a paged response, following the next pages."""
+    while True:
+        yield from response_content.get('data', [])
+        next_url = response_content.get('paging', {}).get('next')
+        if not next_url:
+            return
+        response_content = try_request_multiple_times(next_url).json()
+
+
+def try_request_multiple_times(url, method='get', **kwargs):
     """
     Try multiple request to the Facebook Graph API.
 
     Not all requests to the API are successful. To allow some requests to fail
-    (mainly: to time out), request the API up to four times.
+    (mainly: to time out), the request is repeated (see GraphApiClient).
     """
-    headers = kwargs.pop('headers', None)
-    if not headers:
-        access_token = os.getenv('FB_ACCESS_TOKEN')
-        if not access_token:
-            raise EnvironmentError("FB Access token is not set")
-        headers = {'Authorization': 'Bearer ' + access_token}
-
-    for _ in range(3):
-        try:
-            response = requests.get(
-                url,
-                timeout=60,
-                headers=headers,
-                **kwargs)
-            response.raise_for_status()
-            return response
-        except requests.RequestException as e:
+    return GRAPH_API.request(url, method, **kwargs)
+
+
+class GraphApiClient:
+    """
+    A client for the Facebook Graph API that is shared by all fetch tasks.
+
+    All requests are sent through a keep-alive session. Failed requests
+    (timeouts, server errors, and rate limit errors) are repeated after an
+    exponential backoff with jitter. If the usage headers of the API report
+    that the rate limits are approached, the following requests are delayed.
+    Request metrics are logged after every task (see log_graph_api_metrics).
+    """
+
+    # Error codes of the Graph API reporting exceeded rate limits
+    RATE_LIMIT_CODES = {4, 17, 32, 613, *range(80000, 80015)}
+    USAGE_HEADERS = [
+        'X-App-Usage',
+        'X-Page-Usage',
+        'X-Business-Use-Case-Usage'
+    ]
+    METRICS = [
+        'requests',
+        'retries',
+        'bytes',
+        'backoff_seconds',
+        'throttle_seconds'
+    ]
+
+    def __init__(
+            self,
+            max_tries=4,
+            timeout=60,
+            last_timeout=100,
+            backoff_base=1,
+            backoff_cap=60,
+            throttle_threshold=75,
+            max_throttle_delay=60,
+            pool_size=10):
+        self.max_tries = max_tries
+        self.timeout = timeout
+        self.last_timeout = last_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.throttle_threshold = throttle_threshold
+        self.max_throttle_delay = max_throttle_delay
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.lock = threading.Lock()
+        self.throttle_until = 0
+        self.metrics, self.latencies = dict.fromkeys(self.METRICS, 0), []
+
+    def request(self, url, method='get', **kwargs):
+        """
+        Request the API and answer the response.
+
+        Responses with status 400 are answered as well because they indicate
+        that an object cannot be accessed (e.g., because it is a foreign
+        object). For any other error, an HTTPError is raised.
+        """
+        headers = kwargs.pop('headers', None)
+        if not headers:
+            access_token = os.getenv('FB_ACCESS_TOKEN')
+            if not access_token:
+                raise EnvironmentError("FB Access token is not set")
+            headers = {'Authorization': 'Bearer ' + access_token}
+
+        for attempt in range(self.max_tries):
+            is_last = attempt == self.max_tries - 1
+            self.wait_for_throttle()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    timeout=self.last_timeout if is_last else self.timeout,
+                    headers=headers,
+                    **kwargs)
+            except requests.RequestException as e:
+                if is_last:
+                    raise
+                error = e
+            else:
+                self.record(response, time.perf_counter() - start)
+                self.throttle(response)
+                if is_last or not self.is_transient_error(
+                        response.status_code, response.text):
+                    break
+                error = f"{response.status_code}: {response.text}"
+
+            delay = self.backoff(attempt)
             logger.error(
                 "An Error occurred requesting the Facebook API.\n"
-                "Trying to request the API again.\n"
-                f"Error message: {e}"
+                f"Trying to request the API again in {delay:.1f} seconds.\n"
+                f"Error message: {error}"
             )
-    response = requests.get(url, timeout=100, headers=headers, **kwargs)
-
-    # cause clear error instead of trying
-    # to process the invalid response
-    # (except if we tried to access a foreign object)
-    if not response.ok and not response.status_code == 400:
-        response.raise_for_status()
-    return response
+            with self.lock:
+                self.metrics['retries'] += 1
+                self.metrics['backoff_seconds'] += delay
+            time.sleep(delay)
+
+        # cause clear error instead of trying
+        # to process the invalid response
+        # (except if we tried to access a foreign object)
+        if not response.ok and (
+                response.status_code != 400
+                or self.is_transient_error(
+                    response.status_code, response.text)):
+            response.raise_for_status()
+        return response
+
+    def is_transient_error(self, status_code, body):
+        """Answer whether a request with this response should be repeated."""
+        if status_code >= 500 or status_code == 429:
+            return True
+        if status_code != 400:
+            return False
+        try:
+            code = json.loads(body)['error']['code']
+        except (ValueError, KeyError, TypeError):
+            return False
+        return code in self.RATE_LIMIT_CODES
+
+    def backoff(self, attempt):
+        """Answer a delay for the attempt using exponential full jitter."""
+        return random.uniform(  # nosec: not used for security purposes
+            0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def usage(self, response):
+        """
+        Answer the highest usage of any rate limit reported by the API.
+
+        Answer a tuple of the usage in percent and the number of seconds
+        until the access will be regained if the rate limit is exceeded.
+        """
+        usage, regain_seconds = 0, 0
+        for header in self.USAGE_HEADERS:
+            try:
+                values = json.loads(response.headers.get(header, '{}'))
+            except ValueError:
+                continue
+            if header == 'X-Business-Use-Case-Usage':
+                # {business_id: [{type, call_count, ...}, ...]}
+                values = [
+                    value
+                    for business_values in values.values()
+                    for value in business_values
+                ]
+            else:
+                values = [values]
+            for value in values:
+                usage = max(usage, *(
+                    value.get(key, 0)
+                    for key in ['call_count', 'total_time', 'total_cputime']
+                ))
+                regain_seconds = max(
+                    regain_seconds,
+                    value.get('estimated_time_to_regain_access', 0) * 60)
+        return usage, regain_seconds
+
+    def throttle(self, response):
+        """Delay the following requests if the rate limits are approached."""
+        usage, regain_seconds = self.usage(response)
+        if usage < self.throttle_threshold and not regain_seconds:
+            return
+        delay = max(regain_seconds, self.max_throttle_delay * min(1, (
+            (usage - self.throttle_threshold)
+            / (100 - self.throttle_threshold))))
+        logger.warning(
+            f"Graph API usage is at {usage}%, delaying the next requests "
+            f"by {delay:.1f} seconds")
+        with self.lock:
+            self.throttle_until = max(
+                self.throttle_until, time.monotonic() + delay)
+
+    def wait_for_throttle(self):
+        delay = self.throttle_until - time.monotonic()
+        if delay <= 0:
+            return
+        with self.lock:
+            self.metrics['throttle_seconds'] += delay
+        time.sleep(delay)
+
+    def record(self, response, latency):
+        with self.lock:
+            self.metrics['requests'] += 1
+            self.metrics['bytes'] += len(response.content)
+            self.latencies.append(latency)
+
+    def reset_metrics(self):
+        """Reset the metrics and answer the previous metrics."""
+        with self.lock:
+            metrics, latencies = self.metrics, self.latencies
+            self.metrics, self.latencies = dict.fromkeys(self.METRICS, 0), []
+        for percentile in [50, 90, 99]:
+            metrics[f'latency_p{percentile}'] = \
+                float(np.percentile(latencies, percentile)) \
+                if latencies else None
+        return metrics
+
+
+GRAPH_API = GraphApiClient()
+
+
+@DataPreparationTask.event_handler(luigi.Event.SUCCESS)
+@DataPreparationTask.event_handler(luigi.Event.FAILURE)
+def log_graph_api_metrics(task, *args):
+    """Log the metrics of all Graph API requests made by the task."""
+    metrics = GRAPH_API.reset_metrics()
+    if not metrics['requests']:
+        return
+    logger.info(f"Graph API metrics for {task}: {json.dumps(metrics)}")
 
 
 def _num_to_str(num):
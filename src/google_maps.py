@@ -9,7 +9,7 @@ import oauth2client.client
 import pandas as pd
 from oauth2client.file import Storage
 
-from _utils import CsvToDb, DataPreparationTask, logger
+from _utils import CsvToDb, FullSyncTask, logger
 
 
 class GoogleMapsReviewsToDb(CsvToDb):
@@ -22,11 +22,14 @@ class GoogleMapsReviewsToDb(CsvToDb):
         return FetchGoogleMapsReviews()
 
 
-class FetchGoogleMapsReviews(DataPreparationTask):
+class FetchGoogleMapsReviews(FullSyncTask):
     """
     Fetch reviews about the museum from Google Maps.
 
-    Data are fetched using the Google My Business API.
+    Data are fetched using the Google My Business API. Reviews are requested
+    from the most recently updated one, and no further pages are requested
+    once a page only contains known and unchanged reviews. Every
+    full_sync_interval days, all reviews are fetched (see FullSyncTask).
     """
 
     # secret_files is a folder mounted from
@@ -67,7 +70,9 @@ class FetchGoogleMapsReviews(DataPreparationTask):
             logger.info("creating service...")
             service = self.load_service(credentials)
             logger.info("fetching reviews...")
-            raw_reviews = list(self.fetch_raw_reviews(service))
+            raw_reviews = list(self.fetch_raw_reviews(
+                service,
+                known_reviews=self.load_known_reviews()))
         except googleapiclient.errors.HttpError as error:
             if error.resp.status is not None:
                 raise
@@ -75,6 +80,7 @@ class FetchGoogleMapsReviews(DataPreparationTask):
                          "If you see this error message frequently, consider "
                          "to do something against it.")
             raw_reviews = []
+            self.cancel_full_syncs()
         logger.info("extracting reviews...")
         reviews_df = self.extract_reviews(raw_reviews)
         logger.info("success! writing...")
@@ -123,14 +129,45 @@ class FetchGoogleMapsReviews(DataPreparationTask):
             credentials=credentials,
             discoveryServiceUrl=self.google_gmb_discovery_url)
 
-    def fetch_raw_reviews(self, service, page_size=100):
+    def load_known_reviews(self):
+        """
+        Answer the rating and text of all stored reviews by their ID.
+
+        Answer an empty dict if all reviews should be fetched.
+        """
+        if self.plan_full_sync():
+            logger.info("Fetching all reviews")
+            return {}
+
+        return {
+            review_id: (rating, text)
+            for review_id, rating, text in self.db_connector.query('''
+                SELECT google_maps_review_id, rating, text
+                FROM google_maps_review
+            ''')
+        }
+
+    def fetch_raw_reviews(self, service, page_size=100, known_reviews=None):
         """
         Fetch raw reviews from the Google My Business API.
 
         The GMB API is based on resources that contain other resources.
         An authenticated user has account(s), an accounts contains locations,
         and a location contains reviews (which we need to request one by one).
+
+        known_reviews maps the IDs of reviews to their rating and text (see
+        load_known_reviews()). Reviews are sorted by their update time, so
+        once a page only contains known and unchanged reviews, all following
+        pages are known as well and will not be requested.
         """
+        def is_known(review):
+            extracted = self.extract_review(review)
+            return known_reviews.get(review['reviewId']) \
+                == (extracted['rating'], extracted['text'])
+
+        def is_complete(reviews):
+            return known_reviews and all(map(is_known, reviews))
+
         # get account identifier
         account_list = service.accounts().list().execute()
         # in almost all cases one only has access to one account
@@ -151,12 +188,17 @@ class FetchGoogleMapsReviews(DataPreparationTask):
         # get reviews for that location
         review_list = service.accounts().locations().reviews().list(
             parent=location,
-            pageSize=page_size).execute()
-        yield from [
+            pageSize=page_size,
+            orderBy='updateTime desc').execute()
+        reviews = [
             {**review, 'placeId': place_id}
             for review
             in review_list['reviews']
         ]
+        yield from reviews
+        if is_complete(reviews):
+            logger.info("No new reviews beyond the first page")
+            return
         total_reviews = review_list['totalReviewCount']
 
         pbar_loop = iter(self.tqdm(
@@ -165,20 +207,27 @@ class FetchGoogleMapsReviews(DataPreparationTask):
         ))
         while 'nextPageToken' in review_list:
             next_page_token = review_list['nextPageToken']
-            # TODO: optimize by requesting the latest review from DB rather
-            # than fetching more pages once that one is found
             review_list = service.accounts().locations().reviews().list(
                 parent=location,
                 pageSize=page_size,
+                orderBy='updateTime desc',
                 pageToken=next_page_token).execute()
             try:
-                reviews = review_list['reviews']
+                reviews = [
+                    {**review, 'placeId': place_id}
+                    for review
+                    in review_list['reviews']
+                ]
             except KeyError:
                 break
 
             for review in reviews:
                 next(pbar_loop)
-                yield {**review, 'placeId': place_id}
+                yield review
+
+            if is_complete(reviews):
+                logger.info("Found only known reviews, stopping now")
+                break
 
             if self.minimal_mode:
                 review_list.pop('nextPageToken')
@@ -7,9 +7,9 @@ import pandas as pd
 import random
 import requests
 
-from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 
-from _utils import CsvToDb, DataPreparationTask, MuseumFacts
+from _utils import CsvToDb, FullSyncTask, MuseumFacts, logger
 
 
 class GooglePlaystoreReviewsToDb(CsvToDb):
@@ -22,8 +22,18 @@ class GooglePlaystoreReviewsToDb(CsvToDb):
         return FetchGplayReviews()
 
 
-class FetchGplayReviews(DataPreparationTask):
-    """Fetch Google Play reviews."""
+class FetchGplayReviews(FullSyncTask):
+    """
+    Fetch Google Play reviews.
+
+    Reviews are fetched for multiple languages concurrently. Only reviews
+    newer than the latest stored review of the app are fetched. Every
+    full_sync_interval days, all reviews are fetched (see FullSyncTask).
+    """
+
+    max_workers = 4
+    # number of reviews to request first when fetching new reviews only
+    incremental_num = 100
 
     def __init__(self, *args, **kwargs):
 
@@ -39,7 +49,8 @@ class FetchGplayReviews(DataPreparationTask):
         'text': 'text',
         'thumbsUp': 'likes',
         'version': 'app_version',
-        'app_id': 'app_id'
+        'app_id': 'app_id',
+        'language': 'language'
     }
 
     def requires(self):
@@ -74,52 +85,111 @@ class FetchGplayReviews(DataPreparationTask):
                 *language_codes[random_num:random_num + 2],
                 'de'  # make sure we do not get zero reviews
             })
-
-        reviews_nested = [
-            self.fetch_for_language(language_code)
-            for language_code in language_codes
-        ]
-        reviews_flattened = list(chain.from_iterable(reviews_nested))
-        reviews_df = pd.DataFrame(
-            reviews_flattened,
+        # Every review is stored only once with the first language that
+        # returned it, so the latest review of a language does not tell
+        # whether that language has been fetched. All languages are fetched
+        # in every run, though, so share the watermark between them. This
+        # also makes every language return the same new reviews as during a
+        # full sync so that the stored languages remain stable.
+        latest_date = self.load_latest_date()
+
+        def fetch(language_code):
+            return list(self.fetch_for_language(
+                language_code,
+                since=latest_date))
+
+        # drop duplicates as soon as the reviews of a language arrive
+        review_ids = set()
+        reviews = []
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            for language_reviews in executor.map(fetch, language_codes):
+                for review in language_reviews:
+                    if review['id'] in review_ids:
+                        continue
+                    review_ids.add(review['id'])
+                    reviews.append(review)
+
+        return pd.DataFrame(
+            reviews,
             columns=self.column_names.keys()
         )
-        return reviews_df.drop_duplicates()
+
+    def load_latest_date(self):
+        """
+        Answer the date of the latest stored review of the app.
+
+        Answer None if all reviews should be fetched.
+        """
+        if self.plan_full_sync():
+            logger.info("Fetching all reviews")
+            return None
+
+        return self.db_connector.query(f'''
+            SELECT MAX(post_date)
+            FROM gplay_review
+            WHERE app_id = '{self.app_id}'
+        ''', only_first=True)[0]
 
     def load_language_codes(self):
 
         language_codes_df = pd.read_csv('src/gplay/language_codes_gplay.csv')
         return language_codes_df['code'].to_list()
 
-    def fetch_for_language(self, language_code):
+    def fetch_for_language(self, language_code, since=None):
         """
         Request reviews for a specific language from the gplay webserver.
 
+        If since is given, only reviews from this date on are answered. The
+        gplay api cannot filter reviews by date, but it answers the newest
+        reviews first. Thus, increasing numbers of reviews are requested
+        until the oldest review is older than since.
+
         Note: If the language_code is not supported, the gplay api returns
         english reviews.
         """
-        response = requests.get(
-            url=self.url,
-            params={
-                'lang': language_code,
-                # max number of reviews to be fetched. We want all reviews.
-                'num': 1000000 if not self.minimal_mode else 12
-            }
-        )
-        response.raise_for_status()
-
-        reviews = response.json()['results']
+        # max number of reviews to be fetched. We want all reviews.
+        max_num = 1000000 if not self.minimal_mode else 12
+        num = min(self.incremental_num, max_num) if since else max_num
+
+        while True:
+            response = requests.get(
+                url=self.url,
+                params={
+                    'lang': language_code,
+                    'num': num
+                }
+            )
+            response.raise_for_status()
+
+            reviews = response.json()['results']
+            if not since:
+                break
+            dates = [self.parse_date(review['date']) for review in reviews]
+            if len(reviews) < num or num >= max_num or min(dates) < since:
+                reviews = [
+                    review
+                    for review, date in zip(reviews, dates)
+                    if date >= since
+                ]
+                break
+            num = min(num * 10, max_num)
 
         for review in reviews:
             yield {
                 **{
                     key: review[key]
                     for key in self.column_names
-                    if key != 'app_id'
+                    if key not in {'app_id', 'language'}
                 },
-                'app_id': self.app_id
+                'app_id': self.app_id,
+                'language': language_code
             }
 
+    @staticmethod
+    def parse_date(date):
+        """Parse the date of a review into a naive UTC datetime."""
+        return pd.Timestamp(date).tz_convert(None).to_pydatetime()
+
     @property
     def url(self):
         """
@@ -166,7 +236,8 @@ class FetchGplayReviews(DataPreparationTask):
             'app_version': str,
             'likes': int,
             'date': str,
-            'app_id': str
+            'app_id': str,
+            'language': str
         }
         reviews = reviews[columns.keys()]
         reviews = reviews.astype(columns)
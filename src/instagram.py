@@ -17,7 +17,8 @@ from luigi.format import UTF8
 
 from _utils import CsvToDb, DataPreparationTask, MuseumFacts, logger
 from _utils.data_preparation import PerformanceValueCondenser
-from facebook import API_BASE, try_request_multiple_times
+from facebook import API_BASE, FetchGraphApiPosts, request_batch, \
+    try_request_multiple_times
 
 
 # =============== Database Tasks ===============
@@ -110,9 +111,11 @@ class IgAudienceGenderAgeToDb(CsvToDb):
 # =============== DataPreparation Tasks ===============
 
 
-class FetchIgPosts(DataPreparationTask):
+class FetchIgPosts(FetchGraphApiPosts):
     """Request all instagram posts from the Facebook Graph API."""
 
+    post_table = 'ig_post'
+
     columns = {
         'id': str,
         'caption': str,
@@ -149,6 +152,13 @@ class FetchIgPosts(DataPreparationTask):
         media_url = (f'{API_BASE}/{page_id}/media'
                      f'?fields={fields}&limit={limit}')
 
+        # The media edge does not support time-based pagination, but media
+        # are sorted from newest to oldest, so stop at the first older post
+        since = self.since()
+
+        def is_known(media):
+            return since and dtparser.parse(media['timestamp']) < since
+
         response = try_request_multiple_times(media_url)
         response_json = response.json()
 
@@ -156,7 +166,8 @@ class FetchIgPosts(DataPreparationTask):
         all_media.extend(response_json['data'])
 
         logger.info("Fetching Instagram posts ...")
-        while 'next' in response_json['paging']:
+        while 'next' in response_json['paging'] \
+                and not (all_media and is_known(all_media[-1])):
             next_url = response_json['paging']['next']
             response = try_request_multiple_times(next_url)
             response_json = response.json()
@@ -179,21 +190,29 @@ class FetchIgPosts(DataPreparationTask):
 
         logger.info("Fetching of Instagram posts complete")
 
-        df = pd.DataFrame([
-            {
-                column: adapter(media[column])
-                for (column, adapter)
-                in self.columns.items()
-            }
-            for media
-            in all_media
-        ])
+        df = pd.DataFrame(
+            [
+                {
+                    column: adapter(media[column])
+                    for (column, adapter)
+                    in self.columns.items()
+                }
+                for media
+                in all_media
+                if not is_known(media)
+            ],
+            columns=list(self.columns))
         with self.output().open('w') as output_file:
             df.to_csv(output_file, index=False, header=True)
 
 
 class FetchIgPostPerformance(DataPreparationTask):
-    """Fetch performance values for all fetched Instagram posts."""
+    """
+    Fetch performance values for all fetched Instagram posts.
+
+    All posts of the timespan are fetched again (see FetchGraphApiPosts), so
+    posts that are already known are not skipped.
+    """
 
     columns = luigi.parameter.ListParameter(description="Column names")
     timespan = luigi.parameter.TimeDeltaParameter(
@@ -209,7 +228,7 @@ class FetchIgPostPerformance(DataPreparationTask):
         ])
 
     def requires(self):
-        return FetchIgPosts()
+        return FetchIgPosts(overlap=self.timespan)
 
     def output(self):
         return luigi.LocalTarget(
@@ -230,29 +249,40 @@ class FetchIgPostPerformance(DataPreparationTask):
             'saved'
         ]
 
-        performance_df = pd.DataFrame(columns=[
-            column for column in self.columns
-            if not column.startswith('delta_')])
-
         fetch_time = dt.datetime.now()
-        for i, row in self.tqdm(
-                post_df.iterrows(),
-                desc="Fetching insights for instagram posts",
-                total=len(post_df)):
-            # Fetch only insights for less than 2 months old posts
-            post_time = dtparser.parse(row['timestamp'])
-            if post_time.date() < \
-               fetch_time.date() - self.timespan:
-                continue
-
+        # Fetch only insights for less than 2 months old posts
+        post_df = post_df.loc[[
+            dtparser.parse(timestamp).date()
+            >= fetch_time.date() - self.timespan
+            for timestamp in post_df['timestamp']
+        ]]
+        # The type was lost during CSV conversion
+        post_ids = post_df['id'].astype(str).tolist()
+        is_video = (post_df['media_type'] == 'VIDEO').tolist()
+
+        urls = []
+        for post_id, video in zip(post_ids, is_video):
             metrics = ','.join(generic_metrics)
-            if row['media_type'] == 'VIDEO':
+            if video:
                 metrics += ',video_views'  # causes error if used on non-video
+            urls.append(f'{post_id}/insights?metric={metrics}')
 
-            url = f'{API_BASE}/{row["id"]}/insights?metric={metrics}'
+        # accumulate values in lists because appending rows to a data frame
+        # reallocates it every time
+        columns = [
+            column for column in self.columns
+            if not column.startswith('delta_')]
+        values = {column: [] for column in columns}
 
-            response = try_request_multiple_times(url)
-            response_data = response.json()['data']
+        invalid_count = 0
+        for post_id, video, response_content in self.tqdm(
+                zip(post_ids, is_video, request_batch(urls)),
+                desc="Fetching insights for instagram posts",
+                total=len(urls)):
+            if response_content is None:
+                invalid_count += 1
+                continue
+            response_data = response_content['data']
 
             impressions = response_data[0]['values'][0]['value']
             reach = response_data[1]['values'][0]['value']
@@ -260,18 +290,24 @@ class FetchIgPostPerformance(DataPreparationTask):
             saved = response_data[3]['values'][0]['value']
 
             video_views = response_data[4]['values'][0]['value']\
-                if row['media_type'] == 'VIDEO'\
+                if video\
                 else 0  # for non-video posts
 
-            performance_df.loc[i] = [
-                str(row['id']),  # The type was lost during CSV conversion
+            for column, value in zip(columns, [
+                post_id,
                 fetch_time,
                 impressions,
                 reach,
                 engagement,
                 saved,
                 video_views
-            ]
+            ]):
+                values[column].append(value)
+
+        performance_df = pd.DataFrame(values, columns=columns)
+
+        if invalid_count:
+            logger.warning(f"Skipped {invalid_count} posts")
 
         performance_df = self.filter_fkey_violations(performance_df)
         performance_df = self.condense_performance_values(
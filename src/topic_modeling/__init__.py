@@ -0,0 +1,624 @@
+"""
+Provides tasks for assigning semantic topics to each posts in the database.
+
+Flow of control
+--------------
+
+                  TopicModeling()
+                         |
+                         |
+              TopicModelingModelsToDb
+                         |
+                         |
+               TopicModelingModelsDf
+            |            |            |
+            |            |            |
+TopicModelingTextsToDb   |   TopicModelingTopicsToDb
+            |            |            |
+            |            |            |
+TopicModelingTextsDf     |   TopicModelingTopicsDf
+            |            |            |
+            |            |            |
+              TopicModelingFindTopics()
+                  |
+                  |
+      TopicModelingPreprocessCorpus()
+                  |            |
+                  |   TopicModelingLanguagesToDb
+                  |            |
+                  |   TopicModelingDetectLanguages
+                  |            |
+       TopicModelingCreateCorpus()
+
+Corpora are passed between the tasks in a columnar format, see corpus.py.
+
+Incremental Training
+--------------------
+Closed years do not change, so models are only retrained if their input has
+changed. The hash of the corpus of every model is stored in the table
+topic_modeling.model. TopicModelingFindTopics only trains models whose hash
+differs from the stored one, and the ToDb tasks only replace the rows of
+these models. Use --full-retrain to retrain all models.
+
+Minimal Mode
+------------
+The topic modeling does not need to be adapted for the
+minimal mode. Other tasks only fetch few posts in minimal
+runs. Therefore the topic modeling is also very fast in
+the minimal runs.
+This only applies if the minimal run uses a fresh test database.
+"""
+
+from collections import Counter
+from functools import partial
+import hashlib
+import heapq
+from itertools import chain, compress
+from operator import itemgetter
+from typing import Callable, FrozenSet, Iterable, List, Tuple
+
+import luigi
+from luigi.format import UTF8
+from nltk.tokenize import word_tokenize
+import pandas as pd
+from stop_words import get_stop_words
+
+from _utils import CsvToDb, DataPreparationTask, logger, parallel_map
+from _posts import PostsToDb
+from .corpus import Corpus, Doc
+from .gsdmm import GSDMM
+from .languages import detect_languages
+
+
+class TopicModeling(luigi.WrapperTask):
+    """Run all topic modeling tasks."""
+
+    full_retrain = luigi.BoolParameter(
+        default=False,
+        description="See TopicModelingFindTopics")
+
+    def requires(self):
+        yield TopicModelingModelsToDb(full_retrain=self.full_retrain)
+
+
+class TopicModelingModelsToDb(CsvToDb):
+    """
+    Store the corpus hashes of all current models into the database.
+
+    The hashes are only stored after the results of the models have been
+    written so that interrupted runs do not skip any retraining.
+    """
+
+    table = 'topic_modeling.model'
+
+    replace_content = True
+
+    full_retrain = luigi.BoolParameter(
+        default=False,
+        description="See TopicModelingFindTopics")
+
+    def requires(self):
+
+        return TopicModelingModelsDf(full_retrain=self.full_retrain)
+
+
+class TopicModelingModelsDf(DataPreparationTask):
+    """Helper task to store the model hashes after the model results."""
+
+    full_retrain = luigi.BoolParameter(
+        default=False,
+        description="See TopicModelingFindTopics")
+
+    def requires(self):
+        return {
+            'models': TopicModelingFindTopics(full_retrain=self.full_retrain),
+            'texts': TopicModelingTextsToDb(full_retrain=self.full_retrain),
+            'topics': TopicModelingTopicsToDb(full_retrain=self.full_retrain)
+        }
+
+    def output(self):
+        return luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/models_2.csv',
+            format=UTF8
+        )
+
+    def run(self):
+
+        with list(self.input()['models'])[2].open('r') as models_file:
+            data = pd.read_csv(models_file, dtype={'model_name': str})
+        with self.output().open('w') as output_file:
+            data[['model_name', 'corpus_hash']].to_csv(
+                output_file, index=False)
+
+
+class TopicModelingTopicsDf(DataPreparationTask):
+    """
+    Helper task to provide a single output target for the downstream task.
+
+    TODO: Suspicious. Do we need it?
+    """
+
+    full_retrain = luigi.BoolParameter(
+        default=False,
+        description="See TopicModelingFindTopics")
+
+    def requires(self):
+        return TopicModelingFindTopics(full_retrain=self.full_retrain)
+
+    def output(self):
+        return luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/topics_2.csv',
+            format=UTF8
+        )
+
+    def run(self):
+
+        with list(self.input())[0].open('r') as topics_file:
+            data = pd.read_csv(topics_file)
+        with self.output().open('w') as output_file:
+            data.to_csv(output_file, index=False)
+
+
+class TopicModelingTextDf(DataPreparationTask):
+    """
+    Helper task to provide a single output target for the downstream task.
+
+    TODO: Suspicious. Do we need it?
+    """
+
+    full_retrain = luigi.BoolParameter(
+        default=False,
+        description="See TopicModelingFindTopics")
+
+    def requires(self):
+        return TopicModelingFindTopics(full_retrain=self.full_retrain)
+
+    def output(self):
+        return luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/text_2.csv',
+            format=UTF8
+        )
+
+    def run(self):
+
+        with list(self.input())[1].open('r') as text_file:
+            data = pd.read_csv(text_file)
+        with self.output().open('w') as output_file:
+            data.to_csv(output_file, index=False)
+
+
+class TopicModelingPartitionsToDb(CsvToDb):
+    """
+    Replace the rows of all retrained or removed models in the database.
+
+    Rows of models that have not been retrained are kept.
+    """
+
+    """The column that contains the model name."""
+    model_column = 'model_name'
+
+    """The task that provides the rows to be stored."""
+    data: Callable[..., DataPreparationTask]
+
+    full_retrain = luigi.BoolParameter(
+        default=False,
+        description="See TopicModelingFindTopics")
+
+    def requires(self):
+        return {
+            'data': self.data(full_retrain=self.full_retrain),
+            'models': TopicModelingFindTopics(full_retrain=self.full_retrain)
+        }
+
+    def read_csv(self, input_csv):
+
+        return super().read_csv(input_csv['data'])
+
+    def copy(self, cursor, file):
+
+        with list(self.input()['models'])[2].open('r') as models_file:
+            models = pd.read_csv(models_file, dtype={'model_name': str})
+        cursor.execute(
+            f'''
+                DELETE FROM {self.table}
+                WHERE {self.model_column} <> ALL(%s)
+                    OR {self.model_column} = ANY(%s)
+            ''',
+            (
+                list(models['model_name']),
+                list(models['model_name'][models['retrained']])
+            ))
+
+        super().copy(cursor, file)
+
+
+class TopicModelingTextsToDb(TopicModelingPartitionsToDb):
+    """
+    Store all text comments associated to a topic into the database.
+
+    The table topic_modeling.topic_text assigns one topic to each text comment
+    for each model (if the text comment is withing the timespan the model was
+    constructed for).
+    """
+
+    table = 'topic_modeling.topic_text'
+
+    data = TopicModelingTextDf
+
+
+class TopicModelingTopicsToDb(TopicModelingPartitionsToDb):
+    """
+    Store all identified topics into the database.
+
+    The table topic_modeling.topic contains the most frequent terms for each
+    topic and each model.
+    """
+
+    table = 'topic_modeling.topic'
+
+    model_column = 'model'
+
+    data = TopicModelingTopicsDf
+
+
+class TopicModelingFindTopics(DataPreparationTask):
+    """
+    Train a series of topic models and generate predictions.
+
+    For each year we train one model. We use the model to
+    generate predictions only for the posts in the year
+    the model was trained for. There is also one model that
+    takes into account all posts.
+
+    The algorithm we use is the 'Gibbs Sampling algorithm for the
+    Dirichlet Multinomial Mixture model' (GSDMM). This algorithms
+    is designed specifically for short text topic modeling. Link to the paper:
+    http://dbgroup.cs.tsinghua.edu.cn/wangjy/papers/KDD14-GSDMM.pdf
+    For our implementation, see gsdmm.py.
+
+    Models whose corpus has not changed since their results were stored are
+    not retrained (see Incremental Training above). The third output lists
+    the hashes of all current models and whether they have been retrained.
+    """
+
+    full_retrain = luigi.BoolParameter(
+        default=False,
+        description="If True, all models will be retrained even if their "
+                    "corpus has not changed")
+
+    def requires(self):
+        return TopicModelingPreprocessCorpus()
+
+    def output(self):
+        yield luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/topics.csv',
+            format=UTF8
+        )
+        yield luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/texts.csv',
+            format=UTF8
+        )
+        yield luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/models.csv',
+            format=UTF8
+        )
+
+    def run(self):
+
+        corpus = Corpus.load(self.input().path)
+
+        terms_df, texts_df, models_df = self.find_topics(list(corpus))
+
+        output_files = self.output()
+        with next(output_files).open('w') as terms_file:
+            terms_df.to_csv(terms_file, index=False)
+        with next(output_files).open('w') as texts_file:
+            texts_df.to_csv(texts_file, index=False)
+        with next(output_files).open('w') as models_file:
+            models_df.to_csv(models_file, index=False)
+
+    def find_topics(self, docs):
+        # one model per year
+        models = {'all'}
+        for doc in docs:
+            models.add(str(doc.post_date.year))
+
+        timespans = [
+            (model_name, [doc for doc in docs if doc.in_year(model_name)])
+            for model_name in sorted(models)
+        ]
+
+        # only retrain models whose corpus has changed
+        models_df = pd.DataFrame(
+            [
+                (model_name, corpus_hash(model_name, model_docs))
+                for model_name, model_docs in timespans
+            ],
+            columns=['model_name', 'corpus_hash'])
+        stored_hashes = dict(self.db_connector.query('''
+            SELECT model_name, corpus_hash
+            FROM topic_modeling.model
+        '''))
+        models_df['retrained'] = self.full_retrain | (
+            models_df['model_name'].map(stored_hashes)
+            != models_df['corpus_hash'])
+        timespans = list(compress(timespans, models_df['retrained']))
+        logger.info(
+            f"Training {len(timespans)} of {len(models_df)} topic models")
+
+        # models are independent of each other, so train them concurrently
+        results = parallel_map(
+            find_topics_in_timespan,
+            timespans,
+            min_parallel_items=2)
+
+        topic_dfs, text_dfs = zip(*results) if results else ((), ())
+        return (
+            pd.concat([TOPIC_COLUMNS_DF, *topic_dfs], ignore_index=True),
+            pd.concat([TEXT_COLUMNS_DF, *text_dfs], ignore_index=True),
+            models_df
+        )
+
+
+def corpus_hash(model_name: str, docs: Iterable[Doc]) -> str:
+    """
+    Answer a hash of all inputs of a model to identify changed corpora.
+
+    Training is deterministic, so the results of a model only change if its
+    name (which determines its parameters) or its docs change.
+    """
+    digest = hashlib.sha256(model_name.encode())
+    for doc in docs:
+        digest.update('\x1f'.join([
+            str(doc.source), str(doc.post_id), str(doc.post_date), doc.text,
+            *doc.tokens
+        ]).encode())
+        digest.update(b'\x1e')
+    return digest.hexdigest()
+
+
+# Empty frames to keep the columns of the outputs if no model is retrained
+TOPIC_COLUMNS_DF = pd.DataFrame(columns=['topic', 'term', 'count', 'model'])
+TEXT_COLUMNS_DF = pd.DataFrame(
+    columns=['post_id', 'text', 'source', 'post_date', 'topic', 'model_name'])
+
+
+def find_topics_in_timespan(
+        timespan: Tuple[str, List[Doc]]
+        ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Train a model for the docs and answer its topics and predictions."""
+    model_name, docs = timespan
+
+    # allow for more topics if all posts are used
+    model = train_mgp(docs, K=12 if model_name else 10)
+
+    for doc in docs:
+        doc.predict(model, model_name)
+
+    # cols: text,source,post_date,topic,model_name
+    text_df = pd.DataFrame([doc.to_dict() for doc in docs])
+
+    # cols: topic,term,count,model
+    terms = top_terms(model)
+    topic_df = pd.DataFrame(
+        [
+            {
+                'topic': i,
+                'term': term,
+                'count': count,
+                'model': model_name
+            }
+            for i, topic_terms in enumerate(terms)
+            for term, count in topic_terms
+        ],
+        columns=['topic', 'term', 'count', 'model'])
+
+    # name topics
+    topic_names = {
+        i: topic_terms[0][0]
+        for i, topic_terms in enumerate(terms)
+        if topic_terms
+    }
+    topic_df['topic'] = topic_df['topic'].map(topic_names)
+    text_df['topic'] = text_df['topic'].map(topic_names)
+
+    return topic_df, text_df
+
+
+def train_mgp(
+        docs,
+        K=10,  # noqa: N803
+        alpha=0.1, beta=0.1,
+        n_iters=30
+        ):
+    """Train a GSDMM model on the tokens of the docs."""
+    vocab = set(x for doc in docs for x in doc.tokens)
+    n_terms = len(vocab)
+
+    mgp = GSDMM(K=K, alpha=alpha, beta=beta, n_iters=n_iters)
+    mgp.fit([doc.tokens for doc in docs], n_terms)
+    return mgp
+
+
+def top_terms(model, n=20):
+    """Answer the n most frequent terms and their counts for each cluster."""
+    return [
+        heapq.nlargest(n, distribution.items(), key=itemgetter(1))
+        for distribution in model.cluster_word_distribution
+    ]
+
+
+class TopicModelingPreprocessCorpus(DataPreparationTask):
+    """
+    Preprocess a corpus including several steps.
+
+    - lowercasing
+    - tokenization
+    - removing single-character tokens and non-alphabetic tokens
+    - stop word removal
+    - removing non-german Docs
+    - discarding Docs with less than three tokens
+    - removing tokens that appear only once in the entire corpus
+    """
+
+    """Minimum number of texts to tokenize them in multiple processes."""
+    min_parallel_texts = 2000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stop_words = frozenset([
+            *get_stop_words('german'),
+            *get_stop_words('english'),
+            *['http', 'https', 'www', 'com', 'de', 'google', 'translated',
+              'twitter', 'fur', 'uber', 'html', 'barberini',
+              'museumbarberini', 'museum', 'ausstellung', 'ausstellungen',
+              'potsdam', 'mal']
+        ])
+
+    def requires(self):
+        return {
+            'corpus': TopicModelingCreateCorpus(),
+            'languages': TopicModelingLanguagesToDb()
+        }
+
+    def output(self):
+        # directory of a corpus
+        return luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/corpus_preprocessed')
+
+    def run(self):
+
+        corpus = Corpus.load(self.input()['corpus'].path)
+
+        corpus = self.preprocess(corpus)
+
+        with self.output().temporary_path() as corpus_path:
+            corpus.save(corpus_path)
+
+    def preprocess(self, corpus: Corpus) -> Corpus:
+
+        docs = corpus.docs.copy()
+
+        # consider only german docs
+        docs['language'] = detect_languages(
+            self.db_connector, docs, self.min_parallel_texts
+        )['language']
+        docs = docs[docs['language'] == 'de']
+
+        tokens = self.tokenize(list(docs['text']))
+
+        return self.build_corpus(docs, tokens)
+
+    def build_corpus(
+            self,
+            docs: pd.DataFrame,
+            tokens: List[List[str]]
+            ) -> Corpus:
+
+        # remove tokens that appear only once
+        counts = Counter(chain.from_iterable(tokens))
+        tokens = [
+            [token for token in doc_tokens if counts[token] > 1]
+            for doc_tokens in tokens
+        ]
+
+        # remove very short docs
+        is_long = [len(doc_tokens) > 2 for doc_tokens in tokens]
+        return Corpus.from_tokens(
+            docs[is_long],
+            list(compress(tokens, is_long)))
+
+    def tokenize(self, texts: List[str]) -> List[List[str]]:
+        """Tokenize all texts, using a process pool for large corpora."""
+        return parallel_map(
+            partial(tokenize_text, stop_words=self.stop_words),
+            texts,
+            self.min_parallel_texts)
+
+
+def tokenize_text(text: str, stop_words: FrozenSet[str]) -> List[str]:
+    """Split the text into lowercase tokens and filter them."""
+    return filter_tokens(word_tokenize(text.lower()), stop_words)
+
+
+def filter_tokens(tokens: List[str], stop_words: FrozenSet[str]) -> List[str]:
+    """Discard stop words, non-alphabetic and single-character tokens."""
+    return [
+        token
+        for token in tokens
+        if len(token) > 1 and token.isalpha() and token not in stop_words
+    ]
+
+
+class TopicModelingLanguagesToDb(CsvToDb):
+    """Store the languages of all new or changed posts into the cache."""
+
+    table = 'topic_modeling.post_language'
+
+    def requires(self):
+
+        return TopicModelingDetectLanguages()
+
+
+class TopicModelingDetectLanguages(DataPreparationTask):
+    """
+    Detect the languages of all posts in the corpus that are not cached yet.
+
+    See languages.py.
+    """
+
+    """Minimum number of texts to detect them in multiple processes."""
+    min_parallel_texts = 500
+
+    def requires(self):
+        return TopicModelingCreateCorpus()
+
+    def output(self):
+        return luigi.LocalTarget(
+            f'{self.output_dir}/topic_modeling/languages.csv',
+            format=UTF8
+        )
+
+    def run(self):
+
+        corpus = Corpus.load(self.input().path)
+
+        languages = detect_languages(
+            self.db_connector, corpus.docs, self.min_parallel_texts)
+        languages = languages[~languages['cached']]
+
+        with self.output().open('w') as output_file:
+            languages[['source', 'post_id', 'text_hash', 'language']].to_csv(
+                output_file, index=False)
+
+
+class TopicModelingCreateCorpus(DataPreparationTask):
+    """
+    Create a corpus of posts, i.e. a collection of Docs.
+
+    The corpus consists of all non-empty posts from the post view that were
+    not authored by the museum.
+    """
+
+    def requires(self):
+        yield PostsToDb()
+
+    def output(self):
+        # directory of a corpus
+        return luigi.LocalTarget(f'{self.output_dir}/topic_modeling/corpus')
+
+    def run(self):
+
+        texts = self.db_connector.query('''
+            SELECT text, source, post_date, post_id
+            FROM post
+            WHERE NOT is_from_museum AND text IS NOT NULL
+        ''')
+        corpus = Corpus.from_docs(
+            # remove leading 'None' (introduced by DB export)
+            Doc(row[0].replace('None ', '', 1), row[1], row[2], row[3])
+            for row in texts if row[0] is not None
+        )
+
+        with self.output().temporary_path() as corpus_path:
+            corpus.save(corpus_path)
@@ -0,0 +1,204 @@
+"""
+Provides a compact, columnar representation of text corpora.
+
+A corpus is persisted as a directory containing the following files:
+
+- docs.csv: metadata of all docs (post_id, source, post_date, text, language)
+- tokens.npy: the token ids of all docs, concatenated into one int32 array
+- offsets.npy: the start index of every doc in tokens.npy, followed by the
+  total number of tokens
+- vocabulary.npy: the term for each token id
+
+The numpy arrays are memory-mapped when the corpus is loaded, so the tokens
+of all posts are not converted into Python objects unless Docs are requested
+explicitly.
+"""
+
+from itertools import chain
+import os
+from typing import Iterable, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+from _utils import logger
+from .languages import detect_language
+
+
+class Corpus:
+    """A collection of docs stored in columns (see module docstring)."""
+
+    metadata_columns = ['post_id', 'source', 'post_date', 'text', 'language']
+
+    def __init__(
+            self,
+            docs: pd.DataFrame,
+            tokens: np.ndarray = None,
+            offsets: np.ndarray = None,
+            vocabulary: np.ndarray = None):
+
+        self.docs = docs.reset_index(drop=True)
+        self.tokens = np.zeros(0, dtype=np.int32) \
+            if tokens is None else tokens
+        self.offsets = np.zeros(len(self.docs) + 1, dtype=np.int64) \
+            if offsets is None else offsets
+        self.vocabulary = np.zeros(0, dtype=str) \
+            if vocabulary is None else vocabulary
+        assert len(self.offsets) == len(self.docs) + 1
+
+    @classmethod
+    def from_docs(cls, docs: Iterable['Doc']) -> 'Corpus':
+
+        docs = list(docs)
+        return cls.from_tokens(
+            pd.DataFrame(
+                [
+                    [getattr(doc, column) for column in cls.metadata_columns]
+                    for doc in docs
+                ],
+                columns=cls.metadata_columns),
+            [doc.tokens or [] for doc in docs])
+
+    @classmethod
+    def from_tokens(
+            cls,
+            docs: pd.DataFrame,
+            tokens: List[List[str]]
+            ) -> 'Corpus':
+        """Create a corpus from metadata and the tokens of each doc."""
+        vocabulary = {}
+        token_ids = [
+            [
+                vocabulary.setdefault(token, len(vocabulary))
+                for token in doc_tokens
+            ]
+            for doc_tokens in tokens
+        ]
+        offsets = np.zeros(len(token_ids) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in token_ids], out=offsets[1:])
+
+        return cls(
+            docs=docs,
+            tokens=np.fromiter(
+                chain.from_iterable(token_ids),
+                dtype=np.int32,
+                count=offsets[-1]),
+            offsets=offsets,
+            vocabulary=np.array(list(vocabulary), dtype=str))
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'Corpus':
+
+        def load_array(name):
+            return np.load(
+                os.path.join(path, f'{name}.npy'),
+                mmap_mode='r' if mmap else None,
+                allow_pickle=False)
+
+        docs = pd.read_csv(
+            os.path.join(path, 'docs.csv'),
+            dtype={
+                column: str
+                for column in cls.metadata_columns
+                if column != 'post_date'
+            },
+            keep_default_na=False,
+            na_values=[''],
+            parse_dates=['post_date'])
+        docs = docs.astype(object).where(docs.notna(), None)
+
+        return cls(
+            docs=docs,
+            tokens=load_array('tokens'),
+            offsets=load_array('offsets'),
+            vocabulary=load_array('vocabulary'))
+
+    def save(self, path: str):
+
+        os.makedirs(path, exist_ok=True)
+        self.docs.to_csv(os.path.join(path, 'docs.csv'), index=False)
+        for name in ['tokens', 'offsets', 'vocabulary']:
+            np.save(
+                os.path.join(path, f'{name}.npy'),
+                getattr(self, name),
+                allow_pickle=False)
+
+    def __len__(self):
+        """Return the number of docs."""
+        return len(self.docs)
+
+    def __getitem__(self, index: int) -> 'Doc':
+        """Create a Doc for the specified index."""
+        return self._make_doc(index, self.docs.iloc[index])
+
+    def __iter__(self) -> Iterator['Doc']:
+        """Create a Doc for each row."""
+        for index, row in enumerate(self.docs.itertuples(index=False)):
+            yield self._make_doc(index, row)
+
+    def token_ids(self, index: int) -> np.ndarray:
+
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def doc_tokens(self, index: int) -> List[str]:
+
+        return self.vocabulary[self.token_ids(index)].tolist()
+
+    def _make_doc(self, index, row):
+
+        return Doc(
+            row.text, row.source, row.post_date, row.post_id,
+            tokens=self.doc_tokens(index),
+            language=row.language)
+
+
+class Doc:
+    """
+    Represents an individual text document.
+
+    In our case, a text document is a user post from a public platform.
+    """
+
+    __slots__ = [
+        'text', 'source', 'post_date', 'post_id', 'tokens', 'topic',
+        'model_name', 'language'
+    ]
+
+    def __init__(self, text, source=None, post_date=None,
+                 post_id=None, tokens=None, language=None):
+        self.text = text
+        self.source = source
+        self.post_date = post_date
+        self.post_id = post_id
+        self.tokens = tokens
+        self.topic = None
+        self.model_name = None
+        self.language = language
+
+    def in_year(self, year):
+        if year == 'all':
+            return True
+        return str(self.post_date.year) == str(year)
+
+    def too_short(self):
+        return len(self.tokens) <= 2
+
+    def predict(self, model, model_name):
+        self.topic = model.choose_best_label(self.tokens)[0]
+        self.model_name = model_name
+
+    def guess_language(self):
+        language = detect_language(self.text)
+        if language is None:
+            logger.debug(f'Failure happened for Doc {self.to_dict()}')
+        return language
+
+    def to_dict(self):
+        return {
+            'post_id': self.post_id,
+            'text': self.text,
+            'source': self.source,
+            'post_date': self.post_date,
+            'topic': self.topic,
+            'model_name': self.model_name
+        }
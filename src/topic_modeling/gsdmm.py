@@ -0,0 +1,197 @@
+"""
+Provides a vectorized implementation of GSDMM.
+
+GSDMM is the Gibbs Sampling algorithm for the Dirichlet Multinomial Mixture
+model (http://dbgroup.cs.tsinghua.edu.cn/wangjy/papers/KDD14-GSDMM.pdf). This
+implementation is a drop-in replacement for gsdmm.MovieGroupProcess
+(https://github.com/rwalk/gsdmm) and follows its sampling rules. Cluster
+statistics are stored in count arrays and the conditional probabilities of
+all clusters are computed at once using numpy. The random generator is seeded
+for reproducible models.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from _utils import logger
+
+
+class GSDMM:
+    """A short text clustering model trained by Gibbs sampling."""
+
+    def __init__(
+            self,
+            K: int = 8,  # noqa: N803
+            alpha: float = 0.1,
+            beta: float = 0.1,
+            n_iters: int = 30,
+            seed: Optional[int] = 42):
+
+        self.K = K
+        self.alpha = alpha
+        self.beta = beta
+        self.n_iters = n_iters
+        self.random = np.random.default_rng(seed)
+
+        self.vocabulary: Dict[str, int] = {}
+        self.vocab_size = 0
+        self.number_docs = 0
+        self.cluster_doc_count = np.zeros(K, dtype=np.int64)
+        self.cluster_word_count = np.zeros(K, dtype=np.int64)
+        self.cluster_word_matrix = np.zeros((K, 0), dtype=np.int64)
+
+        # Lookup tables for logarithms, initialized in fit()
+        self._log_alpha = self._log_beta = np.zeros(0)
+        self._cumulative_log_denominator = np.zeros(1)
+
+    def fit(
+            self,
+            docs: Sequence[Sequence[str]],
+            vocab_size: int = None
+            ) -> List[int]:
+        """
+        Cluster the docs and answer the label of each doc.
+
+        vocab_size is only specified for compatibility with MovieGroupProcess
+        and defaults to the number of distinct tokens in the docs.
+        """
+        self.vocabulary = {}
+        docs = [self.encode(doc, extend=True) for doc in docs]
+        self.vocab_size = vocab_size or len(self.vocabulary)
+        self.number_docs = len(docs)
+
+        # Count token occurrences once per doc
+        doc_tokens = [np.unique(doc, return_counts=True) for doc in docs]
+        doc_lengths = np.array([len(doc) for doc in docs], dtype=np.int64)
+
+        # Initialize uniformly at random
+        labels = self.random.integers(self.K, size=len(docs))
+        self.cluster_doc_count = np.bincount(labels, minlength=self.K)
+        self.cluster_word_count = np.bincount(
+            labels, weights=doc_lengths, minlength=self.K
+        ).astype(np.int64)
+        self.cluster_word_matrix = np.zeros(
+            (self.K, len(self.vocabulary)), dtype=np.int64)
+        np.add.at(
+            self.cluster_word_matrix,
+            (np.repeat(labels, doc_lengths), np.concatenate(
+                [np.zeros(0, dtype=np.int64), *docs])),
+            1)
+
+        # All counts are integers, so logarithms can be looked up
+        n_tokens = int(doc_lengths.sum())
+        self._log_alpha = np.log(np.arange(len(docs) + 1) + self.alpha)
+        self._log_beta = np.log(np.arange(n_tokens + 1) + self.beta)
+        # sum(log(n + V * beta + j) for j in range(length))
+        #   = cumulative[n + length] - cumulative[n]
+        self._cumulative_log_denominator = np.concatenate([
+            [0],
+            np.cumsum(np.log(
+                np.arange(n_tokens + doc_lengths.max(initial=0))
+                + self.vocab_size * self.beta))
+        ])
+
+        cluster_count = self.K
+        for iteration in range(self.n_iters):
+            transfers = 0
+            thresholds = self.random.random(len(docs))
+            for i, (tokens, counts) in enumerate(doc_tokens):
+                label = labels[i]
+                length = doc_lengths[i]
+                self._move(label, tokens, counts, length, -1)
+
+                probabilities = np.cumsum(self._score(tokens, counts, length))
+                new_label = min(
+                    np.searchsorted(probabilities, thresholds[i]),
+                    self.K - 1)
+                if new_label != label:
+                    transfers += 1
+                    labels[i] = new_label
+
+                self._move(new_label, tokens, counts, length, 1)
+
+            new_cluster_count = np.count_nonzero(self.cluster_doc_count)
+            logger.debug(
+                f"In stage {iteration}: transferred {transfers} clusters "
+                f"with {new_cluster_count} clusters populated")
+            if transfers == 0 and new_cluster_count == cluster_count \
+                    and iteration > 25:
+                logger.debug("Converged. Breaking out.")
+                break
+            cluster_count = new_cluster_count
+
+        return labels.tolist()
+
+    def score(self, doc: Sequence[str]) -> np.ndarray:
+        """Answer the probability of the doc belonging to each cluster."""
+        tokens, counts = np.unique(self.encode(doc), return_counts=True)
+        return self._score(tokens, counts, len(doc))
+
+    def choose_best_label(self, doc: Sequence[str]) -> Tuple[int, float]:
+        """Answer the most likely cluster of the doc and its probability."""
+        probabilities = self.score(doc)
+        label = int(np.argmax(probabilities))
+        return label, probabilities[label]
+
+    @property
+    def cluster_word_distribution(self) -> List[Dict[str, int]]:
+        """Answer the word counts of each cluster like MovieGroupProcess."""
+        words = np.array(list(self.vocabulary), dtype=object)
+        return [
+            dict(zip(words[row.nonzero()], row[row.nonzero()].tolist()))
+            for row in self.cluster_word_matrix
+        ]
+
+    def encode(self, doc: Sequence[str], extend: bool = False) -> np.ndarray:
+        """
+        Convert the tokens of the doc into ids.
+
+        Unknown tokens are ignored unless extend is True.
+        """
+        if extend:
+            return np.fromiter(
+                (
+                    self.vocabulary.setdefault(token, len(self.vocabulary))
+                    for token in doc
+                ),
+                dtype=np.int64)
+        return np.fromiter(
+            (
+                self.vocabulary[token]
+                for token in doc
+                if token in self.vocabulary
+            ),
+            dtype=np.int64)
+
+    def _move(self, label, tokens, counts, length, sign):
+
+        self.cluster_doc_count[label] += sign
+        self.cluster_word_count[label] += sign * length
+        # tokens are unique, so fancy indexing is safe
+        self.cluster_word_matrix[label, tokens] += sign * counts
+
+    def _score(self, tokens, counts, length) -> np.ndarray:
+
+        # Unknown tokens contribute the same factor to every cluster, so only
+        # the total length of the doc is relevant for them.
+        log_p = (
+            self._log_alpha[self.cluster_doc_count]
+            + self._log_beta[self.cluster_word_matrix[:, tokens]] @ counts
+            - self._log_denominator(length)
+        )
+        p = np.exp(log_p - log_p.max())
+        return p / p.sum()
+
+    def _log_denominator(self, length) -> np.ndarray:
+
+        table = self._cumulative_log_denominator
+        if self.cluster_word_count.max() + length < len(table):
+            return table[self.cluster_word_count + length] \
+                - table[self.cluster_word_count]
+        # Doc is longer than all training docs
+        return np.log(
+            self.cluster_word_count[:, np.newaxis]
+            + self.vocab_size * self.beta
+            + np.arange(length)
+        ).sum(axis=1)
@@ -0,0 +1,78 @@
+"""
+Provides cached language detection for posts.
+
+langdetect is slow and the language of a post does not change unless its
+text changes, so all detected languages are cached in the database (see
+TopicModelingLanguagesToDb). Cache entries are identified by the source and
+post_id of a post and a hash of its text.
+"""
+
+import hashlib
+from typing import Optional
+
+import langdetect
+import pandas as pd
+
+from _utils import DbConnector, logger, parallel_map
+
+# Make langdetect deterministic. This also applies to pool workers.
+langdetect.DetectorFactory.seed = 0
+
+LANGUAGE_TABLE = 'topic_modeling.post_language'
+
+
+def detect_language(text: str) -> Optional[str]:
+    """Detect the language of the text or answer None if it is unknown."""
+    try:
+        return langdetect.detect(text)
+    except langdetect.lang_detect_exception.LangDetectException as e:
+        # langdetect can not handle emoji-only and link-only texts
+        logger.debug(f'langdetect failed for one text. Error: {e}')
+        return None
+
+
+def text_hash(text: str) -> str:
+    """Answer a hash of the text to identify changed texts in the cache."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def detect_languages(
+        db_connector: DbConnector,
+        docs: pd.DataFrame,
+        min_parallel_texts: int = 1
+        ) -> pd.DataFrame:
+    """
+    Look up or detect the languages of all docs.
+
+    Answer a data frame with the columns source, post_id, text_hash,
+    language, and cached for each doc. Languages that are not cached yet are
+    detected using a process pool.
+    """
+    cache = pd.DataFrame(
+        db_connector.query(f'''
+            SELECT source, post_id, text_hash, language
+            FROM {LANGUAGE_TABLE}
+        '''),
+        columns=['source', 'post_id', 'text_hash', 'language'])
+    languages = docs[['source', 'post_id']].assign(
+        text_hash=docs['text'].map(text_hash)
+    ).merge(
+        cache,
+        on=['source', 'post_id', 'text_hash'],
+        how='left',
+        indicator='cached')
+    languages['cached'] = languages['cached'] == 'both'
+    languages['language'] = languages['language'].astype(object)
+
+    uncached = ~languages['cached']
+    logger.info(f"Detecting languages of {uncached.sum()} uncached texts")
+    languages.loc[uncached, 'language'] = pd.Series(
+        parallel_map(
+            detect_language,
+            docs['text'][uncached.values],
+            min_parallel_texts),
+        index=languages.index[uncached],
+        dtype=object)
+
+    languages.index = docs.index
+    return languages
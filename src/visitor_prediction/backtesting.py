@@ -0,0 +1,159 @@
+"""
+Provides a backtesting engine to tune the hyperparameters of the predictor.
+
+For a series of cutoff dates, the predictor is trained on all entries up to
+the cutoff and predicts the following days, which are compared with the
+actual entries. All combinations of cutoff dates and hyperparameters (see
+predict.py) are evaluated in a process pool. The features are only computed
+once because they only depend on the date. The errors are aggregated for each
+combination of hyperparameters and horizon (days after the cutoff).
+
+To run a backtest, execute a command like:
+    make luigi-task LMODULE=visitor_prediction.backtesting \
+        LTASK=BacktestVisitorPrediction LARGS='--n-neighbors [3,5,7]'
+"""
+
+import datetime as dt
+from functools import partial
+from itertools import product
+
+import luigi
+import numpy as np
+import pandas as pd
+
+from _utils import logger, parallel_map
+from .predict import (N_NEIGHBORS, SEQUENCE_LENGTH, TIMESPAN,
+                      VisitorPredictionTask, append_days_to_predict,
+                      predict_entries)
+from .preprocessing import preprocess_entries
+
+
+HYPERPARAMETERS = ['n_neighbors', 'sequence_length', 'timespan']
+
+
+class BacktestVisitorPrediction(VisitorPredictionTask):
+    """Evaluate the predictor for many cutoffs and hyperparameters."""
+
+    n_neighbors = luigi.ListParameter(
+        default=[3, N_NEIGHBORS, 7, 10],
+        description="Numbers of neighbors to evaluate")
+    sequence_lengths = luigi.ListParameter(
+        default=[SEQUENCE_LENGTH, 2, 3],
+        description="Sequence lengths to evaluate")
+    timespans = luigi.ListParameter(
+        default=[7, TIMESPAN],
+        description="Numbers of days to predict to evaluate")
+    cutoffs = luigi.IntParameter(
+        default=26,
+        description="Number of cutoff dates")
+    cutoff_interval = luigi.IntParameter(
+        default=7,
+        description="Number of days between two cutoff dates")
+
+    def output(self):
+        return luigi.LocalTarget(
+            f'{self.output_dir}/visitor_prediction/backtesting.csv',
+            format=luigi.format.UTF8)
+
+    def run(self):
+
+        all_entries, exhibitions, facts = self.load_input()
+        entries = all_entries['entries']
+
+        # the last cutoff leaves actual entries for the longest timespan
+        cutoffs = pd.date_range(
+            end=entries.index.max() - dt.timedelta(days=max(self.timespans)),
+            periods=self.cutoffs,
+            freq=f'{self.cutoff_interval}D')
+
+        # features only depend on the date, so preprocess all dates once
+        features = preprocess_entries(
+            pd.DataFrame(
+                index=pd.date_range(entries.index.min(), entries.index.max()),
+                columns=['entries']),
+            exhibitions,
+            facts
+        ).drop(columns='entries')
+
+        runs = list(product(
+            cutoffs,
+            self.n_neighbors,
+            self.sequence_lengths,
+            self.timespans))
+        logger.info(f"Backtesting {len(runs)} runs")
+        predictions = pd.concat(
+            parallel_map(
+                partial(backtest, entries=all_entries, features=features),
+                runs,
+                min_parallel_items=2),
+            ignore_index=True)
+
+        metrics = evaluate(predictions, entries)
+
+        best = metrics.groupby(HYPERPARAMETERS)['mae'].mean().idxmin()
+        logger.info(
+            "Lowest mean absolute error for " + ', '.join(
+                f'{name}={value}'
+                for name, value in zip(HYPERPARAMETERS, best)))
+
+        with self.output().open('w') as output_file:
+            metrics.to_csv(output_file, index=False, header=True)
+
+
+def backtest(run, entries, features):
+    """
+    Predict the days after a cutoff date using the given hyperparameters.
+
+    run is a tuple of the cutoff date, the number of neighbors, the sequence
+    length, and the timespan. Answer a data frame with the columns date,
+    entries, cutoff, horizon, and the hyperparameters.
+    """
+    cutoff, n_neighbors, sequence_length, timespan = run
+
+    # the entry of the cutoff date itself might be missing
+    known_entries = append_days_to_predict(
+        entries.loc[:cutoff, ['entries']],
+        timespan,
+        start=cutoff + dt.timedelta(days=1))
+    predictions = predict_entries(
+        known_entries.join(features),
+        timespan,
+        n_neighbors=n_neighbors,
+        sequence_length=sequence_length)
+
+    return predictions.assign(
+        cutoff=cutoff,
+        horizon=np.arange(1, timespan + 1),
+        n_neighbors=n_neighbors,
+        sequence_length=sequence_length,
+        timespan=timespan)
+
+
+def evaluate(predictions, entries):
+    """
+    Compare the predictions with the actual entries.
+
+    Answer the mean absolute error (mae), the mean absolute percentage error
+    (mape) and the number of evaluated cutoffs for each combination of
+    hyperparameters and horizon. Days without actual entries are ignored,
+    days without any visitors are ignored for the mape.
+    """
+    actual = entries.reindex(predictions['date']).to_numpy(dtype=float)
+    absolute_errors = np.abs(predictions['entries'].to_numpy() - actual)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage_errors = np.where(
+            actual > 0,
+            absolute_errors / actual,
+            np.nan)
+
+    return predictions[[*HYPERPARAMETERS, 'horizon']].assign(
+        absolute_error=absolute_errors,
+        percentage_error=percentage_errors,
+        actual=actual
+    ).groupby(
+        [*HYPERPARAMETERS, 'horizon']
+    ).agg(
+        mae=('absolute_error', 'mean'),
+        mape=('percentage_error', 'mean'),
+        cutoffs=('actual', 'count')
+    ).reset_index()
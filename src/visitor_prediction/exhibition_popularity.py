@@ -1,8 +1,11 @@
 """Estimate the popularity for each exhibition."""
 
+from collections import defaultdict
 import datetime as dt
 
+import ahocorasick
 import luigi
+import numpy as np
 import pandas as pd
 
 from _utils import DataPreparationTask, QueryDb
@@ -55,23 +58,7 @@ class ExhibitionPopularity(DataPreparationTask):
             )
 
         # match posts with announced exhibitions
-        def find_related_exhib(post):
-            mentioned_exhibitions = []
-            for exhib in exhibitions.itertuples():
-                if exhib.special:
-                    continue
-
-                first_title_half = exhib.title.split('.')[0]
-                simple_text = simplify_text(str(post['text']))
-                simple_title = simplify_text(first_title_half)
-                if simple_title in simple_text and \
-                    exhib.start_date - dt.timedelta(days=360) \
-                        < post['post_date'] < exhib.start_date:
-                    mentioned_exhibitions.append(exhib.title)
-            return mentioned_exhibitions[0] \
-                if len(mentioned_exhibitions) == 1\
-                else None  # avoid ambiguity
-        posts['announces'] = posts.apply(find_related_exhib, axis=1)
+        posts['announces'] = find_announced_exhibitions(posts, exhibitions)
 
         announcing_posts = posts.dropna(subset=['announces'])
 
@@ -82,19 +69,91 @@ class ExhibitionPopularity(DataPreparationTask):
             if len(announcing_posts) > 0 else 0.0
 
         # assign to exhibitions
-        for exhibition in exhibitions.itertuples():
-            try:
-                popularity = popul_per_exhib.loc[exhibition.title]['likes']
-            except KeyError:
-                popularity = average_max_likes
-            exhibitions.loc[
-                exhibitions['title'] == exhibition.title, 'popularity'
-                ] = popularity
+        exhibitions['popularity'] = exhibitions[['title']].merge(
+            popul_per_exhib,
+            how='left',
+            left_on='title',
+            right_index=True
+        )['likes'].fillna(average_max_likes).astype(float)
 
         with self.output().open('w') as output_file:
             exhibitions.to_csv(output_file, index=False, header=True)
 
 
+def find_announced_exhibitions(posts, exhibitions):
+    """
+    Answer the title of the exhibition each post announces, or None.
+
+    A post announces an exhibition if it mentions the first half of its
+    title and was published within 360 days before the exhibition started.
+    Posts that announce more than one exhibition are ambiguous and ignored.
+
+    Titles are located in the posts by a single Aho-Corasick automaton
+    instead of testing every title for every post. Only posts that were
+    published within 360 days before the next exhibition started are
+    searched, which is looked up in the sorted start dates.
+    """
+    exhibitions = exhibitions[
+        (exhibitions['special'] == '') & exhibitions['start_date'].notna()
+    ].sort_values('start_date', kind='mergesort')
+    announced = pd.Series(None, index=posts.index, dtype=object)
+    if exhibitions.empty:
+        return announced
+
+    titles = exhibitions['title'].to_numpy()
+    start_dates = exhibitions['start_date'].to_numpy()
+    simple_titles = [
+        simplify_text(title.split('.')[0])
+        for title in titles
+    ]
+
+    exhibitions_by_title = defaultdict(list)
+    for i, simple_title in enumerate(simple_titles):
+        exhibitions_by_title[simple_title].append(i)
+    automaton = ahocorasick.Automaton()
+    for simple_title in exhibitions_by_title:
+        if simple_title:
+            automaton.add_word(simple_title, simple_title)
+    automaton.make_automaton()
+
+    # the first exhibition that starts after each post
+    post_dates = posts['post_date'].to_numpy()
+    next_exhibitions = np.searchsorted(start_dates, post_dates, side='right')
+    window = np.timedelta64(dt.timedelta(days=360))
+    is_candidate = next_exhibitions < len(start_dates)
+    is_candidate[is_candidate] = \
+        start_dates[next_exhibitions[is_candidate]] - window \
+        < post_dates[is_candidate]
+
+    post_ids, exhibition_ids = [], []
+    for post_id, text in zip(
+            np.flatnonzero(is_candidate),
+            posts['text'].to_numpy()[is_candidate]):
+        mentioned_titles = {''}  # the empty title is part of every text
+        if len(automaton):
+            mentioned_titles.update(
+                title
+                for _, title in automaton.iter(simplify_text(str(text))))
+        for simple_title in mentioned_titles:
+            mentioned_exhibitions = exhibitions_by_title.get(simple_title, [])
+            post_ids.extend([post_id] * len(mentioned_exhibitions))
+            exhibition_ids.extend(mentioned_exhibitions)
+
+    # keep mentions of exhibitions that started after and near the post
+    post_ids = np.array(post_ids, dtype=np.int64)
+    exhibition_ids = np.array(exhibition_ids, dtype=np.int64)
+    is_announcement = \
+        (start_dates[exhibition_ids] - window < post_dates[post_ids]) \
+        & (post_dates[post_ids] < start_dates[exhibition_ids])
+    post_ids = post_ids[is_announcement]
+    exhibition_ids = exhibition_ids[is_announcement]
+
+    # avoid ambiguity
+    is_unique = np.bincount(post_ids, minlength=len(posts))[post_ids] == 1
+    announced.iloc[post_ids[is_unique]] = titles[exhibition_ids[is_unique]]
+    return announced
+
+
 def simplify_text(text):
     """Simplify a text by filtering out non-alphanumeric characters."""
     return ''.join(s for s in text if s.isalnum()).lower()
@@ -1,14 +1,26 @@
-"""Provides tasks for predicting the number of museum visitors."""
+"""
+Provides tasks for predicting the number of museum visitors.
+
+Predictions are cached in the cache directory (see _utils.cache_dir()),
+keyed by a fingerprint of all inputs. If no input has changed since a previous
+run, the predictions are reused and the database is not rewritten.
+"""
 
 import datetime as dt
+import hashlib
 import json
+import os
+import shutil
+import tempfile
 
 import luigi
+import numpy as np
 import pandas as pd
 from sklearn.neighbors import KNeighborsRegressor
 from sklearn.preprocessing import MinMaxScaler
 
-from _utils import CsvToDb, DataPreparationTask, QueryDb, MuseumFacts
+from _utils import CsvToDb, DataPreparationTask, QueryDb, MuseumFacts, \
+    cache_dir, logger
 from gomus.daily_entries import DailyEntriesToDb
 from .exhibition_popularity import ExhibitionPopularity
 from .preprocessing import preprocess_entries
@@ -19,8 +31,14 @@ SEQUENCE_LENGTH = 1
 # These parameters as well as conventions
 # in training models were optimized as part of
 # https://gitlab.hpi.de/georg.tennigkeit/ba-visitor-prediction
+# To evaluate other values, see backtesting.py.
 TIMESPAN = 30  # days
 
+# Increment this when changing the model to invalidate all cached predictions
+MODEL_VERSION = 1
+# Number of cached predictions to keep
+CACHED_PREDICTIONS = 5
+
 
 class PredictionsToDb(CsvToDb):
     """Store visitor predictions into the database."""
@@ -29,41 +47,31 @@ class PredictionsToDb(CsvToDb):
     replace_content = True
 
     def requires(self):
-        return CombinePredictions()
+        return PredictVisitors(days_to_predict=TIMESPAN)
 
+    def copy(self, cursor, file):
 
-class CombinePredictions(DataPreparationTask):
-    """Combine visitor predictions for different timespans."""
+        if self.is_up_to_date(cursor):
+            logger.info(f"{self.table} is up to date, skipping rewrite")
+            return
 
-    def output(self):
-        return luigi.LocalTarget(
-            f'{self.output_dir}/visitor_prediction/all_predictions.csv',
-            format=luigi.format.UTF8)
+        super().copy(cursor, file)
 
-    def run(self):
-        all_predictions = pd.DataFrame(
-            columns=['is_sample', 'date', 'entries'])
-        for is_sample in [False, True]:
-            target = yield PredictVisitors(
-                days_to_predict=TIMESPAN,
-                sample_prediction=is_sample
-            )
-            with target.open('r') as prediction_file:
-                new_predictions = pd.read_csv(prediction_file)
-            new_predictions['is_sample'] = is_sample
-            all_predictions = all_predictions.append(new_predictions)
-        with self.output().open('w') as output_file:
-            all_predictions.to_csv(output_file, index=False, header=True)
+    def is_up_to_date(self, cursor):
+        """Answer whether the table already contains all predictions."""
+        cursor.execute(f'SELECT is_sample, date, entries FROM {self.table}')
+        stored_predictions = set(cursor.fetchall())
 
+        with self.input().open('r') as predictions_file:
+            predictions = pd.read_csv(predictions_file, parse_dates=['date'])
+        return stored_predictions == set(zip(
+            predictions['is_sample'].tolist(),
+            predictions['date'].dt.date.tolist(),
+            predictions['entries'].tolist()))
 
-class PredictVisitors(DataPreparationTask):
-    """Predict the number of museum visitors for the next days."""
 
-    days_to_predict = luigi.parameter.IntParameter(default=7)
-    sample_prediction = luigi.parameter.BoolParameter(
-        default=False,
-        description="if sample_prediction, predict the last"
-        "days_to_predict days instead")
+class VisitorPredictionTask(DataPreparationTask):
+    """The base class of all tasks that work on the daily entries."""
 
     def _requires(self):
         return luigi.task.flatten([
@@ -85,15 +93,8 @@ class PredictVisitors(DataPreparationTask):
         yield ExhibitionPopularity()
         yield MuseumFacts()
 
-    def output(self):
-        return luigi.LocalTarget(
-            f'{self.output_dir}/visitor_prediction/prediction'
-            f'{"_sample" if self.sample_prediction else ""}'
-            f'_{self.days_to_predict}_days_ahead.csv',
-            format=luigi.format.UTF8)
-
-    def run(self):
-        # --- load data ---
+    def load_input(self):
+        """Answer the daily entries, the exhibitions, and the facts."""
         with self.input()[0].open('r') as entries_file:
             all_entries = pd.read_csv(
                 entries_file,
@@ -120,87 +121,236 @@ class PredictVisitors(DataPreparationTask):
             exhibitions['popularity'] = exhibitions['title'].apply(len)
         exhibitions['popularity'] = exhibitions['popularity'].apply(int)
 
-        if self.sample_prediction:
-            all_entries = all_entries.iloc[:-self.days_to_predict].copy()
-
-        last_date = all_entries.index.max()
+        return all_entries, exhibitions, facts
 
-        # --- append dates to be predicted ---
-        # --- so everything is preprocessed together ---
-        to_be_predicted_entries = pd.DataFrame(
-            index=pd.date_range(
-                start=last_date + dt.timedelta(days=1),
-                periods=self.days_to_predict),
-            columns=['entries'])
 
-        all_entries = all_entries.append(to_be_predicted_entries)
+class PredictVisitors(VisitorPredictionTask):
+    """
+    Predict the number of museum visitors for the next days.
 
-        # --- preprocess ---
-        all_entries = preprocess_entries(
-            all_entries,
-            exhibitions,
-            facts)
+    In addition, a sample prediction is made for the last days_to_predict
+    days that already have actual numbers. Both predictions share the
+    preprocessed entries because all features only depend on the date.
+    """
 
-        to_be_rescaled = [
-            'entries',
-            'exhibition_popularity',
-            'exhibition_progress']
-
-        # --- normalize ---
-        scaler_dict = dict()
-        for col in to_be_rescaled:
-            scaler = MinMaxScaler()
-            all_entries[[col]] = scaler.fit_transform(all_entries[[col]])
-            scaler_dict[col] = scaler
+    days_to_predict = luigi.parameter.IntParameter(default=7)
 
-        # --- separate into training set and to_be_predicted ---
+    def output(self):
+        return luigi.LocalTarget(
+            f'{self.output_dir}/visitor_prediction/all_predictions.csv',
+            format=luigi.format.UTF8)
 
-        train_entries = all_entries[:-self.days_to_predict].copy()
-        to_be_predicted_entries = all_entries[-self.days_to_predict:].copy()
+    def run(self):
+        # --- look up cache ---
+        cache_path = os.path.join(
+            cache_dir(), 'visitor_prediction', self.fingerprint())
+        if os.path.exists(cache_path):
+            logger.info("Inputs have not changed, reusing cached predictions")
+            os.utime(cache_path)  # mark as recently used
+            with open(f'{cache_path}/all_predictions.csv') as cache_file:
+                with self.output().open('w') as output_file:
+                    shutil.copyfileobj(cache_file, output_file)
+            return
 
-        # add last SEQUENCE_LENGTH entries to each row
-        # done after scaling to not rescale some e-X columns differently
-        for i in range(1, SEQUENCE_LENGTH):
-            train_entries[f'e-{i}'] = train_entries['entries'].shift(periods=i)
+        # --- load data ---
+        all_entries, exhibitions, facts = self.load_input()
 
-        # --- train ---
-        feature_columns = [col for col in train_entries.columns
-                           if col != 'entries']
+        # --- append dates to be predicted ---
+        # the sample prediction hides the last known entries
+        entries_sets = [
+            (is_sample, append_days_to_predict(entries, self.days_to_predict))
+            for is_sample, entries in [
+                (False, all_entries),
+                (True, all_entries.iloc[:-self.days_to_predict])
+            ]
+        ]
 
-        model = KNeighborsRegressor(n_neighbors=N_NEIGHBORS)
-        model.fit(
-            train_entries.filter(feature_columns),
-            train_entries['entries'])
+        # --- preprocess ---
+        # features only depend on the date, so preprocess all dates once
+        dates = entries_sets[0][1].index.union(entries_sets[1][1].index)
+        features = preprocess_entries(
+            pd.DataFrame(index=dates, columns=['entries']),
+            exhibitions,
+            facts
+        ).drop(columns='entries')
 
         # --- predict ---
-        previous_entries = list(train_entries['entries'].values)
-        predictions = []
-        for i in range(len(to_be_predicted_entries)):
-            new_row = to_be_predicted_entries.iloc[[i]].copy()
-            if new_row['is_closed'][0] == 1.0 or\
-               new_row['weekday_1'][0] == 1.0:
-                new_prediction = 0.0  # not predicting Tuesdays and closed days
-            else:
-                for j in range(1, SEQUENCE_LENGTH + 1):
-                    new_row[f'e-{j}'] = previous_entries[-j]
-                new_prediction = model.predict(
-                    new_row.filter(feature_columns))[0]
-
-            previous_entries.append(new_prediction)
-            predictions.append(new_prediction)
-
-        predicted_entries = pd.DataFrame(
-            index=to_be_predicted_entries.index,
-            data=predictions)
-        predicted_entries.reset_index(inplace=True)
-        predicted_entries.columns = ['date', 'entries']
-
-        # --- denormalize results ---
-        predicted_entries[['entries']] = \
-            scaler_dict['entries'].inverse_transform(
-                predicted_entries[['entries']])
-        predicted_entries['entries'] = predicted_entries['entries'].apply(int)
+        all_predictions = pd.concat([
+            predict_entries(
+                entries[['entries']].join(features),
+                self.days_to_predict
+            ).assign(is_sample=is_sample)
+            for is_sample, entries in entries_sets
+        ])
 
         # --- write output ---
         with self.output().open('w') as output_file:
-            predicted_entries.to_csv(output_file, index=False, header=True)
+            all_predictions.to_csv(
+                output_file,
+                index=False,
+                header=True,
+                columns=['is_sample', 'date', 'entries'])
+
+        self.store_cache(cache_path)
+
+    def fingerprint(self):
+        """Answer a hash of all inputs and parameters of the prediction."""
+        fingerprint = hashlib.sha256(repr((
+            MODEL_VERSION,
+            N_NEIGHBORS,
+            SEQUENCE_LENGTH,
+            self.days_to_predict,
+            self.minimal_mode
+        )).encode())
+        for input_target in self.input():
+            with open(input_target.path, 'rb') as input_file:
+                fingerprint.update(input_file.read())
+        return fingerprint.hexdigest()
+
+    def store_cache(self, cache_path):
+        """Store the predictions into the cache."""
+        cache_root = os.path.dirname(cache_path)
+        os.makedirs(cache_root, exist_ok=True)
+
+        # write into a temporary directory to avoid incomplete entries
+        temp_path = tempfile.mkdtemp(dir=cache_root, prefix='.')
+        shutil.copyfile(
+            self.output().path,
+            f'{temp_path}/all_predictions.csv')
+        try:
+            os.rename(temp_path, cache_path)
+        except OSError:
+            # another run has stored the same entry meanwhile
+            shutil.rmtree(temp_path)
+
+        # remove old entries
+        entries = sorted(
+            (entry for entry in os.scandir(cache_root)
+             if not entry.name.startswith('.')),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True)
+        for entry in entries[CACHED_PREDICTIONS:]:
+            shutil.rmtree(entry.path)
+
+
+def append_days_to_predict(entries, days_to_predict, start=None):
+    """
+    Append the days_to_predict days from start on.
+
+    start defaults to the day after the last entry.
+    """
+    if start is None:
+        start = entries.index.max() + dt.timedelta(days=1)
+    to_be_predicted_entries = pd.DataFrame(
+        index=pd.date_range(start=start, periods=days_to_predict),
+        columns=['entries'])
+
+    return entries.append(to_be_predicted_entries)
+
+
+def predict_entries(
+        all_entries,
+        days_to_predict,
+        n_neighbors=N_NEIGHBORS,
+        sequence_length=SEQUENCE_LENGTH):
+    """
+    Predict the entries of the last days_to_predict days.
+
+    all_entries must contain the preprocessed features of all days. Answer a
+    data frame with the columns date and entries.
+    """
+    all_entries = all_entries.copy()
+    # Lag features of previous entries. The current entry is counted in
+    # sequence_length, so there are no lag features if it is 1.
+    lags = range(1, sequence_length)
+
+    to_be_rescaled = [
+        'entries',
+        'exhibition_popularity',
+        'exhibition_progress']
+
+    # --- normalize ---
+    scaler_dict = dict()
+    for col in to_be_rescaled:
+        scaler = MinMaxScaler()
+        all_entries[[col]] = scaler.fit_transform(all_entries[[col]])
+        scaler_dict[col] = scaler
+
+    # --- separate into training set and to_be_predicted ---
+
+    train_entries = all_entries[:-days_to_predict].copy()
+    to_be_predicted_entries = all_entries[-days_to_predict:].copy()
+
+    # add last sequence_length entries to each row
+    # done after scaling to not rescale some e-X columns differently
+    for i in lags:
+        train_entries[f'e-{i}'] = train_entries['entries'].shift(periods=i)
+    # the first rows have no predecessors
+    train_entries = train_entries.iloc[len(lags):]
+
+    # --- train ---
+    feature_columns = [col for col in train_entries.columns
+                       if col != 'entries']
+
+    model = KNeighborsRegressor(n_neighbors=n_neighbors)
+    model.fit(
+        train_entries.filter(feature_columns),
+        train_entries['entries'])
+
+    # --- predict ---
+    # not predicting Tuesdays and closed days
+    is_open = (
+        (to_be_predicted_entries['is_closed'] != 1.0)
+        & (to_be_predicted_entries['weekday_1'] != 1.0)
+    ).to_numpy()
+    if lags:
+        # every prediction depends on the previous ones
+        predictions = predict_recursively(
+            model,
+            to_be_predicted_entries,
+            feature_columns,
+            is_open,
+            lags,
+            list(train_entries['entries'].values))
+    else:
+        predictions = np.zeros(len(to_be_predicted_entries))
+        if is_open.any():
+            predictions[is_open] = model.predict(
+                to_be_predicted_entries[is_open].filter(feature_columns))
+
+    predicted_entries = pd.DataFrame(
+        index=to_be_predicted_entries.index,
+        data=predictions)
+    predicted_entries.reset_index(inplace=True)
+    predicted_entries.columns = ['date', 'entries']
+
+    # --- denormalize results ---
+    predicted_entries[['entries']] = \
+        scaler_dict['entries'].inverse_transform(
+            predicted_entries[['entries']])
+    predicted_entries['entries'] = predicted_entries['entries'].apply(int)
+
+    return predicted_entries
+
+
+def predict_recursively(
+        model,
+        to_be_predicted_entries,
+        feature_columns,
+        is_open,
+        lags,
+        previous_entries):
+    """Predict day by day, using previous predictions as lags."""
+    predictions = []
+    for i in range(len(to_be_predicted_entries)):
+        new_prediction = 0.0
+        if is_open[i]:
+            new_row = to_be_predicted_entries.iloc[[i]].copy()
+            for j in lags:
+                new_row[f'e-{j}'] = previous_entries[-j]
+            new_prediction = model.predict(
+                new_row.filter(feature_columns))[0]
+
+        previous_entries.append(new_prediction)
+        predictions.append(new_prediction)
+    return predictions
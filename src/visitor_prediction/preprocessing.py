@@ -1,7 +1,17 @@
-"""Provides preprocessing tools used for visitor prediction."""
+"""
+Provides preprocessing tools used for visitor prediction.
 
+The dates of the entries are sorted once and the timespans of all
+exhibitions are located in them by binary search (see _locate_timespans()).
+Thus, features are assigned to slices of dates instead of scanning all dates
+for every exhibition.
+"""
+
+import numpy as np
 import pandas as pd
 
+ONE_DAY = np.timedelta64(1, 'D')
+
 
 def preprocess_entries(entries, exhibitions, facts):
     """Preprocess entry data used for visitor prediction."""
@@ -20,76 +30,119 @@ def preprocess_entries(entries, exhibitions, facts):
 
 def _complement_exhibitions(exhibitions, facts):
     # facts_atttribute should be list of timespans
-    for (special, facts_attribute) in [
-        ('closing day', 'missing_closed_timespans'),
-        ('limited entries', 'limited_entry_timespans')
-    ]:
-        for closed_timespan in facts[facts_attribute]:
-            exhibitions = exhibitions.append(
-                pd.DataFrame(
-                    columns=exhibitions.columns,
-                    data=[{
-                        "special": special,
-                        'start_date': closed_timespan['start'],
-                        'end_date': closed_timespan['end']
-                    }]),
-                ignore_index=True)
-    return exhibitions
+    timespans = pd.DataFrame(
+        columns=exhibitions.columns,
+        data=[
+            {
+                "special": special,
+                'start_date': closed_timespan['start'],
+                'end_date': closed_timespan['end']
+            }
+            for (special, facts_attribute) in [
+                ('closing day', 'missing_closed_timespans'),
+                ('limited entries', 'limited_entry_timespans')
+            ]
+            for closed_timespan in facts[facts_attribute]
+        ])
+    return pd.concat([exhibitions, timespans], ignore_index=True)
 
 
 def _add_is_closed(entries, exhibitions):
-    entries['is_closed'] = 0
-    for exhibition in exhibitions[
-            exhibitions['special'] == "closing day"].itertuples():
-        start = exhibition.start_date
-        end = exhibition.end_date
-        entries.loc[
-            entries['entries'].index.to_series().between(start, end),
-            'is_closed'] = 1
+    entries['is_closed'] = _in_any_timespan(
+        entries,
+        exhibitions[exhibitions['special'] == "closing day"])
     return entries
 
 
 def _add_limited_entries(entries, exhibitions):
-    entries['limited_entries'] = 0
-    for exhibition in exhibitions[
-            exhibitions['special'] == "limited entries"].itertuples():
-        start = exhibition.start_date
-        end = exhibition.end_date
-        entries.loc[
-            entries['entries'].index.to_series().between(start, end),
-            'limited_entries'] = 1
+    entries['limited_entries'] = _in_any_timespan(
+        entries,
+        exhibitions[exhibitions['special'] == "limited entries"])
     return entries
 
 
 def _add_exhibition_progress(entries, exhibitions):
-    def calc_exhib_progress(date):
-        for exhibition in exhibitions.itertuples():
-            start = exhibition.start_date
-            end = exhibition.end_date
-            if start <= date <= end:
-                return (date - start).days / (end - start).days
-        return -1
-    entries['exhibition_progress'] = \
-        entries['entries'].index.to_series().apply(calc_exhib_progress)
+    order, dates, starts, ends, lower, upper = \
+        _locate_timespans(entries, exhibitions)
+
+    progress = np.full(len(dates), -1.0)
+    # if exhibitions overlap, the first one wins
+    for i in reversed(range(len(starts))):
+        if lower[i] == upper[i]:
+            continue
+        days = (dates[lower[i]:upper[i]] - starts[i]) // ONE_DAY
+        progress[lower[i]:upper[i]] = days / ((ends[i] - starts[i]) // ONE_DAY)
+
+    entries['exhibition_progress'] = _unsort(progress, order)
     return entries
 
 
 def _add_exhibition_popularity(entries, exhibitions):
-    entries['exhibition_popularity'] = 0
-
-    for exhibition in exhibitions.itertuples():
-        start = exhibition.start_date
-        end = exhibition.end_date
-        entries.loc[
-            entries['entries'].index.to_series().between(start, end),
-            'exhibition_popularity'] = exhibition.popularity
+    order, dates, _, _, lower, upper = \
+        _locate_timespans(entries, exhibitions)
+    # popularities are integers, but the column is float if complemented
+    # timespans without a popularity have been added
+    popularities = exhibitions['popularity'].to_numpy(dtype=np.int64)
+
+    popularity = np.zeros(len(dates), dtype=np.int64)
+    # if exhibitions overlap, the last one wins
+    for i in range(len(popularities)):
+        popularity[lower[i]:upper[i]] = popularities[i]
+
+    entries['exhibition_popularity'] = _unsort(popularity, order)
     return entries
 
 
 def _add_weekdays(entries):
-    weekdays_series = entries['entries'].index.to_series().apply(
-        lambda date: date.weekday())
+    weekdays_series = pd.Series(
+        entries['entries'].index.weekday,
+        index=entries['entries'].index)
     weekdays = pd.get_dummies(weekdays_series, prefix='weekday')
     for col in weekdays.columns:
         entries[col] = weekdays[col]
     return entries
+
+
+def _in_any_timespan(entries, exhibitions):
+    """Answer 1 for each date within any of the exhibitions, 0 otherwise."""
+    order, dates, _, _, lower, upper = \
+        _locate_timespans(entries, exhibitions)
+
+    # count overlapping timespans using a difference array
+    changes = np.zeros(len(dates) + 1, dtype=np.int64)
+    np.add.at(changes, lower, 1)
+    np.add.at(changes, upper, -1)
+    covered = (np.cumsum(changes[:-1]) > 0).astype(np.int64)
+
+    return _unsort(covered, order)
+
+
+def _locate_timespans(entries, exhibitions):
+    """
+    Locate the timespans of all exhibitions in the sorted dates of entries.
+
+    Answer the sort order of the dates, the sorted dates, the start and end
+    dates, and for every exhibition the positions of the first date within
+    and the first date after its timespan. Exhibitions without a valid
+    timespan cover no dates.
+    """
+    order = np.argsort(entries.index.to_numpy(), kind='stable')
+    dates = entries.index.to_numpy()[order]
+    starts = pd.to_datetime(exhibitions['start_date']).to_numpy()
+    ends = pd.to_datetime(exhibitions['end_date']).to_numpy()
+
+    lower = np.searchsorted(dates, starts, side='left')
+    upper = np.searchsorted(dates, ends, side='right')
+    upper = np.where(
+        np.isnat(starts) | np.isnat(ends),
+        lower,
+        np.maximum(upper, lower))
+
+    return order, dates, starts, ends, lower, upper
+
+
+def _unsort(values, order):
+    """Restore the original order of values computed for sorted dates."""
+    result = np.empty_like(values)
+    result[order] = values
+    return result
@@ -0,0 +1,396 @@
+"""
+Provides a framework for benchmarking stages of the pipeline.
+
+Benchmarks are database test cases, so every benchmark runs against a
+throw-away database that is created from the migrations. SqlBenchmarkCase
+measures SQL stages, BenchmarkCase measures Python functions. To run a
+benchmark, execute a command like:
+    make benchmark benchmark=tests/benchmarks/benchmark_absa.py
+
+The results of every stage (including the query plans of SQL stages) are
+stored as JSON in the output directory. Timings depend on the machine, so
+the baseline is not committed but kept next to the results: The first run
+on a machine records it, later runs fail if the wall time or the number of
+buffers accessed by any stage exceeds the baseline by more than the
+threshold.
+
+Benchmarks are configured using the following environment variables:
+    BENCHMARK_SIZE: Scale of the seeded data (meaning depends on benchmark)
+    BENCHMARK_REPEAT: Number of timed runs per stage (median is reported)
+    BENCHMARK_THRESHOLD: Relative slowdown against baseline to be tolerated
+    BENCHMARK_UPDATE_BASELINE: If True, store the results as new baseline
+"""
+
+from dataclasses import asdict, dataclass, field
+import json
+import os
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+import regex
+
+from db_test import DatabaseTestCase, check_env, logger
+
+
+EXPLAINABLE_PATTERN = regex.compile(
+    r'''
+        ^\s*(
+            SELECT | INSERT | UPDATE | DELETE | WITH
+            |
+            CREATE \s+ (TEMPORARY \s+)? TABLE \s+ [\w.]+ \s+ AS
+        )\b
+    ''',
+    flags=regex.IGNORECASE | regex.VERBOSE
+)
+
+
+@dataclass
+class Stage:
+    """A named sequence of SQL statements to be benchmarked."""
+
+    name: str
+    queries: List[str]
+    setup_queries: List[str] = field(default_factory=list)
+
+
+@dataclass
+class FunctionStage:
+    """
+    A named Python function to be benchmarked.
+
+    If setup is specified, it is called before every run and its result is
+    passed to the function.
+    """
+
+    name: str
+    function: Callable
+    setup: Optional[Callable] = None
+
+
+@dataclass
+class StageResult:
+    """Measurements of a single benchmark stage."""
+
+    name: str
+    wall_time: float
+    wall_times: List[float]
+    rows: int
+    plans: List[object] = field(default_factory=list)
+    # number of buffers accessed by all explained statements
+    buffers: Optional[int] = None
+
+
+class BenchmarkCase(DatabaseTestCase):
+    """
+    The base class of all benchmarks.
+
+    Subclasses have to override seed() and stages().
+    """
+
+    default_size = 1000
+
+    result_path: str
+
+    @property
+    def baseline_path(self) -> str:
+        return os.path.splitext(self.result_path)[0] + '_baseline.json'
+
+    @property
+    def size(self) -> int:
+        return int(os.getenv('BENCHMARK_SIZE', self.default_size))
+
+    @property
+    def repeat(self) -> int:
+        return int(os.getenv('BENCHMARK_REPEAT', 3))
+
+    @property
+    def threshold(self) -> float:
+        return float(os.getenv('BENCHMARK_THRESHOLD', 0.25))
+
+    def seed(self):
+        """Fill the database with the data to be benchmarked."""
+        raise NotImplementedError()
+
+    def stages(self) -> List[FunctionStage]:
+        raise NotImplementedError()
+
+    def prepare(self):
+
+        logger.info(f"Seeding database (size={self.size}) ...")
+        self.seed()
+
+    def run_benchmark(self):
+
+        self.prepare()
+
+        results = []
+        for stage in self.stages():
+            logger.info(f"Benchmarking {stage.name} ...")
+            results.append(self.measure_stage(stage))
+
+        report = dict(
+            size=self.size,
+            repeat=self.repeat,
+            stages={result.name: asdict(result) for result in results})
+        self.store_json(self.result_path, report)
+        logger.info(f"Benchmark results were stored in {self.result_path}")
+
+        baseline = self.load_json(self.baseline_path)
+        if baseline is None or check_env('BENCHMARK_UPDATE_BASELINE'):
+            self.store_json(self.baseline_path, self.strip_plans(report))
+            logger.info(f"Baseline was updated in {self.baseline_path}")
+            return
+
+        self.compare_baseline(report, baseline)
+
+    def measure_stage(self, stage: FunctionStage) -> StageResult:
+
+        wall_times = []
+        rows = None
+        for _ in range(self.repeat):
+            args = [stage.setup()] if stage.setup else []
+            start = time.perf_counter()
+            result = stage.function(*args)
+            wall_times.append(time.perf_counter() - start)
+            try:
+                rows = len(result)
+            except TypeError:
+                pass  # result is not sized
+
+        return StageResult(
+            name=stage.name,
+            wall_time=statistics.median(wall_times),
+            wall_times=wall_times,
+            rows=rows)
+
+    def compare_baseline(self, report, baseline):
+
+        if baseline['size'] != report['size']:
+            self.skipTest(
+                f"Baseline was recorded for size {baseline['size']}, "
+                f"not {report['size']}")
+
+        regressions = {}
+        for name, result in report['stages'].items():
+            try:
+                expected = baseline['stages'][name]
+            except KeyError:
+                logger.warning(f"No baseline for stage {name}")
+                continue
+            for metric in ['wall_time', 'buffers']:
+                if not result.get(metric) or not expected.get(metric):
+                    continue
+                ratio = result[metric] / expected[metric]
+                logger.info(f"{name}: {metric} {result[metric]} ({ratio:.0%})")
+                if ratio > 1 + self.threshold:
+                    regressions[f'{name} ({metric})'] = ratio
+
+        self.assertFalse(
+            regressions,
+            msg="The following stages regressed against the baseline: " + ', '
+                .join(
+                    f"{name} ({ratio:.0%})"
+                    for name, ratio in regressions.items()))
+
+    @staticmethod
+    def strip_plans(report):
+
+        return dict(report, stages={
+            name: dict(result, plans=[])
+            for name, result in report['stages'].items()
+        })
+
+    @staticmethod
+    def load_json(path: str) -> Optional[Dict]:
+
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def store_json(path: str, data: Dict):
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=2)
+
+
+class SqlBenchmarkCase(BenchmarkCase):
+    """
+    The base class of all benchmarks for SQL stages.
+
+    Subclasses have to override seed() and stages(). Every stage is executed
+    in a separate transaction that is rolled back afterwards, so all stages
+    operate on the same seeded data.
+    """
+
+    def stages(self) -> List[Stage]:
+        raise NotImplementedError()
+
+    def prepare(self):
+
+        super().prepare()
+        self.analyze()
+
+    def measure_stage(self, stage: Stage) -> StageResult:
+
+        if isinstance(stage, FunctionStage):
+            return super().measure_stage(stage)
+
+        wall_times = []
+        rows = None
+        for _ in range(self.repeat):
+            wall_time, rows, _plans = self.execute_stage(stage, explain=False)
+            wall_times.append(wall_time)
+        _wall_time, _rows, plans = self.execute_stage(stage, explain=True)
+
+        return StageResult(
+            name=stage.name,
+            wall_time=statistics.median(wall_times),
+            wall_times=wall_times,
+            rows=rows,
+            plans=plans,
+            buffers=sum(
+                self.count_plan_buffers(plan['plan']) for plan in plans))
+
+    def execute_stage(self, stage: Stage, explain: bool):
+        """
+        Execute all queries of the stage in one transaction and roll it back.
+
+        If explain is True, all explainable statements are executed using
+        EXPLAIN ANALYZE and their plans are returned.
+        """
+        statements = [
+            statement
+            for query in stage.queries
+            for statement in self.split_statements(query)
+        ]
+        rows = None
+        plans = []
+
+        connection = self.connect()
+        try:
+            with connection.cursor() as cursor:
+                for query in stage.setup_queries:
+                    cursor.execute(query)
+
+                start = time.perf_counter()
+                for statement in statements:
+                    if explain and EXPLAINABLE_PATTERN.match(statement):
+                        cursor.execute(
+                            'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) '
+                            + statement)
+                        [(plan,)] = cursor.fetchall()
+                        plans.append(dict(statement=statement, plan=plan))
+                        rows = self.count_plan_rows(plan)
+                    else:
+                        cursor.execute(statement)
+                        rows = cursor.rowcount
+                wall_time = time.perf_counter() - start
+        finally:
+            connection.rollback()
+            connection.close()
+
+        return wall_time, rows, plans
+
+    def connect(self):
+
+        return psycopg2.connect(
+            host=self.db_connector.host,
+            database=self.db_connector.database,
+            user=self.db_connector.user,
+            password=self.db_connector.password)
+
+    def copy_rows(self, table: str, columns: List[str], rows: List[tuple]):
+        """Bulk load the rows into the table using COPY."""
+        connection = self.connect()
+        try:
+            with connection, connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f'''
+                        COPY {table} ({", ".join(columns)})
+                        FROM STDIN WITH (FORMAT CSV)
+                    ''',
+                    _RowReader(rows))
+        finally:
+            connection.close()
+
+    def analyze(self):
+
+        connection = self.connect()
+        try:
+            connection.autocommit = True  # required for VACUUM
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM ANALYZE')
+        finally:
+            connection.close()
+
+    @staticmethod
+    def split_statements(query: str) -> List[str]:
+
+        return [
+            statement
+            for statement in query.split(';')
+            if statement.strip()
+        ]
+
+    @staticmethod
+    def count_plan_rows(plan) -> int:
+
+        node = plan[0]['Plan']
+        # Modifying statements don't return any rows themselves
+        while node.get('Node Type') == 'ModifyTable' and node.get('Plans'):
+            node = node['Plans'][0]
+        return node.get('Actual Rows')
+
+    @staticmethod
+    def count_plan_buffers(plan) -> int:
+
+        # The buffers of the root node include those of all its children
+        node = plan[0]['Plan']
+        return sum(
+            node.get(f'{kind} {access} Blocks', 0)
+            for kind in ['Shared', 'Local', 'Temp']
+            for access in ['Hit', 'Read', 'Written']
+        )
+
+
+class _RowReader:
+    """Provide a file-like CSV view of rows for cursor.copy_expert()."""
+
+    def __init__(self, rows):
+
+        self.lines = (self.format_row(row) for row in rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+    @staticmethod
+    def format_row(row):
+
+        def format_value(value):
+            if value is None:
+                return ''
+            if isinstance(value, (list, tuple)):
+                value = '{' + ','.join(
+                    '"' + str(item).replace('"', '\\"') + '"'
+                    for item in value
+                ) + '}'
+            value = str(value)
+            return '"' + value.replace('"', '""') + '"'
+
+        return ','.join(map(format_value, row)) + '\n'
@@ -0,0 +1,105 @@
+"""
+Provides a local stub of the Facebook Graph API that replays responses.
+
+Use GraphApiStub as a context manager to serve recorded responses on a local
+HTTP server while the tasks are running. The stub answers both batch
+requests and single requests.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+import facebook
+
+
+def recorded_response(content, status_code=200, headers=None):
+    """Create a response as if it had been received from the Graph API."""
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content.encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class GraphApiStub:
+    """A local HTTP server replaying recorded Graph API responses."""
+
+    def __init__(self, responses, unprocessed=()):
+        """
+        Create a stub for the given responses.
+
+        responses maps the path of each object (e.g., '<post_id>/insights')
+        to a tuple of the status code and the response content. Requests to
+        unknown paths are answered with 404. All paths in unprocessed are
+        skipped in batch requests, imitating a timeout in the API.
+        """
+        self.responses = responses
+        self.unprocessed = set(unprocessed)
+        self.batch_requests = []
+        self.single_requests = []
+
+    def __enter__(self):
+        """Start the server and redirect all requests to it."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):  # noqa: N802
+                relative_url = self.path.split('/', 2)[2]
+                stub.single_requests.append(relative_url)
+                status_code, body = stub.respond(relative_url)
+                self.send_response(status_code)
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def do_POST(self):  # noqa: N802
+                length = int(self.headers['Content-Length'])
+                form = parse_qs(self.rfile.read(length).decode())
+                batch = json.loads(form['batch'][0])
+                stub.batch_requests.append(batch)
+                results = []
+                for request in batch:
+                    relative_url = request['relative_url']
+                    if urlsplit(relative_url).path in stub.unprocessed:
+                        results.append(None)
+                        continue
+                    status_code, body = stub.respond(relative_url)
+                    results.append({'code': status_code, 'body': body})
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(json.dumps(results).encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.patches = [
+            patch.object(facebook, 'API_BASE', f'http://{host}:{port}/v0'),
+            patch.dict(os.environ, FB_ACCESS_TOKEN='stub')
+        ]
+        for patcher in self.patches:
+            patcher.start()
+        return self
+
+    def __exit__(self, *args):
+        """Stop the server and restore the original API."""
+        for patcher in reversed(self.patches):
+            patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, relative_url):
+        """Answer the status code and the body for a relative URL."""
+        path = urlsplit(relative_url).path
+        if path not in self.responses:
+            return 404, json.dumps({'error': {'message': f"Unknown {path}"}})
+        status_code, content = self.responses[path]
+        return status_code, json.dumps(content)
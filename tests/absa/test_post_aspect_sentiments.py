@@ -0,0 +1,294 @@
+import pandas as pd
+
+from absa.post_aspect_sentiments import \
+    CollectPostAspectSentimentsLinearDistance, \
+    PostAspectSentimentsLinearDistanceLimitToDb, \
+    PostAspectSentimentsLinearDistanceWeightToDb, \
+    PostPhraseAspectPolaritiesToDb
+from db_test import DatabaseTestCase
+
+COLUMNS = [
+    'source', 'post_id', 'aspect_id',
+    'linear_distance', 'sentiment',
+    'aspect_count', 'polarity_count',
+    'dataset', 'aspect_match_algorithm', 'sentiment_match_algorithm'
+]
+
+# The linear distance queries that were used before the computation has been
+# moved into CollectPostAspectSentimentsLinearDistance.
+REFERENCE_LINEAR_DISTANCE_QUERY = '''
+    SELECT
+        source, post_id,
+        aspect_id,
+        aspect_word_index,
+        polarity_phrase_n, polarity_word_index,
+        CASE
+            WHEN sum(polarity) = 0 THEN NULL
+            ELSE sum(polarity ^ 2) / sum(polarity)
+        END AS polarity,
+        least(
+            min(abs(polarity_word_index - (
+                aspect_word_index + aspect_phrase_n - 1)
+            )),
+            min(abs(aspect_word_index - (
+                polarity_word_index + polarity_phrase_n - 1)
+            ))
+        ) AS linear_distance,
+        dataset,
+        aspect_match_algorithm,
+        sentiment_match_algorithm
+    FROM absa.post_phrase_aspect_polarity
+    GROUP BY
+        source, post_id,
+        aspect_id,
+        aspect_word_index,
+        polarity_phrase_n, polarity_word_index,
+        dataset, aspect_match_algorithm,
+        sentiment_match_algorithm
+'''
+REFERENCE_LIMIT_QUERY = '''
+    SELECT
+        source, post_id,
+        aspect_id,
+        round(avg(linear_distance))::int AS linear_distance,
+        CASE
+            WHEN sum(polarity) = 0 THEN NULL
+            ELSE sum(polarity ^ 2) / sum(polarity)
+        END AS sentiment,
+        count(DISTINCT aspect_word_index) AS aspect_count,
+        count(DISTINCT polarity_word_index) AS polarity_count,
+        dataset,
+        aspect_match_algorithm,
+        sentiment_match_algorithm
+    FROM linear_distance
+    WHERE linear_distance <= 4
+    GROUP BY
+        source, post_id, aspect_id,
+        dataset, aspect_match_algorithm,
+        sentiment_match_algorithm
+'''
+REFERENCE_WEIGHT_QUERY = '''
+    SELECT
+        source, post_id,
+        aspect_id,
+        round(avg(linear_distance))::int AS linear_distance,
+        CASE
+            WHEN sum(polarity) = 0 THEN NULL
+            ELSE sum(polarity ^ 2 * linear_weight)
+                / sum(polarity * linear_weight)
+        END AS sentiment,
+        count(DISTINCT aspect_word_index) AS aspect_count,
+        count(DISTINCT polarity_word_index) AS polarity_count,
+        dataset,
+        aspect_match_algorithm,
+        sentiment_match_algorithm
+    FROM (
+        SELECT
+            *,
+            (CASE WHEN
+                linear_distance <= 5 * sqrt(-ln(1e-6))
+            THEN round(
+                exp(-((linear_distance::numeric / 5) ^ 2)),
+                6
+            )
+            ELSE
+                0
+            END) AS linear_weight
+        FROM linear_distance
+    ) AS linear_weight
+    WHERE linear_weight > 0
+    GROUP BY
+        source, post_id, aspect_id,
+        dataset, aspect_match_algorithm,
+        sentiment_match_algorithm
+'''
+
+
+class TestPostAspectSentimentsLinearDistance(DatabaseTestCase):
+    """Tests the linear distance tasks against the original SQL queries."""
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.db_connector.execute(
+            '''
+                INSERT INTO absa.target_aspect VALUES
+                    (1, '{service}'), (2, '{exhibition}')
+            '''
+        )
+
+    def insert_posts(self):
+
+        self.db_connector.execute(
+            # Aspects
+            '''
+                INSERT INTO absa.post_word VALUES
+                    ('Twitter', '1', 10, 'service', 1),
+                    ('Twitter', '1', 12, 'exhibition', 1),
+                    ('Twitter', '2', 3, 'service', 1),
+                    ('Twitter', '3', 1, 'service', 1)
+            ''',
+            '''
+                INSERT INTO absa.post_ngram VALUES
+                    ('Twitter', '1', 1, 10, 'service', 1),
+                    ('Twitter', '1', 2, 10, 'service was', 1),
+                    ('Twitter', '1', 1, 12, 'exhibition', 1),
+                    ('Twitter', '2', 1, 3, 'service', 1),
+                    ('Twitter', '3', 1, 1, 'service', 1)
+            ''',
+            '''
+                INSERT INTO absa.post_aspect VALUES
+                    ('Twitter', '1', 10, 1, NULL, 'spam'),
+                    ('Twitter', '1', 12, 2, NULL, 'spam'),
+                    ('Twitter', '2', 3, 1, NULL, 'spam'),
+                    ('Twitter', '3', 1, 1, NULL, 'spam')
+            ''',
+            # Polarity phrases
+            '''
+                INSERT INTO absa.post_ngram VALUES
+                    ('Twitter', '1', 1, 5, 'bad', 1),
+                    ('Twitter', '1', 1, 6, 'good', 1),
+                    ('Twitter', '1', 2, 13, 'very nice', 1),
+                    ('Twitter', '1', 1, 15, 'okay', 1),
+                    ('Twitter', '1', 1, 28, 'great', 2),
+                    ('Twitter', '1', 1, 29, 'awful', 2),
+                    ('Twitter', '1', 1, 30, 'perfect', 2),
+                    ('Twitter', '2', 1, 4, 'neutral', 1),
+                    ('Twitter', '4', 1, 1, 'lonely', 1)
+            ''',
+            '''
+                INSERT INTO absa.post_phrase_polarity VALUES
+                    ('Twitter', '1', 1, 5, -1, 0, 'foo', 'eggs'),
+                    ('Twitter', '1', 1, 6, 0.5, 0, 'foo', 'eggs'),
+                    ('Twitter', '1', 2, 13, 0.8, 0, 'foo', 'eggs'),
+                    ('Twitter', '1', 2, 13, -0.4, 0, 'bar', 'eggs'),
+                    ('Twitter', '1', 1, 15, 0.2, 0, 'foo', 'eggs'),
+                    ('Twitter', '1', 1, 28, 1, 0, 'foo', 'eggs'),
+                    ('Twitter', '1', 1, 29, -0.3, 0, 'foo', 'eggs'),
+                    ('Twitter', '1', 1, 30, 1, 0, 'foo', 'eggs'),
+                    ('Twitter', '2', 1, 4, 0, 0, 'foo', 'eggs'),
+                    ('Twitter', '4', 1, 1, 1, 0, 'foo', 'eggs')
+            '''
+        )
+
+    def test_limit(self):
+
+        self.insert_posts()
+        self.assert_reference(
+            CollectPostAspectSentimentsLinearDistance(
+                table=PostAspectSentimentsLinearDistanceLimitToDb.table,
+                distance_method='limit',
+                max_distance=4),
+            REFERENCE_LIMIT_QUERY)
+
+    def test_weight(self):
+
+        self.insert_posts()
+        self.assert_reference(
+            CollectPostAspectSentimentsLinearDistance(
+                table=PostAspectSentimentsLinearDistanceWeightToDb.table,
+                distance_method='weight',
+                weight_alpha=5,
+                max_distance=18),
+            REFERENCE_WEIGHT_QUERY)
+
+    def test_empty(self):
+
+        for distance_method, query in [
+                ('limit', REFERENCE_LIMIT_QUERY),
+                ('weight', REFERENCE_WEIGHT_QUERY)]:
+            with self.subTest(distance_method=distance_method):
+                self.assert_reference(
+                    CollectPostAspectSentimentsLinearDistance(
+                        table=f'test_{distance_method}',
+                        distance_method=distance_method,
+                        max_distance=4),
+                    query)
+
+    def test_incremental(self):
+
+        self.insert_posts()
+        task = PostAspectSentimentsLinearDistanceLimitToDb(dummy_date=1)
+        self.run_linear_distance(task)
+        self.assertSequenceEqual(
+            [('1', 1, -0.4), ('1', 1, 0.62), ('1', 2, -0.4), ('1', 2, 0.68)],
+            self.stored_sentiments(task.table))
+
+        # Tamper unchanged post to detect whether it is recomputed
+        self.db_connector.execute(
+            f'''
+                UPDATE {task.table} SET sentiment = -1
+                WHERE (post_id, dataset) = ('1', 'bar')
+            ''',
+            '''
+                UPDATE absa.post_phrase_polarity SET polarity = 0.5
+                WHERE (post_id, word_index) = ('2', 4)
+            '''
+        )
+        task = PostAspectSentimentsLinearDistanceLimitToDb(dummy_date=2)
+        self.run_linear_distance(task)
+        self.assertSequenceEqual(
+            [
+                ('1', 1, -1), ('1', 1, 0.62),
+                ('1', 2, -1), ('1', 2, 0.68),
+                ('2', 1, 0.5)
+            ],
+            self.stored_sentiments(task.table),
+            msg="Only the changed post should have been recomputed")
+
+        self.db_connector.execute('TRUNCATE absa.post_phrase_polarity')
+        task = PostAspectSentimentsLinearDistanceLimitToDb(dummy_date=3)
+        self.run_linear_distance(task)
+        self.assertFalse(
+            self.stored_sentiments(task.table),
+            msg="All posts should have been recomputed after truncation")
+
+    def assert_reference(self, task, query):
+
+        task.requires().run()
+        task.run()
+        with task.output().open('r') as output_file:
+            actual = pd.read_csv(output_file, dtype={'post_id': str})
+
+        PostPhraseAspectPolaritiesToDb().run()
+        rows, columns = self.db_connector.query_with_header(f'''
+            WITH linear_distance AS (
+                {REFERENCE_LINEAR_DISTANCE_QUERY}
+            )
+            {query}
+        ''')
+        expected = pd.DataFrame(rows, columns=columns)
+
+        self.assertListEqual(COLUMNS, list(actual.columns))
+        self.assertListEqual(COLUMNS, list(expected.columns))
+        actual, expected = (
+            df.sort_values(COLUMNS[:3] + COLUMNS[-3:])
+            .reset_index(drop=True)
+            .astype({'sentiment': float})
+            for df in (actual, expected)
+        )
+        pd.testing.assert_frame_equal(
+            expected, actual,
+            check_dtype=False,
+            check_exact=False,
+            rtol=1e-5)
+
+    def run_linear_distance(self, task):
+
+        task.changes().run()
+        task.requires().run()
+        task.run()
+
+    def stored_sentiments(self, table):
+
+        return [
+            (post_id, aspect_id, round(sentiment, 2))
+            for post_id, aspect_id, sentiment
+            in self.db_connector.query(f'''
+                SELECT post_id, aspect_id, sentiment
+                FROM {table}
+                WHERE sentiment IS NOT NULL
+                ORDER BY post_id, aspect_id, dataset
+            ''')
+        ]
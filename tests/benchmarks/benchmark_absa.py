@@ -0,0 +1,197 @@
+"""
+Benchmark for the SQL stages of the ABSA pipeline.
+
+BENCHMARK_SIZE specifies the approximate number of synthetic posts. Posts and
+lexica are generated by scripts/tests/generate_synthetic_data.py.
+"""
+
+from itertools import groupby
+
+from absa.phrase_matching import FuzzyMatchIdentity, FuzzyMatchLevenshtein, \
+    FuzzyMatchTrigram
+from absa.post_aspect_sentiments import PostPhraseAspectPolaritiesToDb
+from absa.post_aspects import CollectPostAspectsEquality, \
+    CollectPostAspectsLevenshtein, CollectPostAspectsTrigram
+from absa.post_ngrams import ClaimPostNgrams, CollectPostNgrams
+from absa.post_sentiments import FuzzyJoinPostSentiments
+from absa.post_words import CollectPostWords
+from benchmark import SqlBenchmarkCase, Stage
+from generate_synthetic_data import LEXICON_SIZES, TABLE_SIZES, \
+    SyntheticDataGenerator
+
+
+SEED = 42
+N_MAX = 4
+
+# Tables providing the synthetic posts
+POST_TABLES = [
+    'fb_post', 'fb_post_comment', 'ig_post', 'tweet',
+    'google_maps_review', 'appstore_review', 'gplay_review'
+]
+
+
+class AbsaBenchmark(SqlBenchmarkCase):
+    """Benchmark all SQL stages of the ABSA pipeline."""
+
+    result_path = 'output/benchmarks/absa.json'
+
+    def test_absa(self):
+
+        self.run_benchmark()
+
+    def stages(self):
+
+        for n in range(1, N_MAX + 1):
+            yield Stage(
+                name=f'CollectPostNgrams(n={n})',
+                setup_queries=[ClaimPostNgrams(
+                    table='absa.post_ngram',
+                    minimal_mode=False
+                ).build_claim_query()],
+                queries=[CollectPostNgrams(
+                    table='absa.post_ngram',
+                    minimal_mode=False
+                )._build_query(n)])
+
+        for collect_aspects in [
+                CollectPostAspectsEquality,
+                CollectPostAspectsTrigram,
+                CollectPostAspectsLevenshtein]:
+            yield Stage(
+                name=collect_aspects.__name__,
+                queries=[collect_aspects(
+                    table='absa.post_aspect',
+                    minimal_mode=False
+                ).build_query()])
+
+        for algorithm in [
+                FuzzyMatchIdentity(),
+                FuzzyMatchLevenshtein(),
+                FuzzyMatchTrigram()]:
+            yield Stage(
+                name=f'FuzzyJoinPostSentiments({algorithm.name})',
+                queries=[FuzzyJoinPostSentiments(
+                    table='absa.post_phrase_polarity',
+                    algorithm=algorithm,
+                    minimal_mode=False
+                ).build_query()])
+
+        cache = PostPhraseAspectPolaritiesToDb(minimal_mode=False)
+        yield Stage(
+            name=type(cache).__name__,
+            setup_queries=[
+                'INSERT INTO absa.post_aspect '
+                'SELECT * FROM benchmark_post_aspect',
+                'INSERT INTO absa.post_phrase_polarity '
+                'SELECT * FROM benchmark_post_phrase_polarity'
+            ],
+            queries=[
+                f'TRUNCATE TABLE {cache.table}',
+                f'INSERT INTO {cache.table} {cache.build_query()}'
+            ])
+
+    def seed(self):
+
+        SyntheticDataGenerator(
+            self.db_connector,
+            scale=self.size / sum(TABLE_SIZES[table] for table in POST_TABLES),
+            seed=SEED
+        ).generate(tables=[*POST_TABLES, 'tweet_author', *LEXICON_SIZES])
+
+        words = list(self.tokenize_posts())
+        self.copy_rows(
+            'absa.post_word',
+            ['source', 'post_id', 'word_index', 'word', 'sentence_index'],
+            words)
+        self.db_connector.execute('''
+            INSERT INTO pipeline_watermark
+                (table_name, source, post_id, processed_at)
+            SELECT DISTINCT 'absa.post_word', source, post_id, now()
+            FROM absa.post_word
+        ''')
+        stopwords = {
+            word
+            for word, in self.db_connector.query(
+                'SELECT word FROM absa.stopword')
+        }
+        ngrams = list(self.generate_ngrams(words, stopwords))
+        self.copy_rows(
+            'absa.post_ngram',
+            ['source', 'post_id', 'n', 'word_index', 'phrase',
+             'sentence_index'],
+            ngrams)
+
+        # Expected results of previous stages for the cache stage
+        self.db_connector.execute(
+            '''
+                CREATE TABLE benchmark_post_aspect
+                (LIKE absa.post_aspect)
+            ''',
+            '''
+                CREATE TABLE benchmark_post_phrase_polarity
+                (LIKE absa.post_phrase_polarity)
+            ''')
+        aspect_ids = dict(self.db_connector.query('''
+            SELECT word, aspect_id
+            FROM absa.target_aspect_word
+        '''))
+        self.copy_rows(
+            'benchmark_post_aspect',
+            ['source', 'post_id', 'word_index', 'aspect_id',
+             'target_aspect_word', 'match_algorithm'],
+            [
+                (source, post_id, word_index, aspect_ids[phrase], phrase,
+                 'equality')
+                for source, post_id, n, word_index, phrase, _sentence
+                in ngrams
+                if n == 1 and phrase in aspect_ids
+            ])
+        polarity_weights = dict(self.db_connector.query('''
+            SELECT phrase, weight
+            FROM absa.phrase_polarity_sepl
+        '''))
+        self.copy_rows(
+            'benchmark_post_phrase_polarity',
+            ['source', 'post_id', 'n', 'word_index', 'polarity', 'stddev',
+             'dataset', 'match_algorithm'],
+            [
+                (source, post_id, n, word_index, polarity_weights[phrase],
+                 0, 'SePL', 'identity')
+                for source, post_id, n, word_index, phrase, _sentence
+                in ngrams
+                if phrase in polarity_weights
+            ])
+
+    def tokenize_posts(self):
+        """Split up all posts into words like CollectPostWords."""
+        collect_words = CollectPostWords(table='absa.post_word')
+        posts = self.db_connector.query('''
+            SELECT source, post_id, text
+            FROM post
+            WHERE text <> ''
+        ''')
+        for source, post_id, text in posts:
+            for word_index, (word, sentence_index) in enumerate(
+                    collect_words.tokenize(text), start=1):
+                yield source, post_id, word_index, word, sentence_index
+
+    @staticmethod
+    def generate_ngrams(words, stopwords):
+        """Generate all n-grams like CollectPostNgrams."""
+        sentences = groupby(
+            words,
+            key=lambda word: (word[0], word[1], word[4]))
+        for (source, post_id, sentence_index), sentence in sentences:
+            sentence = [
+                (word_index, word)
+                for _source, _post_id, word_index, word, _sentence_index
+                in sentence
+            ]
+            for i, (word_index, _word) in enumerate(sentence):
+                for n in range(1, N_MAX + 1):
+                    phrase = [word for _index, word in sentence[i:i + n]]
+                    if len(phrase) < n or stopwords & set(phrase):
+                        break
+                    yield (
+                        source, post_id, n, word_index, ' '.join(phrase),
+                        sentence_index)
@@ -0,0 +1,143 @@
+"""
+Benchmark for the preprocessing and training stages of the topic modeling.
+
+BENCHMARK_SIZE specifies the number of synthetic posts. The legacy stages
+replicate the former list-based preprocessing and the pure Python GSDMM
+implementation (gsdmm.MovieGroupProcess) for comparison.
+"""
+
+from contextlib import redirect_stdout
+from copy import deepcopy
+import os
+import random
+
+from gsdmm import MovieGroupProcess
+from nltk.tokenize import word_tokenize
+import pandas as pd
+
+from benchmark import BenchmarkCase, FunctionStage
+from topic_modeling import TopicModelingPreprocessCorpus, filter_tokens
+from topic_modeling.gsdmm import GSDMM
+
+
+SEED = 42
+# Number of clusters and iterations for training the models
+K = 12
+N_ITERS = 10
+
+
+class TopicModelingBenchmark(BenchmarkCase):
+    """Benchmark the preprocessing and training of topic models."""
+
+    result_path = 'output/benchmarks/topic_modeling.json'
+
+    default_size = 10000
+
+    def test_topic_modeling(self):
+
+        self.run_benchmark()
+
+    def stages(self):
+
+        task = TopicModelingPreprocessCorpus()
+
+        def tokenize(parallel):
+            task.min_parallel_texts = 0 if parallel else len(self.texts) + 1
+            return task.tokenize(self.texts)
+
+        yield FunctionStage(
+            name='tokenize(serial)',
+            function=lambda: tokenize(parallel=False))
+        yield FunctionStage(
+            name='tokenize(parallel)',
+            function=lambda: tokenize(parallel=True))
+
+        yield FunctionStage(
+            name='filter_tokens(legacy)',
+            function=lambda tokens: self.legacy_filter_tokens(
+                tokens, list(task.stop_words)),
+            setup=lambda: deepcopy(self.raw_tokens))
+        yield FunctionStage(
+            name='filter_tokens',
+            function=lambda tokens: task.build_corpus(
+                self.docs,
+                [filter_tokens(doc_tokens, task.stop_words)
+                 for doc_tokens in tokens]),
+            setup=lambda: self.raw_tokens)
+
+        docs = [
+            filter_tokens(doc_tokens, task.stop_words)
+            for doc_tokens in self.raw_tokens
+        ]
+        vocab_size = len({token for doc in docs for token in doc})
+        yield FunctionStage(
+            name='MovieGroupProcess.fit(legacy)',
+            function=lambda: self.silent(
+                MovieGroupProcess(K=K, n_iters=N_ITERS).fit,
+                docs, vocab_size))
+        yield FunctionStage(
+            name='GSDMM.fit',
+            function=lambda: GSDMM(K=K, n_iters=N_ITERS).fit(
+                docs, vocab_size))
+
+    def seed(self):
+
+        self.random = random.Random(SEED)
+
+        stop_words = list(TopicModelingPreprocessCorpus().stop_words)
+        words = [
+            ''.join(
+                self.random.choice('bcdfghklmnprstwz')
+                + self.random.choice('aeiouäöü')
+                for _ in range(self.random.randint(1, 4)))
+            for _ in range(5000)
+        ]
+        vocabulary = [
+            (0.4, stop_words),
+            (0.5, words),
+            (0.1, ['2020', '!', ':)', 'a', 'https://example.com'])
+        ]
+        self.texts = [
+            self.generate_text(vocabulary)
+            for _ in range(self.size)
+        ]
+        self.docs = pd.DataFrame({'text': self.texts})
+        self.raw_tokens = [
+            word_tokenize(text.lower())
+            for text in self.texts
+        ]
+
+    def generate_text(self, vocabulary):
+
+        weights, word_lists = zip(*vocabulary)
+        return ' '.join(
+            self.random.choice(self.random.choices(word_lists, weights)[0])
+            for _ in range(self.random.randint(3, 40)))
+
+    @staticmethod
+    def silent(function, *args):
+        """Suppress the progress messages printed by MovieGroupProcess."""
+        with open(os.devnull, 'w') as null_file, redirect_stdout(null_file):
+            return function(*args)
+
+    @staticmethod
+    def legacy_filter_tokens(tokens, stop_words):
+        """Filter tokens like the former implementation of preprocess()."""
+        for i, doc_tokens in enumerate(tokens):
+            doc_tokens = [token for token in doc_tokens
+                          if token not in stop_words]
+            doc_tokens = [token for token in doc_tokens
+                          if token.isalpha()]
+            tokens[i] = [token for token in doc_tokens
+                         if len(token) > 1]
+
+        counts = {}
+        for doc_tokens in tokens:
+            for token in doc_tokens:
+                counts[token] = counts.get(token, 0) + 1
+        for doc_tokens in tokens:
+            for token in doc_tokens:
+                if counts[token] == 1:
+                    doc_tokens.remove(token)
+
+        return [doc_tokens for doc_tokens in tokens if len(doc_tokens) > 2]
@@ -0,0 +1,89 @@
+"""
+Benchmark for the feature engineering of the visitor prediction.
+
+BENCHMARK_SIZE specifies the number of days in the synthetic entries (10
+years by default). The legacy stage runs the former implementation of
+preprocess_entries(), which scanned all dates for every exhibition. The
+unit tests check that both implementations compute identical features.
+"""
+
+import random
+
+import pandas as pd
+
+from benchmark import BenchmarkCase, FunctionStage
+from tests.test_visitor_prediction import legacy_preprocess_entries
+from visitor_prediction.preprocessing import preprocess_entries
+
+
+SEED = 42
+
+
+class VisitorPredictionBenchmark(BenchmarkCase):
+    """Benchmark the preprocessing of entries for visitor prediction."""
+
+    result_path = 'output/benchmarks/visitor_prediction.json'
+
+    default_size = 3653
+
+    def test_visitor_prediction(self):
+
+        self.run_benchmark()
+
+    def stages(self):
+
+        yield FunctionStage(
+            name='preprocess_entries(legacy)',
+            function=lambda inputs: legacy_preprocess_entries(*inputs),
+            setup=self.copy_inputs)
+        yield FunctionStage(
+            name='preprocess_entries',
+            function=lambda inputs: preprocess_entries(*inputs),
+            setup=self.copy_inputs)
+
+    def seed(self):
+
+        self.random = random.Random(SEED)
+
+        dates = pd.date_range('2015-01-01', periods=self.size)
+        self.entries = pd.DataFrame(
+            index=dates,
+            data=[[self.random.randint(0, 2000)] for _ in dates],
+            columns=['entries'])
+
+        # consecutive exhibitions that overlap occasionally
+        exhibitions = []
+        start_date = dates[0]
+        while start_date < dates[-1]:
+            end_date = start_date + pd.Timedelta(
+                days=self.random.randint(60, 150))
+            exhibitions.append({
+                'title': f'Exhibition {len(exhibitions)}',
+                'start_date': start_date,
+                'end_date': end_date,
+                'special': '',
+                'popularity': self.random.randint(1, 100)
+            })
+            exhibitions.append({
+                'title': f'Closing days {len(exhibitions)}',
+                'start_date': end_date + pd.Timedelta(days=1),
+                'end_date': end_date + pd.Timedelta(days=3),
+                'special': 'closing day',
+                'popularity': 0
+            })
+            start_date = end_date + pd.Timedelta(
+                days=self.random.randint(-20, 10))
+        self.exhibitions = pd.DataFrame(exhibitions)
+
+        self.facts = {
+            'missing_closed_timespans': [
+                {'start': '2020-03-12', 'end': '2020-05-05'}
+            ],
+            'limited_entry_timespans': [
+                {'start': '2020-05-06', 'end': '2021-05-05'}
+            ]
+        }
+
+    def copy_inputs(self):
+
+        return self.entries.copy(), self.exhibitions.copy(), self.facts
@@ -53,6 +53,24 @@ class CheckPosts(DatabaseTestCase):
                 f"sources: {invalid_sources}"
         )
 
+    def test_post_consistent(self):
+        """Compare the materialized post table with its view definition."""
+        inconsistent_sources = {
+            source for [source] in self.db_connector.query('''
+                SELECT DISTINCT source
+                FROM (
+                    (SELECT * FROM post EXCEPT SELECT * FROM post_view)
+                    UNION ALL
+                    (SELECT * FROM post_view EXCEPT SELECT * FROM post)
+                ) AS difference
+            ''')}
+
+        self.assertFalse(
+            inconsistent_sources,
+            msg=f"Post table is out of sync with post_view for the following "
+                f"sources: {inconsistent_sources}"
+        )
+
     def test_permalink_missing(self):
 
         invalid_sources = self.db_connector.query('''
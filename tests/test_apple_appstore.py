@@ -3,6 +3,7 @@ from unittest.mock import MagicMock, patch
 
 import pandas as pd
 import requests
+from freezegun import freeze_time
 
 from apple_appstore import FetchAppstoreReviews, AppstoreReviewsToDb
 from db_test import DatabaseTestCase
@@ -101,17 +102,82 @@ class TestFetchAppleReviews(DatabaseTestCase):
             'country_code'],
             list(result.columns))
 
+    @patch('apple_appstore.requests.get')
+    def test_stop_at_known_review(self, mock):
+
+        mock.return_value = MagicMock(ok=True, text=XML_FRAME % '''<entry>
+                <updated>2012-11-10T09:08:07-07:00</updated>
+                <id>5483431986</id>
+                <title>I'm a fish</title>
+                <content type="text">Blubb</content>
+                <im:voteSum>9</im:voteSum>
+                <im:voteCount>42</im:voteCount>
+                <im:rating>5</im:rating>
+                <im:version>2.10.7</im:version>
+                <content type="html">&lt;p&gt;Blubb&lt;/p&gt;</content>
+            </entry>''')
+
+        result = self.task.fetch_for_country(
+            'made_up_country', known_ids={'5483431986'})
+
+        # the next page is not requested
+        self.assertEqual(1, len(result))
+        mock.assert_called_once()
+
+    @patch.object(FetchAppstoreReviews, 'load_active_country_codes')
+    def test_plan_scans(self, active_mock):
+
+        active_mock.return_value = {'PL'}
+        self.task = FetchAppstoreReviews(full_sync_interval=2)
+        country_codes = sorted(FAKE_COUNTRY_CODES)
+        known_ids = {'1', '2'}
+        self.db_connector.execute((
+            '''
+                INSERT INTO full_sync (sync_key, synced_at)
+                SELECT * FROM unnest(%s::text[], %s::timestamp[])
+            ''',
+            (
+                [self.task.full_sync_key(code) for code in country_codes],
+                ['2019-12-30', '2019-12-25', '2019-12-31', '2019-12-20']
+            )
+        ))
+
+        with freeze_time('2020-01-01'):
+            scans = self.task.plan_scans(country_codes, known_ids)
+
+        # BB, DE and US are due, PL has returned reviews before
+        self.assertListEqual(
+            [('BB', set()), ('DE', set()), ('PL', known_ids), ('US', set())],
+            scans)
+        self.assertSetEqual({'BB', 'DE', 'US'}, self.task.planned_full_syncs)
+
+        with freeze_time('2019-12-31'):
+            scans = FetchAppstoreReviews(
+                full_sync_interval=12
+            ).plan_scans(country_codes, known_ids)
+
+        # no store front is due, but the least recently scanned one is
+        # scanned ahead of time
+        self.assertListEqual(
+            [('PL', known_ids), ('US', set())],
+            scans)
+
+        no_known_scans = self.task.plan_scans(country_codes, set())
+        self.assertListEqual(
+            [(country_code, set()) for country_code in country_codes],
+            no_known_scans)
+
     @patch.object(FetchAppstoreReviews, 'fetch_for_country')
     def test_all_countries(self, mock):
 
-        def mock_return():
-            for i in range(5000):
-                yield pd.DataFrame({
-                    'app_id': '123456',
-                    'country_code': [f'{i}'],
-                    'appstore_review_id': [i]
-                })
-        mock.side_effect = mock_return()
+        # country codes are fetched concurrently, so don't use a generator
+        def mock_return(country_code, known_ids):
+            return pd.DataFrame({
+                'app_id': '123456',
+                'country_code': [country_code],
+                'appstore_review_id': [country_code]
+            })
+        mock.side_effect = mock_return
 
         result = self.task.fetch_all()
 
@@ -147,7 +213,7 @@ class TestFetchAppleReviews(DatabaseTestCase):
     @patch.object(FetchAppstoreReviews, 'fetch_for_country')
     def test_all_countries_some_countries_dont_have_data(self, mock):
 
-        def mock_return(country_code):
+        def mock_return(country_code, known_ids):
             if country_code == 'BB':
                 return pd.DataFrame([])
             return pd.DataFrame({
@@ -165,7 +231,7 @@ class TestFetchAppleReviews(DatabaseTestCase):
     @patch.object(FetchAppstoreReviews, 'fetch_for_country')
     def test_drop_duplicate_reviews(self, mock):
 
-        def mock_return(country_code):
+        def mock_return(country_code, known_ids):
             if country_code == 'BB':  # simulate no available data
                 return pd.DataFrame([])
             return pd.DataFrame({
@@ -1,14 +1,17 @@
 import datetime as dt
 import json
 import re
-from unittest.mock import MagicMock, patch
+import time
+from unittest.mock import patch
 
 from freezegun import freeze_time
 from luigi.format import UTF8
 from luigi.mock import MockTarget
+import pandas as pd
 from requests.exceptions import HTTPError
 
 from db_test import DatabaseTestCase
+from graph_api_stub import GraphApiStub, recorded_response
 import facebook
 
 FB_TEST_DATA = 'tests/test_data/facebook'
@@ -17,7 +20,7 @@ FB_TEST_DATA = 'tests/test_data/facebook'
 class TestFacebookPost(DatabaseTestCase):
     """Tests the FetchFbPosts task."""
 
-    @patch('facebook.requests.get')
+    @patch('facebook.requests.Session.request')
     @patch.object(facebook.FetchFbPosts, 'output')
     @patch.object(facebook.MuseumFacts, 'output')
     def test_post_transformation(
@@ -37,12 +40,8 @@ class TestFacebookPost(DatabaseTestCase):
                   encoding='utf-8') as data_out:
             expected_data = data_out.read()
 
-        # Overwrite requests 'get' return value to provide our test data
-        def mock_json():
-            return json.loads(input_data)
-
-        mock_response = MagicMock(ok=True, json=mock_json)
-        requests_get_mock.return_value = mock_response
+        # Overwrite requests return value to provide our test data
+        requests_get_mock.return_value = recorded_response(input_data)
 
         facebook.MuseumFacts().run()
         facebook.FetchFbPosts().run()
@@ -50,7 +49,7 @@ class TestFacebookPost(DatabaseTestCase):
         with output_target.open('r') as output_data:
             self.assertEqual(expected_data, output_data.read())
 
-    @patch('facebook.requests.get')
+    @patch('facebook.requests.Session.request')
     @patch.object(facebook.FetchFbPosts, 'output')
     @patch.object(facebook.MuseumFacts, 'output')
     def test_pagination(self, fact_mock, output_mock, requests_get_mock):
@@ -67,18 +66,9 @@ class TestFacebookPost(DatabaseTestCase):
                 as previous_data_in:
             previous_data = previous_data_in.read()
 
-        def next_json():
-            return json.loads(next_data)
-
-        def previous_json():
-            return json.loads(previous_data)
-
-        next_response = MagicMock(ok=True, json=next_json)
-        previous_response = MagicMock(ok=True, json=previous_json)
-
         requests_get_mock.side_effect = [
-            next_response,
-            previous_response
+            recorded_response(next_data),
+            recorded_response(previous_data)
         ]
 
         facebook.MuseumFacts().run()
@@ -86,28 +76,66 @@ class TestFacebookPost(DatabaseTestCase):
 
         self.assertEqual(requests_get_mock.call_count, 2)
 
-    @patch('facebook.requests.get')
+    @patch('facebook.requests.Session.request')
+    @patch.object(facebook.FetchFbPosts, 'output')
+    @patch.object(facebook.MuseumFacts, 'output')
+    def test_incremental(self, fact_mock, output_mock, requests_get_mock):
+        fact_mock.return_value = MockTarget('facts_in', format=UTF8)
+        output_mock.return_value = MockTarget('post_out', format=UTF8)
+        self.db_connector.execute(
+            '''
+            INSERT INTO fb_post (page_id, post_id, post_date) VALUES
+                (1234567890, 987654321, '2020-03-01 00:00:00')
+            '''
+        )
+        requests_get_mock.return_value = recorded_response(
+            '{"data": [], "paging": {}}')
+        facebook.MuseumFacts().run()
+
+        with freeze_time('2020-03-15 00:00:00'):
+            # fetch only new posts
+            facebook.FetchFbPosts(
+                full_sync_interval=0,
+                overlap=dt.timedelta(0)
+            ).run()
+            # fetch known posts of the overlap again
+            facebook.FetchFbPosts(
+                full_sync_interval=0,
+                overlap=dt.timedelta(days=30)
+            ).run()
+            # fetch all posts
+            facebook.FetchFbPosts(full_sync_interval=1).run()
+
+        urls = [call[0][1] for call in requests_get_mock.call_args_list]
+        self.assertEqual(3, len(urls))
+        self.assertIn('&since=1583020800', urls[0])  # 2020-03-01
+        self.assertIn('&since=1581638400', urls[1])  # 2020-02-14
+        self.assertNotIn('since', urls[2])
+
+    @patch('facebook.requests.Session.request')
     @patch.object(facebook.MuseumFacts, 'output')
     def test_invalid_response_raises_error(self,
                                            fact_mock,
                                            requests_get_mock):
         fact_target = MockTarget('facts_in', format=UTF8)
         fact_mock.return_value = fact_target
-        error_mock = MagicMock(status_code=404)
-
-        def error_raiser():
-            return facebook.requests.Response.raise_for_status(error_mock)
-
-        mock_response = MagicMock(
-            ok=False, raise_for_status=error_raiser)
-
-        requests_get_mock.return_value = mock_response
+        requests_get_mock.return_value = recorded_response(
+            '{"error": {"message": "Not found"}}', status_code=404)
 
         facebook.MuseumFacts().run()
 
         with self.assertRaises(HTTPError):
             facebook.FetchFbPosts().run()
 
+    def test_details_overlap(self):
+
+        timespan = dt.timedelta(days=90)
+        for task in [
+                facebook.FetchFbPostPerformance(timespan=timespan),
+                facebook.FetchFbPostCommentSummaries(timespan=timespan)]:
+            with self.subTest(task=task):
+                self.assertEqual(timespan, task.requires().overlap)
+
 
 class TestFacebookPostPerformance(DatabaseTestCase):
     """Tests the FetchFbPostPerformance task."""
@@ -116,31 +144,25 @@ class TestFacebookPostPerformance(DatabaseTestCase):
             self,
             input_mock,
             output_mock,
-            requests_get_mock,
-            actual_json):
+            posts_csv='post_expected_single.csv'):
         input_target = MockTarget('posts_in', format=UTF8)
         input_mock.return_value = input_target
         output_target = MockTarget('insights_out', format=UTF8)
         output_mock.return_value = output_target
 
         with input_target.open('w') as posts_target:
-            with open(f'{FB_TEST_DATA}/post_expected_single.csv',
+            with open(f'{FB_TEST_DATA}/{posts_csv}',
                       'r',
                       encoding='utf-8') as posts_input:
                 posts_target.write(posts_input.read())
 
+        return output_target
+
+    def load_response(self, actual_json, status_code=200):
         with open(f'{FB_TEST_DATA}/{actual_json}',
                   'r',
                   encoding='utf-8') as json_in:
-            input_json = json_in.read()
-
-        def mock_json():
-            return json.loads(input_json)
-
-        mock_response = MagicMock(ok=True, json=mock_json)
-        requests_get_mock.return_value = mock_response
-
-        return output_target
+            return status_code, json.load(json_in)
 
     def compare_post_performance_mocks(
             self,
@@ -154,51 +176,86 @@ class TestFacebookPostPerformance(DatabaseTestCase):
         with output_target.open('r') as output_data:
             self.assertEqual(expected_insights, output_data.read())
 
-    @patch('facebook.requests.get')
     @patch.object(facebook.FetchFbPostPerformance, 'output')
     @patch.object(facebook.FetchFbPostPerformance, 'input')
-    def test_post_performance_transformation(
-            self, input_mock, output_mock, requests_get_mock):
+    def test_post_performance_transformation(self, input_mock, output_mock):
         self.db_connector.execute(
             '''
             INSERT INTO fb_post (page_id, post_id) VALUES
                 (1234567890, 987654321)
             '''
         )
+        output_target = self.prepare_post_performance_mocks(
+            input_mock,
+            output_mock
+        )
+
+        stub = GraphApiStub({
+            '1234567890_987654321/insights':
+                self.load_response('post_insights_actual.json')
+        })
+        with stub, freeze_time('2020-01-01 00:00:05'):
+            self.task = facebook.FetchFbPostPerformance(
+                timespan=dt.timedelta(days=100000),
+                table='fb_post_performance')
+            self.task.run()
+
+        self.compare_post_performance_mocks(
+            output_target,
+            'post_insights_expected.csv'
+        )
+        self.assertEqual(1, len(stub.batch_requests))
+
+    @patch.object(facebook.FetchFbPostPerformance, 'output')
+    @patch.object(facebook.FetchFbPostPerformance, 'input')
+    def test_post_performance_foreign_object(self, input_mock, output_mock):
+        self.db_connector.execute(
+            '''
+            INSERT INTO fb_post (page_id, post_id) VALUES
+                (1234567890, 987654321),
+                (1234567890, 987654322)
+            '''
+        )
         output_target = self.prepare_post_performance_mocks(
             input_mock,
             output_mock,
-            requests_get_mock,
-            'post_insights_actual.json'
+            'post_expected_foreign.csv'
         )
 
-        with freeze_time('2020-01-01 00:00:05'):
+        stub = GraphApiStub({
+            '1234567890_987654321/insights':
+                self.load_response('post_insights_actual.json'),
+            '1234567890_987654322/insights':
+                self.load_response('foreign_object_error.json', 400)
+        })
+        with stub, freeze_time('2020-01-01 00:00:05'):
             self.task = facebook.FetchFbPostPerformance(
                 timespan=dt.timedelta(days=100000),
                 table='fb_post_performance')
             self.task.run()
 
+        # The foreign post is skipped, but the other post is not affected
         self.compare_post_performance_mocks(
             output_target,
             'post_insights_expected.csv'
         )
+        self.assertEqual(1, len(stub.batch_requests))
+        self.assertEqual(2, len(stub.batch_requests[0]))
 
-    @patch('facebook.requests.get')
     @patch.object(facebook.FetchFbPostPerformance, 'output')
     @patch.object(facebook.FetchFbPostPerformance, 'input')
-    def test_post_performance_edge_cases(self,
-                                         input_mock,
-                                         output_mock,
-                                         requests_get_mock):
+    def test_post_performance_edge_cases(self, input_mock, output_mock):
 
         self.prepare_post_performance_mocks(
             input_mock,
-            output_mock,
-            requests_get_mock,
-            'post_insights_edgecases.json'
+            output_mock
         )
 
-        with freeze_time('2020-01-01 00:00:05'):
+        stub = GraphApiStub({
+            '1234567890_987654321/insights':
+                self.load_response('post_insights_edgecases.json')
+        })
+        with stub, freeze_time('2020-01-01 00:00:05'):
             # The current edge case test data should cause the interpretation
             # to fail at a very specific point (processing "react_anger")
             with self.assertRaisesRegex(
@@ -210,25 +267,254 @@ class TestFacebookPostPerformance(DatabaseTestCase):
                     table='fb_post_performance')
                 self.task.run()
 
-    @patch('facebook.requests.get')
     @patch.object(facebook.FetchFbPostComments, 'output')
     @patch.object(facebook.FetchFbPosts, 'output')
-    def test_post_comments_transformation(
-            self, input_mock, output_mock, requests_get_mock):
-
+    def test_post_comments_transformation(self, input_mock, output_mock):
+        self.db_connector.execute(
+            '''
+            INSERT INTO fb_post (page_id, post_id) VALUES
+                (1234567890, 987654321)
+            '''
+        )
         output_target = self.prepare_post_performance_mocks(
             input_mock,
-            output_mock,
-            requests_get_mock,
-            'post_comments_actual.json'
+            output_mock
         )
 
-        self.task = facebook.FetchFbPostComments(
-            timespan=dt.timedelta(days=100000),
-            table='fb_post_comments')
-        self.run_task(self.task)
+        stub = GraphApiStub(
+            {
+                '1234567890_987654321':
+                    self.load_response('post_comment_summary_actual.json'),
+                '1234567890_987654321/comments':
+                    self.load_response('post_comments_actual.json')
+            },
+            # the API may skip requests in a batch, these must be repeated
+            unprocessed=['1234567890_987654321/comments']
+        )
+        with stub:
+            self.task = facebook.FetchFbPostComments(
+                timespan=dt.timedelta(days=100000),
+                table='fb_post_comments')
+            self.run_task(self.task)
 
         self.compare_post_performance_mocks(
             output_target,
             'post_comments_expected.csv'
         )
+        # summaries and comments
+        self.assertEqual(2, len(stub.batch_requests))
+        self.assertEqual(1, len(stub.single_requests))
+
+    @patch.object(facebook.FetchFbPostComments, 'output')
+    @patch.object(facebook.FetchFbPosts, 'output')
+    def test_post_comments_unchanged(self, input_mock, output_mock):
+        self.db_connector.execute(
+            '''
+            INSERT INTO fb_post (page_id, post_id) VALUES
+                (1234567890, 987654321)
+            ''',
+            '''
+            INSERT INTO fb_post_comment_summary VALUES
+                (1234567890, 987654321, 9, '2020-05-09 11:00:00')
+            '''
+        )
+        output_target = self.prepare_post_performance_mocks(
+            input_mock,
+            output_mock
+        )
+
+        stub = GraphApiStub({
+            '1234567890_987654321':
+                self.load_response('post_comment_summary_actual.json')
+        })
+        with stub:
+            self.task = facebook.FetchFbPostComments(
+                timespan=dt.timedelta(days=100000),
+                table='fb_post_comments')
+            self.run_task(self.task)
+
+        # no new comments, so the comments are not requested
+        self.assertEqual(1, len(stub.batch_requests))
+        with output_target.open('r') as output_data:
+            self.assertEqual(
+                'post_id,page_id,comment_id,text,post_date,is_from_museum,'
+                'response_to\n',
+                output_data.read())
+
+    @patch.object(facebook.FetchFbPostComments, 'output')
+    @patch.object(facebook.FetchFbPostComments, 'input')
+    def test_post_comments_pagination(self, input_mock, output_mock):
+        self.db_connector.execute(
+            '''
+            INSERT INTO fb_post (page_id, post_id) VALUES
+                (1234567890, 987654321)
+            '''
+        )
+        output_target = MockTarget('comments_out', format=UTF8)
+        output_mock.return_value = output_target
+        summaries_target = MockTarget('summaries_in', format=UTF8)
+        facts_target = MockTarget('facts_in', format=UTF8)
+        input_mock.return_value = [summaries_target, facts_target]
+        with summaries_target.open('w') as summaries_file:
+            summaries_file.write(
+                'page_id,post_id,comment_count,last_comment_time\n'
+                '1234567890,987654321,4,2020-05-04T11:00:00+0000\n')
+        with facts_target.open('w') as facts_file:
+            json.dump({'name': 'Museum Barberini'}, facts_file)
+
+        def comment(comment_id, **fields):
+            return {
+                'id': f'1234567890_98765400{comment_id}',
+                'created_time': f'2020-05-0{comment_id}T11:00:00+0000',
+                'message': f'messäge{comment_id}',
+                **fields
+            }
+
+        stub = GraphApiStub({})
+        with stub:
+            stub.responses.update({
+                '1234567890_987654321/comments': (200, {
+                    'data': [comment(1)],
+                    'paging': {'next': f'{facebook.API_BASE}/page2'}
+                }),
+                'page2': (200, {
+                    'data': [comment(2, comment_count=2, comments={
+                        'data': [comment(3)],
+                        'paging': {'next': f'{facebook.API_BASE}/page3'}
+                    })]
+                }),
+                'page3': (200, {'data': [comment(4)]})
+            })
+            self.task = facebook.FetchFbPostComments(
+                timespan=dt.timedelta(days=100000),
+                table='fb_post_comment')
+            self.task.run()
+
+        with output_target.open('r') as output_data:
+            df = pd.read_csv(output_data, dtype=str)
+        self.assertEqual(
+            ['987654001', '987654002', '987654003', '987654004'],
+            df['comment_id'].tolist())
+        self.assertEqual(
+            [None, None, '987654002', '987654002'],
+            df['response_to'].where(df['response_to'].notna(), None).tolist())
+
+
+class TestRequestBatch(DatabaseTestCase):
+    """Tests the request_batch function."""
+
+    def test_batch_size(self):
+
+        stub = GraphApiStub({
+            str(i): (200, {'id': str(i)})
+            for i in range(120)
+        })
+        with stub:
+            results = list(facebook.request_batch(
+                [str(i) for i in range(120)]))
+
+        self.assertEqual([{'id': str(i)} for i in range(120)], results)
+        # batches are requested concurrently
+        self.assertEqual(
+            [50, 50, 20],
+            sorted(map(len, stub.batch_requests), reverse=True))
+
+    def test_error(self):
+
+        stub = GraphApiStub({
+            '1': (200, {'id': '1'}),
+            '2': (403, {'error': {'message': "Permissions error"}})
+        })
+        with stub:
+            with self.assertRaisesRegex(HTTPError, "403 Error"):
+                list(facebook.request_batch(['1', '2']))
+
+
+class TestGraphApiClient(DatabaseTestCase):
+    """Tests the GraphApiClient class."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = facebook.GraphApiClient(backoff_base=0)
+        self.request_mock = patch.object(
+            self.client.session, 'request').start()
+        self.addCleanup(patch.stopall)
+        patch.dict('os.environ', FB_ACCESS_TOKEN='token').start()
+
+    def test_retry_transient_errors(self):
+
+        rate_limit_error = json.dumps({'error': {'code': 4}})
+        self.request_mock.side_effect = [
+            facebook.requests.Timeout(),
+            recorded_response('{}', status_code=500),
+            recorded_response(rate_limit_error, status_code=400),
+            recorded_response('{"id": "42"}')
+        ]
+
+        response = self.client.request('https://graph.facebook.com/42')
+
+        self.assertEqual({'id': '42'}, response.json())
+        metrics = self.client.reset_metrics()
+        self.assertEqual(3, metrics['requests'])
+        self.assertEqual(3, metrics['retries'])
+        self.assertEqual(len(rate_limit_error) + 14, metrics['bytes'])
+        self.assertIsNotNone(metrics['latency_p50'])
+        self.assertEqual(0, self.client.reset_metrics()['requests'])
+
+    def test_foreign_object(self):
+
+        self.request_mock.return_value = recorded_response(
+            json.dumps({'error': {'code': 100}}), status_code=400)
+
+        response = self.client.request('https://graph.facebook.com/42')
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(1, self.request_mock.call_count)
+
+    def test_persistent_error(self):
+
+        self.request_mock.return_value = recorded_response(
+            '{}', status_code=503)
+
+        with self.assertRaises(HTTPError):
+            self.client.request('https://graph.facebook.com/42')
+        self.assertEqual(4, self.request_mock.call_count)
+
+    def test_usage(self):
+
+        response = recorded_response('{}', headers={
+            'X-App-Usage': json.dumps({
+                'call_count': 28,
+                'total_time': 25,
+                'total_cputime': 25
+            }),
+            'X-Business-Use-Case-Usage': json.dumps({
+                '1234': [{
+                    'type': 'pages',
+                    'call_count': 80,
+                    'total_cputime': 10,
+                    'total_time': 10,
+                    'estimated_time_to_regain_access': 0
+                }]
+            })
+        })
+
+        self.assertEqual((80, 0), self.client.usage(response))
+
+    def test_throttle(self):
+
+        response = recorded_response('{}', headers={
+            'X-App-Usage': json.dumps({'call_count': 100})
+        })
+
+        self.client.throttle(response)
+        self.assertAlmostEqual(
+            time.monotonic() + self.client.max_throttle_delay,
+            self.client.throttle_until,
+            delta=1)
+
+        self.client.throttle_until = 0
+        self.client.throttle(recorded_response('{}', headers={
+            'X-App-Usage': json.dumps({'call_count': 10})
+        }))
+        self.assertEqual(0, self.client.throttle_until)
@@ -44,23 +44,11 @@ class TestFetchGoogleMapsReviews(DatabaseTestCase):
         self.assertIsNotNone(service)
         self.assertIsInstance(service, googleapiclient.discovery.Resource)
 
-    def test_fetch_raw_reviews(self):
-        # ----- Set up test parameters -----
-        account_name = 'myaccount'
-        location_name = 'mylocation'
-        place_id = 'abc456'
-        all_reviews = [
-            {'text': text, 'placeId': place_id}
-            for text in [
-                "Wow!",
-                "⭐⭐⭐⭐⭐",
-                "The paintings are not animated",
-                "Van Gogh is dead"
-            ]
-        ]
-        page_size = 2
-        page_token = None
-        latest_page_token = None
+    def mock_service(self, all_reviews, account_name, location_name,
+                     place_id):
+        """Mock the GMB API, answering pages of 2 reviews."""
+        self.page_token = None
+        self.latest_page_token = None
         counter = 0
 
         service = MagicMock()
@@ -90,9 +78,9 @@ class TestFetchGoogleMapsReviews(DatabaseTestCase):
         reviews.list.return_value = reviews_list_mock
 
         def reviews_list_execute():
-            nonlocal page_token, counter, latest_page_token
-            latest_page_token = page_token
-            page_token = counter
+            nonlocal counter
+            self.latest_page_token = self.page_token
+            self.page_token = counter
             next_counter = counter + 2
             next_reviews = all_reviews[counter:next_counter]
             result = {
@@ -101,11 +89,31 @@ class TestFetchGoogleMapsReviews(DatabaseTestCase):
             if next_reviews:
                 result['reviews'] = next_reviews
             if counter < len(all_reviews):
-                result['nextPageToken'] = page_token
+                result['nextPageToken'] = self.page_token
             counter = next_counter
             return result
         reviews_list_mock.execute.side_effect = reviews_list_execute
 
+        return service, locations, reviews
+
+    def test_fetch_raw_reviews(self):
+        # ----- Set up test parameters -----
+        account_name = 'myaccount'
+        location_name = 'mylocation'
+        place_id = 'abc456'
+        all_reviews = [
+            {'text': text, 'placeId': place_id}
+            for text in [
+                "Wow!",
+                "⭐⭐⭐⭐⭐",
+                "The paintings are not animated",
+                "Van Gogh is dead"
+            ]
+        ]
+        page_size = 2
+        service, locations, reviews = self.mock_service(
+            all_reviews, account_name, location_name, place_id)
+
         # ----- Execute code under test ----
         result_reviews = list(self.task.fetch_raw_reviews(service, page_size))
 
@@ -115,7 +123,43 @@ class TestFetchGoogleMapsReviews(DatabaseTestCase):
         reviews.list.assert_called_with(
             parent=location_name,
             pageSize=page_size,
-            pageToken=latest_page_token)  # refers to last call
+            orderBy='updateTime desc',
+            pageToken=self.latest_page_token)  # refers to last call
+
+    def test_fetch_raw_reviews_incremental(self):
+        place_id = 'abc456'
+        all_reviews = [
+            {
+                'reviewId': str(i),
+                'createTime': '2020-05-01T12:00:00Z',
+                'starRating': rating,
+                'comment': comment,
+                'placeId': place_id
+            }
+            for i, (rating, comment) in enumerate([
+                ('FIVE', "Wow!"),  # new
+                ('FOUR', "Van Gogh is dead"),  # edited
+                ('THREE', "The paintings are not animated"),  # known
+                ('FIVE', "⭐⭐⭐⭐⭐"),  # known
+                ('ONE', "Too many people")  # known
+            ])
+        ]
+        known_reviews = {
+            '1': (5, "Van Gogh is dead"),
+            '2': (3, "The paintings are not animated"),
+            '3': (5, "⭐⭐⭐⭐⭐"),
+            '4': (1, "Too many people")
+        }
+        service, _, reviews = self.mock_service(
+            all_reviews, 'myaccount', 'mylocation', place_id)
+
+        result_reviews = list(self.task.fetch_raw_reviews(
+            service, page_size=2, known_reviews=known_reviews))
+
+        # the second page only contains known reviews, so the third page
+        # is not requested
+        self.assertSequenceEqual(all_reviews[:4], result_reviews)
+        self.assertEqual(2, reviews.list.call_count)
 
     def test_extract_reviews(self):
         with open(
@@ -1,10 +1,11 @@
+import datetime as dt
 import json
 import pandas as pd
 import requests
 
 from luigi.format import UTF8
 from luigi.mock import MockTarget
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from db_test import DatabaseTestCase
 from gplay.gplay_reviews import FetchGplayReviews
@@ -26,7 +27,8 @@ RESPONSE_ELEM_1_RENAMED_COLS = {
     'app_version': '2.10.7',
     'likes': 0,
     'date': '2020-01-04T17:09:33.789Z',
-    'app_id': 'com.barberini.museum.barberinidigital'
+    'app_id': 'com.barberini.museum.barberinidigital',
+    'language': 'en'
 }
 RESPONSE_ELEM_2 = {
     'id': "abc",
@@ -37,6 +39,8 @@ RESPONSE_ELEM_2 = {
     'version': '1.1.2',
     'app_id': 'com.barberini.museum.barberinidigital'
 }
+REVIEW_1 = {**RESPONSE_ELEM_1, 'language': 'en'}
+REVIEW_2 = {**RESPONSE_ELEM_2, 'language': 'de'}
 
 
 class TestFetchGplayReviews(DatabaseTestCase):
@@ -50,7 +54,7 @@ class TestFetchGplayReviews(DatabaseTestCase):
     @patch('gplay.gplay_reviews.FetchGplayReviews.load_language_codes',
            return_value=['en', 'de'])
     @patch('gplay.gplay_reviews.FetchGplayReviews.fetch_for_language',
-           side_effect=[[RESPONSE_ELEM_1], [RESPONSE_ELEM_1], []])
+           side_effect=[[REVIEW_1], [REVIEW_1], []])
     @patch.object(FetchGplayReviews, 'output')
     @patch.object(FetchGplayReviews, 'input')
     def test_run(self, input_mock, output_mock, mock_fetch, mock_lang):
@@ -98,7 +102,11 @@ class TestFetchGplayReviews(DatabaseTestCase):
         self.assertCountEqual(reviews, reviews_en)
 
     @patch('gplay.gplay_reviews.FetchGplayReviews.fetch_for_language',
-           side_effect=[[RESPONSE_ELEM_1], [RESPONSE_ELEM_2], []])
+           side_effect=lambda language_code, since: {
+               'en': [REVIEW_1],
+               'de': [REVIEW_2],
+               'fr': []
+           }[language_code])
     @patch('gplay.gplay_reviews.FetchGplayReviews.load_language_codes',
            return_value=['en', 'de', 'fr'])
     def test_fetch_all_multiple_return_values(
@@ -108,7 +116,87 @@ class TestFetchGplayReviews(DatabaseTestCase):
 
         self.assertIsInstance(result, pd.DataFrame)
         pd.testing.assert_frame_equal(
-            result, pd.DataFrame([RESPONSE_ELEM_1, RESPONSE_ELEM_2]))
+            result, pd.DataFrame([REVIEW_1, REVIEW_2]))
+
+    @patch('gplay.gplay_reviews.FetchGplayReviews.fetch_for_language',
+           return_value=[])
+    @patch('gplay.gplay_reviews.FetchGplayReviews.load_language_codes',
+           return_value=['en', 'de'])
+    @patch.object(FetchGplayReviews, 'load_latest_date')
+    def test_fetch_all_incremental(self, date_mock, mock_lang, mock_fetch):
+
+        date_mock.return_value = dt.datetime(2020, 1, 1)
+
+        self.task.fetch_all()
+
+        mock_fetch.assert_any_call('en', since=dt.datetime(2020, 1, 1))
+        mock_fetch.assert_any_call('de', since=dt.datetime(2020, 1, 1))
+
+    @patch('gplay.gplay_reviews.requests.get')
+    @patch('gplay.gplay_reviews.FetchGplayReviews.load_language_codes',
+           return_value=['en-GB', 'en', 'de'])
+    def test_fetch_all_overlapping_languages(self, mock_lang, mock_get):
+
+        app_id = 'com.barberini.museum.barberinidigital'
+        self.task = FetchGplayReviews(full_sync_interval=0)
+        self.task._app_id = app_id
+        self.task._url = 'url'
+        self.task.incremental_num = 2
+
+        def review(review_id, date):
+            return {**RESPONSE_ELEM_1, 'id': review_id, 'date': date}
+        english_reviews = [
+            review('4', '2020-01-04T12:00:00.000Z'),
+            review('3', '2020-01-03T12:00:00.000Z'),
+            review('2', '2020-01-02T12:00:00.000Z'),
+            review('1', '2020-01-01T12:00:00.000Z')
+        ]
+        german_reviews = [
+            review('5', '2020-01-05T12:00:00.000Z'),
+            review('1', '2020-01-01T12:00:00.000Z')
+        ]
+
+        def get(url, params):
+            # en-GB is not supported and falls back to english reviews
+            reviews = german_reviews if params['lang'] == 'de' \
+                else english_reviews
+            return MagicMock(json=MagicMock(
+                return_value={'results': reviews[:params['num']]}))
+        mock_get.side_effect = get
+
+        # initial run: all reviews are stored with the first language
+        reviews = self.task.fetch_all()
+        self.assertListEqual(
+            [('4', 'en-GB'), ('3', 'en-GB'), ('2', 'en-GB'), ('1', 'en-GB'),
+             ('5', 'de')],
+            list(zip(reviews['id'], reviews['language'])))
+        self.db_connector.execute(f'''
+            INSERT INTO gplay_review
+                (playstore_review_id, post_date, app_id, language)
+            VALUES
+                ('4', '2020-01-04 12:00', '{app_id}', 'en-GB'),
+                ('3', '2020-01-03 12:00', '{app_id}', 'en-GB'),
+                ('2', '2020-01-02 12:00', '{app_id}', 'en-GB'),
+                ('1', '2020-01-01 12:00', '{app_id}', 'en-GB'),
+                ('5', '2020-01-05 12:00', '{app_id}', 'de')
+        ''')
+        english_reviews.insert(0, review('6', '2020-01-06T12:00:00.000Z'))
+        mock_get.reset_mock()
+
+        reviews = self.task.fetch_all()
+
+        # no language must fetch all reviews again, even if no reviews are
+        # stored for it
+        self.assertCountEqual(
+            [('en-GB', 2), ('en', 2), ('de', 2)],
+            [
+                (kwargs['params']['lang'], kwargs['params']['num'])
+                for _, kwargs in mock_get.call_args_list
+            ])
+        # stored reviews must keep their language
+        self.assertListEqual(
+            [('6', 'en-GB'), ('5', 'de')],
+            list(zip(reviews['id'], reviews['language'])))
 
     @patch('gplay.gplay_reviews.FetchGplayReviews.fetch_for_language',
            return_value=[])
@@ -120,15 +208,15 @@ class TestFetchGplayReviews(DatabaseTestCase):
             result,
             pd.DataFrame(columns=[
                 'id', 'date', 'score', 'text',
-                'thumbsUp', 'version', 'app_id'
+                'thumbsUp', 'version', 'app_id', 'language'
             ])
         )
 
     @patch('gplay.gplay_reviews.FetchGplayReviews.fetch_for_language',
-           side_effect=[
-               [RESPONSE_ELEM_1, RESPONSE_ELEM_2, RESPONSE_ELEM_2],
-               [RESPONSE_ELEM_1]
-           ])
+           side_effect=lambda language_code, since: {
+               'en': [REVIEW_1, REVIEW_2, REVIEW_2],
+               'de': [{**REVIEW_1, 'language': 'de'}]
+           }[language_code])
     @patch('gplay.gplay_reviews.FetchGplayReviews.load_language_codes',
            return_value=['en', 'de'])
     def test_fetch_all_no_duplicates(self, mock_lang, mock_fetch):
@@ -136,7 +224,7 @@ class TestFetchGplayReviews(DatabaseTestCase):
         result = FetchGplayReviews().fetch_all()
 
         pd.testing.assert_frame_equal(
-            result, pd.DataFrame([RESPONSE_ELEM_1, RESPONSE_ELEM_2]))
+            result, pd.DataFrame([REVIEW_1, REVIEW_2]))
 
     @patch('gplay.gplay_reviews.requests.Response.json')
     def test_fetch_for_language_one_return_value(self, mock_json):
@@ -144,9 +232,9 @@ class TestFetchGplayReviews(DatabaseTestCase):
         mock_json.return_value = {'results': [RESPONSE_ELEM_1]}
 
         self.task = FetchGplayReviews()
-        result = FetchGplayReviews().fetch_for_language('xyz')
+        result = FetchGplayReviews().fetch_for_language('en')
 
-        self.assertCountEqual([RESPONSE_ELEM_1], result)
+        self.assertCountEqual([REVIEW_1], result)
 
     @patch('gplay.gplay_reviews.requests.Response.json')
     def test_fetch_for_lang_multi_return_values(self, mock_json):
@@ -157,7 +245,10 @@ class TestFetchGplayReviews(DatabaseTestCase):
 
         result = self.task.fetch_for_language('xyz')
 
-        self.assertCountEqual([RESPONSE_ELEM_1, RESPONSE_ELEM_2], result)
+        self.assertCountEqual([
+            {**RESPONSE_ELEM_1, 'language': 'xyz'},
+            {**RESPONSE_ELEM_2, 'language': 'xyz'}
+        ], result)
 
     @patch('gplay.gplay_reviews.requests.Response.json')
     def test_fetch_for_lang_no_reviews_returned(self, mock_json):
@@ -168,6 +259,65 @@ class TestFetchGplayReviews(DatabaseTestCase):
 
         self.assertCountEqual([], result)
 
+    @patch('gplay.gplay_reviews.requests.get')
+    def test_fetch_for_language_incremental(self, mock_get):
+
+        def review(review_id, date):
+            return {**RESPONSE_ELEM_1, 'id': review_id, 'date': date}
+        responses = [
+            [
+                review('4', '2020-01-04T12:00:00.000Z'),
+                review('3', '2020-01-03T12:00:00.000Z')
+            ],
+            [
+                review('4', '2020-01-04T12:00:00.000Z'),
+                review('3', '2020-01-03T12:00:00.000Z'),
+                review('2', '2020-01-02T12:00:00.000Z'),
+                review('1', '2020-01-01T12:00:00.000Z')
+            ]
+        ]
+        mock_get.side_effect = [
+            MagicMock(json=MagicMock(return_value={'results': results}))
+            for results in responses
+        ]
+        self.task.incremental_num = 2
+
+        result = list(self.task.fetch_for_language(
+            'en', since=dt.datetime(2020, 1, 2, 12)))
+
+        # all reviews of the first response are new, so more are requested
+        self.assertListEqual(
+            [2, 20],
+            [kwargs['params']['num'] for _, kwargs in mock_get.call_args_list])
+        self.assertListEqual(
+            ['4', '3', '2'],
+            [review['id'] for review in result])
+
+    def test_load_latest_date(self):
+
+        app_id = 'com.barberini.museum.barberinidigital'
+        self.task = FetchGplayReviews(full_sync_interval=0)
+        self.task._app_id = app_id
+        self.assertIsNone(self.task.load_latest_date())
+
+        self.db_connector.execute(f'''
+            INSERT INTO gplay_review
+                (playstore_review_id, post_date, app_id, language)
+            VALUES
+                ('1', '2020-01-01 10:00', '{app_id}', 'de'),
+                ('2', '2020-01-02 10:00', '{app_id}', 'en'),
+                ('3', '2020-01-03 10:00', '{app_id}', NULL),
+                ('4', '2020-01-04 10:00', 'another.app', 'en')
+        ''')
+
+        self.assertEqual(
+            dt.datetime(2020, 1, 3, 10),
+            self.task.load_latest_date())
+
+        self.task = FetchGplayReviews(full_sync_interval=1)
+        self.task._app_id = app_id
+        self.assertIsNone(self.task.load_latest_date())
+
     @patch('gplay.gplay_reviews.requests.get')
     def test_fetch_for_language_request_failed(self, mock_get):
 
@@ -202,7 +352,7 @@ class TestFetchGplayReviews(DatabaseTestCase):
 
     def test_convert_to_right_output_format(self):
 
-        reviews = pd.DataFrame([RESPONSE_ELEM_1])
+        reviews = pd.DataFrame([REVIEW_1])
 
         actual = FetchGplayReviews().convert_to_right_output_format(reviews)
 
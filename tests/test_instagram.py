@@ -8,6 +8,7 @@ from luigi.mock import MockTarget
 import pandas as pd
 
 from db_test import DatabaseTestCase
+from graph_api_stub import GraphApiStub
 import instagram
 
 IG_TEST_DATA = 'tests/test_data/instagram'
@@ -85,10 +86,36 @@ class TestInstagram(DatabaseTestCase):
         self.assertEqual(request_mock.call_count, 2)
 
     @patch('instagram.try_request_multiple_times')
+    @patch.object(instagram.FetchIgPosts, 'output')
+    @patch.object(instagram.MuseumFacts, 'output')
+    def test_incremental(self, fact_mock, output_mock, request_mock):
+        fact_mock.return_value = MockTarget('facts_in', format=UTF8)
+        output_target = MockTarget('post_out', format=UTF8)
+        output_mock.return_value = output_target
+        self.db_connector.execute(
+            '''INSERT INTO ig_post (ig_post_id, post_date) VALUES
+                ('0123456789', '2020-02-01 00:00:00')'''
+        )
+
+        with open(f'{IG_TEST_DATA}/post_next.json', 'r') as next_data_in:
+            next_data = json.load(next_data_in)
+        request_mock.return_value = MagicMock(
+            ok=True, json=lambda: next_data)
+
+        with freeze_time('2020-03-01 00:00:00'):
+            self.run_task(instagram.FetchIgPosts(
+                full_sync_interval=0,
+                overlap=dt.timedelta(days=10)))
+
+        # the first page only contains posts older than the latest known
+        # post, so the next page is not requested
+        self.assertEqual(1, request_mock.call_count)
+        with output_target.open('r') as output_data:
+            self.assertTrue(pd.read_csv(output_data).empty)
+
     @patch.object(instagram.FetchIgPostPerformance, 'output')
     @patch.object(instagram.FetchIgPostPerformance, 'input')
-    def test_post_performance_transformation(
-            self, input_mock, output_mock, request_mock):
+    def test_post_performance_transformation(self, input_mock, output_mock):
         self.db_connector.execute(
             '''INSERT INTO ig_post (ig_post_id) VALUES
                 (0123456789),
@@ -110,43 +137,91 @@ class TestInstagram(DatabaseTestCase):
         with open(f'{IG_TEST_DATA}/post_insights_video_actual.json',
                   'r',
                   encoding='utf-8') as json_video_in:
-            input_video_insights = json_video_in.read()
+            input_video_insights = json.load(json_video_in)
 
         with open(f'{IG_TEST_DATA}/post_insights_no_video_actual.json',
                   'r',
                   encoding='utf-8') as json_no_video_in:
-            input_no_video_insights = json_no_video_in.read()
+            input_no_video_insights = json.load(json_no_video_in)
 
         with open(f'{IG_TEST_DATA}/post_insights_expected.csv',
                   'r',
                   encoding='utf-8') as expected_data_in:
             expected_df = pd.read_csv(expected_data_in)
 
-        def mock_video_json():
-            return json.loads(input_video_insights)
+        # The type of the IDs is lost during CSV conversion
+        stub = GraphApiStub({
+            '123456789/insights': (200, input_video_insights),
+            '9876543210/insights': (200, input_no_video_insights)
+        })
+        with stub, freeze_time('2020-01-01 00:00:05'):
+            self.task = instagram.FetchIgPostPerformance(
+                columns=[
+                    column[0]
+                    for column
+                    in instagram.IgPostPerformanceToDb().columns],
+                timespan=dt.timedelta(days=100000),
+                table='ig_post_performance')
+            self.task.run()
 
-        def mock_no_video_json():
-            return json.loads(input_no_video_insights)
+        with output_target.open('r') as output_data:
+            output_df = pd.read_csv(output_data)
+        pd.testing.assert_frame_equal(expected_df, output_df)
+        self.assertEqual(1, len(stub.batch_requests))
+        self.assertIn(
+            'video_views', stub.batch_requests[0][0]['relative_url'])
+        self.assertNotIn(
+            'video_views', stub.batch_requests[0][1]['relative_url'])
 
-        mock_video_response = MagicMock(ok=True, json=mock_video_json)
-        mock_no_video_response = MagicMock(ok=True, json=mock_no_video_json)
-        request_mock.side_effect = [
-            mock_video_response,
-            mock_no_video_response]
+    @patch.object(instagram.FetchIgPostPerformance, 'output')
+    @patch.object(instagram.FetchIgPostPerformance, 'input')
+    def test_post_performance_many_posts(self, input_mock, output_mock):
+        post_ids = [str(1000 + i) for i in range(120)]
+        self.db_connector.execute(
+            f'''INSERT INTO ig_post (ig_post_id) VALUES
+                {', '.join(f"('{post_id}')" for post_id in post_ids)}'''
+        )
+        input_target = MockTarget('posts_in', format=UTF8)
+        input_mock.return_value = input_target
+        output_target = MockTarget('insights_out', format=UTF8)
+        output_mock.return_value = output_target
 
-        with freeze_time('2020-01-01 00:00:05'):
+        with input_target.open('w') as posts_target:
+            pd.DataFrame({
+                'id': post_ids,
+                'timestamp': '2019-12-01 12:00:00+00:00',
+                'media_type': 'IMAGE'
+            }).to_csv(posts_target, index=False)
+
+        # every metric of a post has the same value
+        stub = GraphApiStub({
+            f'{post_id}/insights': (200, {'data': [
+                {'values': [{'value': int(post_id)}]}
+                for _ in range(4)
+            ]})
+            for post_id in post_ids
+        })
+        with stub, freeze_time('2020-01-01 00:00:05'):
             self.task = instagram.FetchIgPostPerformance(
                 columns=[
                     column[0]
                     for column
                     in instagram.IgPostPerformanceToDb().columns],
-                timespan=dt.timedelta(days=100000),
                 table='ig_post_performance')
             self.task.run()
 
         with output_target.open('r') as output_data:
             output_df = pd.read_csv(output_data)
-        pd.testing.assert_frame_equal(expected_df, output_df)
+        self.assertEqual(
+            [int(post_id) for post_id in post_ids],
+            output_df['ig_post_id'].tolist())
+        self.assertEqual(
+            output_df['ig_post_id'].tolist(),
+            output_df['saved'].tolist())
+        self.assertEqual([0] * 120, output_df['video_views'].tolist())
+        self.assertEqual(
+            [50, 50, 20],
+            sorted(map(len, stub.batch_requests), reverse=True))
 
     @patch('instagram.try_request_multiple_times')
     @patch.object(instagram.FetchIgProfileMetricsDevelopment, 'output')
@@ -1,6 +1,5 @@
 from datetime import datetime
 import os
-import pickle  # nosec: We only use pickle for self-generated files.
 import sys
 from unittest.mock import patch
 
@@ -10,9 +9,12 @@ import pandas as pd
 from db_test import DatabaseTestCase
 from luigi.mock import MockTarget
 from topic_modeling import (
-    Doc, TopicModelingFindTopics,
-    TopicModelingPreprocessCorpus, TopicModelingCreateCorpus
+    Corpus, Doc, TopicModeling, TopicModelingDetectLanguages,
+    TopicModelingFindTopics, TopicModelingPreprocessCorpus,
+    TopicModelingCreateCorpus, TopicModelingTopicsToDb
 )
+from topic_modeling.gsdmm import GSDMM
+from topic_modeling.languages import text_hash
 
 
 class TestDoc(DatabaseTestCase):
@@ -51,15 +53,79 @@ class TestDoc(DatabaseTestCase):
         self.assertTrue(doc.in_year("all"))
 
 
+class TestCorpus(DatabaseTestCase):
+    """Tests the Corpus class."""
+
+    def test_save_load(self):
+
+        docs = [
+            Doc('first, "text"\nwith newline', 'source1',
+                datetime(2019, 8, 30, 12, 0), '0042', ['first', 'text']),
+            Doc('second text', 'source2', datetime(2020, 1, 1, 0, 0), 'id2',
+                ['text', 'second', 'text'], language='de'),
+            Doc('third text')
+        ]
+        path = f'{self.str_id}/corpus'
+
+        Corpus.from_docs(docs).save(path)
+        corpus = Corpus.load(path)
+
+        self.assertEqual(len(corpus), 3)
+        self.assertEqual(len(corpus.vocabulary), 3)
+        self.assertEqual(list(corpus.token_ids(1)), [1, 2, 1])
+        for expected, actual in zip(docs, corpus):
+            self.assertIsInstance(actual, Doc)
+            for attr in ['text', 'source', 'post_date', 'post_id',
+                         'language']:
+                self.assertEqual(
+                    getattr(expected, attr), getattr(actual, attr))
+            self.assertEqual(expected.tokens or [], actual.tokens)
+        self.assertEqual(corpus[1].tokens, ['text', 'second', 'text'])
+
+
+class TestGSDMM(DatabaseTestCase):
+    """Tests the GSDMM class."""
+
+    def test_fit(self):
+
+        docs = [
+            ['apple', 'banana', 'cherry'],
+            ['car', 'bus', 'train'],
+            ['banana', 'cherry', 'apple', 'apple'],
+            ['train', 'car'],
+            ['cherry', 'banana'],
+            ['bus', 'bus', 'car']
+        ] * 5
+
+        labels = GSDMM(K=4, n_iters=30, seed=1).fit(docs)
+
+        # Fruits and vehicles are assigned to different clusters
+        self.assertEqual(len(set(labels[0::2])), 1)
+        self.assertEqual(len(set(labels[1::2])), 1)
+        self.assertNotEqual(labels[0], labels[1])
+        # Same seed, same model
+        self.assertEqual(GSDMM(K=4, n_iters=30, seed=1).fit(docs), labels)
+
+    def test_choose_best_label(self):
+
+        model = GSDMM(K=4, n_iters=30, seed=1)
+        labels = model.fit([['apple', 'banana'], ['car', 'bus']] * 5)
+
+        label, probability = model.choose_best_label(
+            ['banana', 'unknown', 'banana'])
+        self.assertEqual(label, labels[0])
+        self.assertGreater(probability, 0.9)
+        self.assertEqual(
+            model.cluster_word_distribution[labels[1]],
+            {'car': 5, 'bus': 5})
+
+
 class TestCreateCorpus(DatabaseTestCase):
     """Tests the TopicModelingCreateCorpus task."""
 
-    @patch.object(TopicModelingCreateCorpus, 'output')
-    def test_create_corpus(self, output_mock):
+    def test_create_corpus(self):
 
         # -------- SET UP MOCK DATA ------------
-        output_target = MockTarget('corpus_out', format=luigi.format.Nop)
-        output_mock.return_value = output_target
         self.db_connector.execute(
             '''
                 INSERT INTO tweet(user_id,tweet_id,text,response_to,post_date)
@@ -81,98 +147,159 @@ class TestCreateCorpus(DatabaseTestCase):
         task.run()
 
         # ------- INSPECT OUTPUT -------
-        with output_target.open("r") as fp:
-            corpus = pickle.load(fp)  # nosec
+        corpus = Corpus.load(task.output().path)
 
         self.assertEqual(len(corpus), 2)
         self.assertIsInstance(corpus[0], Doc)
         self.assertIsInstance(corpus[1], Doc)
 
 
+class TestDetectLanguages(DatabaseTestCase):
+    """Tests the TopicModelingDetectLanguages task."""
+
+    def test_detect_languages(self):
+
+        Corpus.from_docs([
+            Doc("hier ist ein deutscher Text", 'source1', post_id='1'),
+            Doc("english text goes here", 'source1', post_id='2'),
+            Doc("hier ist noch ein deutscher Text", 'source1', post_id='3'),
+            Doc("https://blablabla.de", 'source2', post_id='1')
+        ]).save(TopicModelingCreateCorpus().output().path)
+        self.db_connector.execute(
+            f'''
+                INSERT INTO topic_modeling.post_language
+                VALUES
+                    ('source1', '1',
+                        '{text_hash("hier ist ein deutscher Text")}', 'de'),
+                    ('source1', '3', '{text_hash("old text")}', 'en')
+            ''')
+
+        task = TopicModelingDetectLanguages()
+        task.run()
+
+        with task.output().open('r') as output_file:
+            languages = pd.read_csv(
+                output_file, dtype=str, keep_default_na=False)
+        # Post 1 is cached, post 3 has changed
+        self.assertEqual(
+            list(languages.itertuples(index=False, name=None)),
+            [
+                ('source1', '2', text_hash("english text goes here"), 'en'),
+                ('source1', '3', text_hash("hier ist noch ein deutscher Text"),
+                    'de'),
+                ('source2', '1', text_hash("https://blablabla.de"), '')
+            ])
+
+
 class TestPreprocessing(DatabaseTestCase):
     """Tests the TopicModelingPreprocessCorpus task."""
 
-    @patch.object(TopicModelingPreprocessCorpus, 'input')
-    @patch.object(TopicModelingPreprocessCorpus, 'output')
-    def test_preprocessing(self, output_mock, input_mock):
+    def test_preprocessing(self):
 
         # -------- SET UP MOCK DATA ------------
-        output_target = MockTarget('corpus_out', format=luigi.format.Nop)
-        input_target = MockTarget('corpus_in', format=luigi.format.Nop)
-        output_mock.return_value = output_target
-        input_mock.return_value = input_target
-        with input_target.open('w') as fp:
-            pickle.dump(
-                [
-                    Doc("Ich bin der erste Post über ein Kulturinstitut"
-                        "in der Landeshauptstadt"),
-                    Doc("Ich bin der 2 Post über mit Bezug zur "
-                        "Landeshauptstadt. toll "),
-                    Doc("Trallala noch ein Post 2 zum Museum"),
-                    Doc("noch weitere Posts zum weitere testen."
-                        'Barberini toll'),
-                    Doc("this document is in english")
-                ],
-                fp
-            )
+        Corpus.from_docs([
+            Doc("Ich bin der erste Post über ein Kulturinstitut"
+                "in der Landeshauptstadt"),
+            Doc("Ich bin der 2 Post über mit Bezug zur "
+                "Landeshauptstadt. toll "),
+            Doc("Trallala noch ein Post 2 zum Museum"),
+            Doc("noch weitere Posts zum weitere testen."
+                'Barberini toll'),
+            Doc("this document is in english")
+        ]).save(TopicModelingCreateCorpus().output().path)
 
         # ------- RUN TASK UNDER TEST --------
         task = TopicModelingPreprocessCorpus()
         task.run()
 
         # ------- INSPECT OUTPUT -------
-        with output_target.open("r") as fp:
-            output = pickle.load(fp)  # nosec
+        output = Corpus.load(task.output().path)
         self.assertEqual(len(output), 2)
         self.assertEqual(
             output[0].tokens, ['post', 'landeshauptstadt', 'toll'])
         self.assertEqual(
             output[1].tokens, ['weitere', 'weitere', 'toll'])
 
+    @patch('topic_modeling.languages.detect_language', return_value='de')
+    @patch.object(TopicModelingPreprocessCorpus, 'tokenize')
+    def test_remove_rare_tokens(self, tokenize_mock, _):
+
+        tokens = [
+            ['aa', 'bb', 'cc', 'dd', 'aa', 'ee', 'ff'],
+            ['aa', 'gg', 'hh', 'ee', 'ii'],
+            ['ff', 'ee', 'jj', 'jj'],
+            ['kk', 'kk', 'aa']
+        ]
+        tokenize_mock.return_value = tokens
+        corpus = Corpus.from_docs(
+            Doc(f"text {i}", post_id=str(i)) for i in range(len(tokens)))
+
+        output = TopicModelingPreprocessCorpus().preprocess(corpus)
+
+        # Every token that occurs only once in the corpus is removed, then
+        # all docs with less than three tokens are discarded
+        self.assertEqual(
+            [(doc.post_id, doc.tokens) for doc in output],
+            [
+                ('0', ['aa', 'aa', 'ee', 'ff']),
+                ('2', ['ff', 'ee', 'jj', 'jj']),
+                ('3', ['kk', 'kk', 'aa'])
+            ])
+        self.assertEqual(
+            sorted(output.vocabulary), ['aa', 'ee', 'ff', 'jj', 'kk'])
+
+    def test_tokenize_parallel(self):
+
+        texts = [
+            "Ich bin der erste Post über ein Kulturinstitut",
+            "Trallala noch ein Post 2 zum Museum",
+            "noch weitere Posts zum weitere testen."
+        ] * 10
+        task = TopicModelingPreprocessCorpus()
+        expected = task.tokenize(texts)
+
+        task.min_parallel_texts = 0
+        self.assertEqual(task.tokenize(texts), expected)
+
 
 class TestFindTopics(DatabaseTestCase):
     """Tests the TopicModelingFindTopics task."""
 
     @patch.object(TopicModelingFindTopics, 'output')
-    @patch.object(TopicModelingPreprocessCorpus, 'output')
-    def test_find_topics(self, input_mock, output_mock):
+    def test_find_topics(self, output_mock):
 
         # -------- SET UP MOCK DATA ------------
-        input_target = MockTarget('corpus_in', format=luigi.format.Nop)
         output_target_topics = MockTarget(
             'topics_out', format=luigi.format.UTF8)
         output_target_texts = MockTarget(
             'texts_out', format=luigi.format.UTF8)
-        input_mock.return_value = input_target
+        output_target_models = MockTarget(
+            'models_out', format=luigi.format.UTF8)
         output_mock.return_value = iter(
-            [output_target_topics, output_target_texts])
-
-        with input_target.open('w') as fp:
-            pickle.dump(
-                [
-                    Doc('text1', 'source1', datetime(2019, 8, 30, 0, 0),
-                        'id1', ['A', 'A']),
-                    Doc('text2', 'source1', datetime(2019, 8, 30, 0, 0),
-                        'id1', ['B', 'B']),
-                    Doc('text3', 'source1', datetime(2018, 8, 30, 0, 0),
-                        'id1', ['A', 'A']),
-                    Doc('text4', 'source1', datetime(2018, 8, 30, 0, 0),
-                        'id1', ['C', 'C']),
-                    Doc('text5', 'source2', datetime(2019, 8, 30, 0, 0),
-                        'id1', ['A', 'A']),
-                    Doc('text6', 'source2', datetime(2018, 8, 30, 0, 0),
-                        'id1', ['B', 'B']),
-                    Doc('text7', 'source2', datetime(2019, 8, 30, 0, 0),
-                        'id1', ['B', 'B']),
-                    Doc('text8', 'source3', datetime(2019, 8, 30, 0, 0),
-                        'id1', ['C', 'C']),
-                    Doc('text9', 'source3', datetime(2021, 8, 30, 0, 0),
-                        'id1', ['A', 'A']),
-                    Doc('text10', 'source3', datetime(2021, 8, 30, 0, 0),
-                        'id1', ['B', 'B'])
-                ],
-                fp
-            )
+            [output_target_topics, output_target_texts, output_target_models])
+
+        Corpus.from_docs([
+            Doc('text1', 'source1', datetime(2019, 8, 30, 0, 0),
+                'id1', ['A', 'A']),
+            Doc('text2', 'source1', datetime(2019, 8, 30, 0, 0),
+                'id1', ['B', 'B']),
+            Doc('text3', 'source1', datetime(2018, 8, 30, 0, 0),
+                'id1', ['A', 'A']),
+            Doc('text4', 'source1', datetime(2018, 8, 30, 0, 0),
+                'id1', ['C', 'C']),
+            Doc('text5', 'source2', datetime(2019, 8, 30, 0, 0),
+                'id1', ['A', 'A']),
+            Doc('text6', 'source2', datetime(2018, 8, 30, 0, 0),
+                'id1', ['B', 'B']),
+            Doc('text7', 'source2', datetime(2019, 8, 30, 0, 0),
+                'id1', ['B', 'B']),
+            Doc('text8', 'source3', datetime(2019, 8, 30, 0, 0),
+                'id1', ['C', 'C']),
+            Doc('text9', 'source3', datetime(2021, 8, 30, 0, 0),
+                'id1', ['A', 'A']),
+            Doc('text10', 'source3', datetime(2021, 8, 30, 0, 0),
+                'id1', ['B', 'B'])
+        ]).save(TopicModelingPreprocessCorpus().output().path)
 
         # ------- RUN TASK UNDER TEST --------
         # suppress messages printed during training
@@ -206,3 +333,115 @@ class TestFindTopics(DatabaseTestCase):
         )
         for model in ['all', '2018', '2019', '2021']:
             self.assertIn(model, list(topics['model']))
+
+        # validate dataframe with model hashes
+        with output_target_models.open('r') as fp:
+            models = pd.read_csv(fp, dtype={'model_name': str})
+        self.assertEqual(
+            list(models['model_name']), ['2018', '2019', '2021', 'all'])
+        self.assertTrue(all(models['retrained']))
+
+    def test_find_topics_incremental(self):
+
+        docs = [
+            Doc('text1', 'source1', datetime(2019, 8, 30, 0, 0),
+                'id1', ['A', 'A', 'B']),
+            Doc('text2', 'source1', datetime(2020, 8, 30, 0, 0),
+                'id2', ['B', 'B', 'C']),
+            Doc('text3', 'source1', datetime(2020, 8, 30, 0, 0),
+                'id3', ['A', 'C', 'C'])
+        ]
+        task = TopicModelingFindTopics()
+        _, _, models = task.find_topics(docs)
+        self.db_connector.execute(*(
+            f'''
+                INSERT INTO topic_modeling.model
+                VALUES ('{model_name}', '{corpus_hash}')
+            '''
+            for model_name, corpus_hash in zip(
+                models['model_name'], models['corpus_hash'])
+        ))
+
+        # change a post of 2020
+        docs[2] = Doc('text3 edited', 'source1', datetime(2020, 8, 30, 0, 0),
+                      'id3', ['A', 'C', 'C'])
+        topics, texts, models = task.find_topics(docs)
+
+        self.assertEqual(
+            list(models['model_name']), ['2019', '2020', 'all'])
+        self.assertEqual(list(models['retrained']), [False, True, True])
+        self.assertEqual(sorted(set(texts['model_name'])), ['2020', 'all'])
+        self.assertEqual(sorted(set(topics['model'])), ['2020', 'all'])
+        self.assertEqual(len(texts), 5)
+
+        # nothing changed
+        topics, texts, models = task.find_topics(docs[:2] + [
+            Doc('text3', 'source1', datetime(2020, 8, 30, 0, 0),
+                'id3', ['A', 'C', 'C'])])
+        self.assertFalse(any(models['retrained']))
+        self.assertTrue(texts.empty)
+        self.assertTrue(topics.empty)
+        self.assertEqual(
+            list(texts.columns),
+            ['post_id', 'text', 'source', 'post_date', 'topic', 'model_name'])
+
+
+class TestTopicsToDb(DatabaseTestCase):
+    """Tests the TopicModelingTopicsToDb task."""
+
+    def test_replace_partitions(self):
+
+        self.db_connector.execute('''
+            INSERT INTO topic_modeling.topic (topic, term, count, model)
+            VALUES
+                (1, 'old', 1, '2018'),
+                (1, 'old', 1, '2019'),
+                (1, 'old', 1, '2020')
+        ''')
+        task = TopicModelingTopicsToDb()
+        with list(task.input()['models'])[2].open('w') as models_file:
+            pd.DataFrame(
+                [('2019', 'hash1', False), ('2020', 'hash2', True),
+                 ('all', 'hash3', True)],
+                columns=['model_name', 'corpus_hash', 'retrained']
+            ).to_csv(models_file, index=False)
+        with task.input()['data'].open('w') as topics_file:
+            pd.DataFrame(
+                [(1, 'new', 2, '2020'), (1, 'new', 3, 'all')],
+                columns=['topic', 'term', 'count', 'model']
+            ).to_csv(topics_file, index=False)
+
+        task.run()
+
+        self.assertCountEqual(
+            [('old', 1, '2019'), ('new', 2, '2020'), ('new', 3, 'all')],
+            self.db_connector.query('''
+                SELECT term, count, model
+                FROM topic_modeling.topic
+            '''),
+            msg="Removed and retrained models should have been replaced")
+
+
+class TestTopicModeling(DatabaseTestCase):
+    """Tests the TopicModeling task."""
+
+    def test_full_retrain(self):
+
+        for full_retrain in [False, True]:
+            with self.subTest(full_retrain=full_retrain):
+                find_topics = [
+                    task
+                    for task in self.walk_requirements(
+                        TopicModeling(full_retrain=full_retrain))
+                    if isinstance(task, TopicModelingFindTopics)
+                ]
+                self.assertTrue(find_topics)
+                self.assertTrue(all(
+                    task.full_retrain == full_retrain
+                    for task in find_topics))
+
+    def walk_requirements(self, task):
+
+        yield task
+        for requirement in luigi.task.flatten(task.requires()):
+            yield from self.walk_requirements(requirement)
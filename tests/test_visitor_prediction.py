@@ -0,0 +1,445 @@
+import datetime as dt
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from _utils import CsvToDb
+from db_test import DatabaseTestCase
+from visitor_prediction.backtesting import backtest, evaluate
+from visitor_prediction.exhibition_popularity import ExhibitionPopularity, \
+    find_announced_exhibitions, simplify_text
+from visitor_prediction.predict import CACHED_PREDICTIONS, TIMESPAN, \
+    PredictionsToDb, PredictVisitors, predict_entries
+from visitor_prediction.preprocessing import preprocess_entries
+
+
+class TestPredictVisitors(DatabaseTestCase):
+    """Tests the caching of the PredictVisitors task."""
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        env_patch = patch.dict(os.environ, CACHE_DIR=self.cache_dir)
+        env_patch.start()
+        self.addCleanup(env_patch.stop)
+
+        self.task = PredictVisitors(days_to_predict=7)
+        self.cache_root = os.path.join(self.cache_dir, 'visitor_prediction')
+
+    def test_cache(self):
+
+        self.write_input()
+        self.assertEqual(2, self.run_task_counting_fits())
+        predictions = self.read_output()
+
+        self.assertEqual(
+            0, self.run_task_counting_fits(),
+            msg="Cached predictions should have been reused")
+        pd.testing.assert_frame_equal(predictions, self.read_output())
+
+        self.write_input(offset=1)
+        self.assertEqual(
+            2, self.run_task_counting_fits(),
+            msg="Changed input should have been predicted again")
+        self.assertEqual(2, len(os.listdir(self.cache_root)))
+
+    def test_cache_eviction(self):
+
+        fingerprints = []
+        for offset in range(CACHED_PREDICTIONS + 2):
+            self.write_input(offset=offset)
+            fingerprints.append(self.task.fingerprint())
+            self.task.run()
+            # make sure that entries are ordered by their age
+            os.utime(
+                os.path.join(self.cache_root, fingerprints[-1]),
+                (offset, offset))
+
+        self.assertCountEqual(
+            fingerprints[-CACHED_PREDICTIONS:],
+            os.listdir(self.cache_root))
+
+    def write_input(self, offset=0):
+
+        entries_target, exhibitions_target, facts_target = self.task.input()
+
+        dates = pd.date_range('2020-01-01', periods=60)
+        with entries_target.open('w') as entries_file:
+            pd.DataFrame({
+                'date': dates,
+                'entries': [
+                    100 + offset + 10 * (i % 7)
+                    for i in range(len(dates))
+                ]
+            }).to_csv(entries_file, index=False)
+        with exhibitions_target.open('w') as exhibitions_file:
+            pd.DataFrame([{
+                'title': 'Exhibition',
+                'start_date': '2020-01-15',
+                'end_date': '2020-03-15',
+                'special': '',
+                'popularity': 42
+            }]).to_csv(exhibitions_file, index=False)
+        with facts_target.open('w') as facts_file:
+            json.dump({
+                'missing_closed_timespans': [],
+                'limited_entry_timespans': []
+            }, facts_file)
+
+    def run_task_counting_fits(self):
+        """Run the task and answer how often a model has been fitted."""
+        with patch(
+                'visitor_prediction.predict.predict_entries',
+                wraps=predict_entries) as predict_mock:
+            self.task.run()
+        return predict_mock.call_count
+
+    def read_output(self):
+
+        with self.task.output().open('r') as output_file:
+            return pd.read_csv(output_file)
+
+
+class TestPredictionsToDb(DatabaseTestCase):
+    """Tests the PredictionsToDb task."""
+
+    def test_skip_rewrite(self):
+
+        self.write_predictions([(False, '2020-01-01', 100)])
+        PredictionsToDb(dummy_date=1).run()
+
+        with patch.object(CsvToDb, 'copy') as copy_mock:
+            PredictionsToDb(dummy_date=2).run()
+        copy_mock.assert_not_called()
+
+        self.write_predictions([(False, '2020-01-01', 200)])
+        PredictionsToDb(dummy_date=3).run()
+        self.assertEqual(
+            [(200,)],
+            self.db_connector.query('SELECT entries FROM visitor_prediction'))
+
+    def write_predictions(self, predictions):
+
+        target = PredictVisitors(days_to_predict=TIMESPAN).output()
+        with target.open('w') as predictions_file:
+            pd.DataFrame(
+                predictions,
+                columns=['is_sample', 'date', 'entries']
+            ).to_csv(predictions_file, index=False)
+
+
+class TestPreprocessEntries(DatabaseTestCase):
+    """Tests the feature engineering against the former implementation."""
+
+    def test_identical_features(self):
+
+        dates = pd.date_range('2020-01-01', periods=120)
+        entries = pd.DataFrame(
+            index=dates,
+            data=[[100 + i % 7] for i in range(len(dates))],
+            columns=['entries'])
+        exhibitions = pd.DataFrame([
+            # overlapping exhibitions
+            ('First', '2020-01-05', '2020-02-10', '', 10),
+            ('Second', '2020-02-01', '2020-03-20', '', 20),
+            # exhibitions that exceed the known dates
+            ('Past', '2019-10-01', '2020-01-02', '', 30),
+            ('Future', '2020-04-20', '2020-08-01', '', 40),
+            ('Never', '2021-01-01', '2021-02-01', '', 50),
+            ('Closed', '2020-02-11', '2020-02-13', 'closing day', 0),
+            ('Closed again', '2020-02-12', '2020-02-15', 'closing day', 0)
+        ], columns=['title', 'start_date', 'end_date', 'special',
+                    'popularity'])
+        for column in ['start_date', 'end_date']:
+            exhibitions[column] = pd.to_datetime(exhibitions[column])
+        facts = {
+            'missing_closed_timespans': [
+                {'start': '2020-03-01', 'end': '2020-03-05'}
+            ],
+            'limited_entry_timespans': [
+                {'start': '2020-03-04', 'end': '2020-04-01'}
+            ]
+        }
+
+        for name, order in [('sorted', dates), ('reversed', dates[::-1])]:
+            with self.subTest(dates=name):
+                pd.testing.assert_frame_equal(
+                    legacy_preprocess_entries(
+                        entries.loc[order].copy(), exhibitions.copy(), facts),
+                    preprocess_entries(
+                        entries.loc[order].copy(), exhibitions.copy(), facts))
+
+
+class TestExhibitionPopularity(DatabaseTestCase):
+    """Tests the ExhibitionPopularity task against the former matching."""
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.exhibitions = pd.DataFrame([
+            ('Monet. Impressions', '2020-06-01', ''),
+            # the first title is part of this one
+            ('Monet and Friends', '2020-09-01', ''),
+            # duplicate titles of an exhibition with multiple time rows
+            ('Rembrandt', '2020-07-01', ''),
+            ('Rembrandt', '2020-08-01', ''),
+            ('Picasso', '2021-01-01', ''),
+            ('Picasso Closing', '2020-06-15', 'closing day'),
+            ('Klee', '2019-01-01', '')
+        ], columns=['title', 'start_date', 'special'])
+        self.exhibitions['start_date'] = pd.to_datetime(
+            self.exhibitions['start_date'])
+        self.exhibitions['end_date'] = \
+            self.exhibitions['start_date'] + dt.timedelta(days=60)
+
+        self.posts = pd.DataFrame([
+            ('Soon: MONET!', '2020-05-01', 10),
+            # mentions both Monet exhibitions
+            ('Monet and friends are coming', '2020-05-01', 20),
+            # Monet. Impressions has already started
+            ('Monet and friends', '2020-07-01', 30),
+            # mentions both time rows of Rembrandt
+            ('Rembrandt!', '2020-06-01', 40),
+            ('Rembrandt', '2020-07-15', 50),
+            # more than 360 days before the exhibition
+            ('Picasso', '2019-12-01', 60),
+            ('Picasso', '2020-03-01', 70),
+            # special exhibitions are never announced
+            ('Picasso Closing', '2020-06-01', 80),
+            # after or when the exhibition has started
+            ('Klee', '2020-01-01', 90),
+            ('Monet', '2020-06-01', 120),
+            ('Nothing to see here', '2020-05-01', 100),
+            (None, '2020-05-01', 110)
+        ], columns=['text', 'post_date', 'likes'])
+        self.posts['post_date'] = pd.to_datetime(self.posts['post_date'])
+
+    def test_find_announced_exhibitions(self):
+
+        announced = find_announced_exhibitions(self.posts, self.exhibitions)
+
+        self.assertDictEqual(
+            {
+                0: 'Monet. Impressions',
+                2: 'Monet and Friends',
+                4: 'Rembrandt',
+                6: 'Picasso',
+                7: 'Picasso'
+            },
+            announced.dropna().to_dict())
+        self.assertDictEqual(
+            legacy_find_announced_exhibitions(
+                self.posts, self.exhibitions).dropna().to_dict(),
+            announced.dropna().to_dict())
+
+    def test_no_exhibitions(self):
+
+        exhibitions = self.exhibitions[self.exhibitions['special'] != '']
+
+        announced = find_announced_exhibitions(self.posts, exhibitions)
+
+        self.assertTrue(announced.isna().all())
+        self.assertEqual(len(self.posts), len(announced))
+
+    def test_popularity(self):
+
+        task = ExhibitionPopularity()
+        exhibitions_target, posts_target = task.input()
+        with exhibitions_target.open('w') as exhibitions_file:
+            self.exhibitions.to_csv(exhibitions_file, index=False)
+        with posts_target.open('w') as posts_file:
+            self.posts.to_csv(posts_file, index=False)
+
+        task.run()
+
+        with task.output().open('r') as output_file:
+            popularities = pd.read_csv(output_file)['popularity']
+        # mean of the maximum likes of all announced exhibitions
+        average = (10 + 30 + 50 + 80) / 4
+        self.assertListEqual(
+            [10, 30, 50, 50, 80, average, average],
+            popularities.tolist())
+        self.assertListEqual(
+            legacy_exhibition_popularities(
+                self.posts, self.exhibitions).tolist(),
+            popularities.tolist())
+
+
+class TestBacktesting(DatabaseTestCase):
+    """Tests the backtesting of the visitor prediction."""
+
+    def test_backtest_missing_day(self):
+
+        dates = pd.date_range('2020-01-01', periods=60)
+        entries = pd.DataFrame(
+            index=dates,
+            data=[[100 + 10 * (i % 7)] for i in range(len(dates))],
+            columns=['entries'])
+        features = preprocess_entries(
+            pd.DataFrame(index=dates, columns=['entries']),
+            pd.DataFrame(
+                columns=['title', 'start_date', 'end_date', 'special',
+                         'popularity']),
+            {'missing_closed_timespans': [], 'limited_entry_timespans': []}
+        ).drop(columns='entries')
+        cutoff = pd.Timestamp('2020-02-15')
+        # no entries are known for the cutoff date
+        entries = entries.drop(index=cutoff)
+
+        predictions = backtest(
+            (cutoff, 3, 1, 7), entries=entries, features=features)
+
+        self.assertListEqual(
+            list(pd.date_range('2020-02-16', periods=7)),
+            predictions['date'].tolist())
+        self.assertListEqual(
+            list(range(1, 8)),
+            predictions['horizon'].tolist())
+        self.assertTrue((predictions['cutoff'] == cutoff).all())
+
+    def test_evaluate(self):
+
+        predictions = pd.DataFrame([
+            # date, horizon, predicted entries
+            ('2020-01-02', 1, 110),
+            ('2020-01-03', 2, 90),
+            ('2020-01-09', 1, 50),
+            # no actual entries known
+            ('2020-01-10', 2, 60),
+            ('2020-01-03', 1, 100),
+            ('2020-01-04', 2, 30)
+        ], columns=['date', 'horizon', 'entries']).assign(
+            n_neighbors=[5, 5, 5, 5, 3, 3],
+            sequence_length=1,
+            timespan=2)
+        predictions['date'] = pd.to_datetime(predictions['date'])
+        entries = pd.Series(
+            {
+                '2020-01-02': 100,
+                '2020-01-03': 100,
+                '2020-01-04': 0,
+                '2020-01-09': 40,
+            },
+            name='entries')
+        entries.index = pd.to_datetime(entries.index)
+
+        metrics = evaluate(predictions, entries)
+
+        expected = pd.DataFrame([
+            (3, 1, 2, 1, 0, 0.0, 1),
+            # no percentage error for days without visitors
+            (3, 1, 2, 2, 30, np.nan, 1),
+            (5, 1, 2, 1, (10 + 10) / 2, (0.1 + 0.25) / 2, 2),
+            (5, 1, 2, 2, 10, 0.1, 1)
+        ], columns=[
+            'n_neighbors', 'sequence_length', 'timespan', 'horizon',
+            'mae', 'mape', 'cutoffs'
+        ])
+        pd.testing.assert_frame_equal(expected, metrics, check_dtype=False)
+
+
+def legacy_find_announced_exhibitions(posts, exhibitions):
+    """Match posts with exhibitions like the former implementation."""
+    def find_related_exhib(post):
+        mentioned_exhibitions = []
+        for exhib in exhibitions.itertuples():
+            if exhib.special:
+                continue
+
+            first_title_half = exhib.title.split('.')[0]
+            simple_text = simplify_text(str(post['text']))
+            simple_title = simplify_text(first_title_half)
+            if simple_title in simple_text and \
+                exhib.start_date - dt.timedelta(days=360) \
+                    < post['post_date'] < exhib.start_date:
+                mentioned_exhibitions.append(exhib.title)
+        return mentioned_exhibitions[0] \
+            if len(mentioned_exhibitions) == 1\
+            else None  # avoid ambiguity
+    return posts.apply(find_related_exhib, axis=1)
+
+
+def legacy_exhibition_popularities(posts, exhibitions):
+    """Compute popularities like the former implementation."""
+    posts = posts.copy()
+    exhibitions = exhibitions.copy()
+    posts['announces'] = legacy_find_announced_exhibitions(posts, exhibitions)
+
+    announcing_posts = posts.dropna(subset=['announces'])
+
+    popul_per_exhib = announcing_posts.filter(
+        ['announces', 'likes']).groupby(['announces']).max().dropna()
+    average_max_likes = popul_per_exhib['likes'].mean() \
+        if len(announcing_posts) > 0 else 0.0
+
+    for exhibition in exhibitions.itertuples():
+        try:
+            popularity = popul_per_exhib.loc[exhibition.title]['likes']
+        except KeyError:
+            popularity = average_max_likes
+        exhibitions.loc[
+            exhibitions['title'] == exhibition.title, 'popularity'
+            ] = popularity
+    return exhibitions['popularity']
+
+
+def legacy_preprocess_entries(entries, exhibitions, facts):
+    """Compute features like the former implementation of preprocessing."""
+    for (special, facts_attribute) in [
+        ('closing day', 'missing_closed_timespans'),
+        ('limited entries', 'limited_entry_timespans')
+    ]:
+        for closed_timespan in facts[facts_attribute]:
+            exhibitions = exhibitions.append(
+                pd.DataFrame(
+                    columns=exhibitions.columns,
+                    data=[{
+                        "special": special,
+                        'start_date': closed_timespan['start'],
+                        'end_date': closed_timespan['end']
+                    }]),
+                ignore_index=True)
+    dates = entries['entries'].index.to_series()
+
+    for column, special in [
+        ('is_closed', 'closing day'),
+        ('limited_entries', 'limited entries')
+    ]:
+        entries[column] = 0
+        for exhibition in exhibitions[
+                exhibitions['special'] == special].itertuples():
+            entries.loc[
+                dates.between(exhibition.start_date, exhibition.end_date),
+                column] = 1
+
+    exhibitions = exhibitions[exhibitions['special'] == '']
+
+    def calc_exhib_progress(date):
+        for exhibition in exhibitions.itertuples():
+            start = exhibition.start_date
+            end = exhibition.end_date
+            if start <= date <= end:
+                return (date - start).days / (end - start).days
+        return -1
+    entries['exhibition_progress'] = dates.apply(calc_exhib_progress)
+
+    entries['exhibition_popularity'] = 0
+    for exhibition in exhibitions.itertuples():
+        entries.loc[
+            dates.between(exhibition.start_date, exhibition.end_date),
+            'exhibition_popularity'] = exhibition.popularity
+
+    weekdays = pd.get_dummies(
+        dates.apply(lambda date: date.weekday()), prefix='weekday')
+    for col in weekdays.columns:
+        entries[col] = weekdays[col]
+    return entries
@@ -557,6 +557,260 @@ class TestQueryCacheToDb(DatabaseTestCase):
             self.db_connector.query(f'SELECT * FROM {self.table}')
         )
 
+    def test_incremental(self):
+
+        self.db_connector.execute(
+            '''
+                CREATE TABLE my_cool_upstream (
+                    source TEXT,
+                    post_id TEXT,
+                    value INT
+                )
+            ''',
+            "SELECT track_partition_changes('public.my_cool_upstream')",
+            '''
+                CREATE TABLE my_cool_partitioned_cache (
+                    source TEXT,
+                    post_id TEXT,
+                    value INT
+                )
+            ''',
+            '''
+                INSERT INTO my_cool_upstream VALUES
+                    ('spam', '1', 1), ('spam', '1', 2), ('spam', '2', 3)
+            '''
+        )
+
+        class IncrementalCacheToDb(QueryCacheToDb):
+            table = 'my_cool_partitioned_cache'
+            partition_key = ('source', 'post_id')
+            upstream_tables = ['public.my_cool_upstream']
+
+            @property
+            def query(self):
+                return f'''
+                    SELECT source, post_id, sum(value)
+                    FROM my_cool_upstream
+                    WHERE {self.changed_partition_filter('my_cool_upstream')}
+                    GROUP BY source, post_id
+                '''
+
+        def cache_content():
+            return self.db_connector.query('''
+                SELECT * FROM my_cool_partitioned_cache
+                ORDER BY source, post_id
+            ''')
+
+        self.task = IncrementalCacheToDb()
+        self.task.output = lambda: \
+            MockTarget('output/my_cool_partitioned_cache')
+        self.run_task(self.task)
+        self.assertSequenceEqual(
+            [('spam', '1', 3), ('spam', '2', 3)],
+            cache_content(),
+            msg="Cache table should have been filled completely on first run"
+        )
+
+        # Tamper unchanged partition to detect whether it is recomputed
+        self.db_connector.execute(
+            "UPDATE my_cool_partitioned_cache SET value = -1 "
+            "WHERE post_id = '2'",
+            "INSERT INTO my_cool_upstream VALUES ('spam', '1', 4)"
+        )
+        self.task.run()
+        self.assertSequenceEqual(
+            [('spam', '1', 7), ('spam', '2', -1)],
+            cache_content(),
+            msg="Only the changed partition should have been recomputed"
+        )
+        self.assertFalse(
+            self.db_connector.query('SELECT * FROM cache_partition_change'),
+            msg="Respected changes should have been pruned from the log"
+        )
+
+        self.task = IncrementalCacheToDb(full_rebuild=True)
+        self.task.output = lambda: \
+            MockTarget('output/my_cool_partitioned_cache_full')
+        self.task.run()
+        self.assertSequenceEqual(
+            [('spam', '1', 7), ('spam', '2', 3)],
+            cache_content(),
+            msg="All partitions should have been recomputed on full rebuild"
+        )
+
+        self.db_connector.execute(
+            "UPDATE my_cool_partitioned_cache SET value = -1",
+            "TRUNCATE my_cool_upstream"
+        )
+        self.task = IncrementalCacheToDb()
+        self.task.output = lambda: \
+            MockTarget('output/my_cool_partitioned_cache')
+        self.task.run()
+        self.assertFalse(
+            cache_content(),
+            msg="All partitions should have been recomputed after truncation"
+        )
+
+    def test_incremental_upstream_filter(self):
+
+        self.db_connector.execute(
+            '''
+                CREATE TABLE my_cool_upstream (
+                    source TEXT,
+                    post_id TEXT,
+                    value INT
+                )
+            ''',
+            "SELECT track_partition_changes('public.my_cool_upstream')",
+            '''
+                CREATE TABLE my_cool_partitioned_cache (
+                    source TEXT,
+                    post_id TEXT,
+                    value INT
+                )
+            ''',
+            "INSERT INTO my_cool_upstream VALUES ('spam', '1', 1)",
+            "INSERT INTO my_cool_upstream VALUES ('spam', '2', 2)"
+        )
+
+        class IncrementalCacheToDb(QueryCacheToDb):
+            table = 'my_cool_partitioned_cache'
+            partition_key = ('source', 'post_id')
+            upstream_tables = ['public.my_cool_upstream']
+
+            @property
+            def query(self):
+                return f'''
+                    SELECT source, post_id, sum(2 / value)
+                    FROM my_cool_upstream
+                    WHERE {self.changed_partition_filter('my_cool_upstream')}
+                    GROUP BY source, post_id
+                '''
+
+        self.task = IncrementalCacheToDb()
+        self.task.output = lambda: \
+            MockTarget('output/my_cool_partitioned_cache')
+        self.task.run()
+
+        # Break an unchanged partition without logging it. Reading it would
+        # raise a division by zero.
+        self.db_connector.execute(
+            'ALTER TABLE my_cool_upstream DISABLE TRIGGER USER',
+            "UPDATE my_cool_upstream SET value = 0 WHERE post_id = '2'",
+            'ALTER TABLE my_cool_upstream ENABLE TRIGGER USER',
+            "UPDATE my_cool_upstream SET value = 2 WHERE post_id = '1'"
+        )
+        self.task = IncrementalCacheToDb()
+        self.task.output = lambda: \
+            MockTarget('output/my_cool_partitioned_cache_2')
+        self.task.run()
+
+        self.assertSequenceEqual(
+            [('spam', '1', 1), ('spam', '2', 1)],
+            self.db_connector.query('''
+                SELECT * FROM my_cool_partitioned_cache
+                ORDER BY source, post_id
+            '''),
+            msg="Unchanged partitions should not have been read"
+        )
+
+
+class TestPostTable(DatabaseTestCase):
+    """Tests the triggers that keep the post table in sync."""
+
+    def test_sync(self):
+
+        self.db_connector.execute(
+            '''
+                INSERT INTO tweet(user_id,tweet_id,text,response_to,post_date)
+                VALUES ('user_id', 'tweet1', 'tweet text', NULL,
+                        '2020-05-24 10:56:21'),
+                    ('user_id', 'tweet2', 'another tweet', NULL,
+                        '2020-05-25 10:56:21')
+            ''',
+            '''
+                INSERT INTO fb_post_comment(post_id,comment_id,post_date,
+                    text,is_from_museum,response_to)
+                VALUES ('post1','comment1','2020-05-24 10:56:21',
+                        'text1',false,NULL)
+            '''
+        )
+        self.assertCountEqual(
+            [
+                ('Twitter', 'tweet1', 'tweet text'),
+                ('Twitter', 'tweet2', 'another tweet'),
+                ('Facebook Comment', 'post1_comment1', 'text1')
+            ],
+            self.db_connector.query('''
+                SELECT source, post_id, text FROM post
+            '''),
+            msg="Inserted posts should have been added to the post table"
+        )
+
+        self.db_connector.execute(
+            "UPDATE tweet SET text = 'new text' WHERE tweet_id = 'tweet1'",
+            "DELETE FROM tweet WHERE tweet_id = 'tweet2'",
+            "TRUNCATE fb_post_comment"
+        )
+        self.assertCountEqual(
+            [('Twitter', 'tweet1', 'new text')],
+            self.db_connector.query('''
+                SELECT source, post_id, text FROM post
+            '''),
+            msg="Modified posts should have been updated in the post table"
+        )
+
+    def test_sync_changed_posts_only(self):
+
+        self.db_connector.execute(
+            '''
+                INSERT INTO tweet(user_id,tweet_id,text,response_to,post_date)
+                VALUES ('user1', 'tweet1', 'tweet text', NULL,
+                        '2020-05-24 10:56:21'),
+                    ('user2', 'tweet2', 'another tweet', NULL,
+                        '2020-05-25 10:56:21')
+            ''',
+            # Tamper post to detect whether it is refreshed
+            "UPDATE post SET text = 'tampered' WHERE post_id = 'tweet2'",
+            '''
+                INSERT INTO tweet_performance VALUES
+                    ('tweet1', 42, 1, 2, '2020-05-26 00:00:00')
+            ''',
+            '''
+                INSERT INTO tweet_author
+                VALUES ('user1', 'barberini', 'official')
+            '''
+        )
+        self.assertCountEqual(
+            [
+                ('tweet1', 'tweet text', 42, True),
+                ('tweet2', 'tampered', None, False)
+            ],
+            self.db_connector.query('''
+                SELECT post_id, text, likes, is_from_museum FROM post
+            '''),
+            msg="Only the changed posts should have been refreshed"
+        )
+
+        self.db_connector.execute(
+            "UPDATE tweet SET tweet_id = 'tweet3' WHERE tweet_id = 'tweet2'",
+            "UPDATE post SET text = 'tampered' WHERE post_id = 'tweet1'")
+        self.assertCountEqual(
+            [('tweet1', 'tampered', 42), ('tweet3', 'another tweet', None)],
+            self.db_connector.query('SELECT post_id, text, likes FROM post'),
+            msg="Old and new IDs of updated rows should have been refreshed"
+        )
+
+        self.db_connector.execute('TRUNCATE tweet_performance')
+        self.assertCountEqual(
+            [
+                ('tweet1', 'tweet text', None),
+                ('tweet3', 'another tweet', None)
+            ],
+            self.db_connector.query('SELECT post_id, text, likes FROM post'),
+            msg="All posts should have been refreshed after truncation"
+        )
+
 
 class DummyFileWrapper(luigi.Task):
     """Dummy task to write an output file."""
@@ -0,0 +1,94 @@
+import datetime as dt
+
+from freezegun import freeze_time
+import luigi
+
+from _utils import FullSyncTask
+from db_test import DatabaseTestCase
+
+
+class FullSyncTestTask(FullSyncTask):
+    """A task that does nothing but planning full syncs."""
+
+    def run(self):
+        pass
+
+
+class TestFullSyncTask(DatabaseTestCase):
+    """Tests the FullSyncTask class."""
+
+    def test_first_full_sync(self):
+
+        task = FullSyncTestTask()
+        self.assertTrue(task.plan_full_sync())
+        self.assertEqual({None: None}, task.last_full_syncs([None]))
+
+        self.succeed(task)
+
+        self.assertFalse(FullSyncTestTask().plan_full_sync())
+        self.assertEqual(
+            ['FullSyncTestTask'],
+            [key for key, in self.db_connector.query(
+                'SELECT sync_key FROM full_sync')])
+
+    def test_interval(self):
+
+        self.store_full_sync('FullSyncTestTask', '2020-01-01 23:00')
+        task = FullSyncTestTask(full_sync_interval=7)
+
+        with freeze_time('2020-01-07 01:00'):
+            self.assertFalse(task.plan_full_sync())
+        with freeze_time('2020-01-08 01:00'):
+            self.assertTrue(task.plan_full_sync())
+
+        task = FullSyncTestTask(full_sync_interval=0)
+        with freeze_time('2021-01-01'):
+            self.assertFalse(task.plan_full_sync())
+
+    def test_parts(self):
+
+        self.store_full_sync('FullSyncTestTask/spam', '2020-01-01')
+        task = FullSyncTestTask(full_sync_interval=7)
+
+        with freeze_time('2020-01-02'):
+            self.assertFalse(task.plan_full_sync('spam'))
+            self.assertTrue(task.plan_full_sync('eggs'))
+        self.assertEqual(
+            {'spam': dt.datetime(2020, 1, 1), 'eggs': None},
+            task.last_full_syncs(['spam', 'eggs']))
+        self.succeed(task)
+
+        self.assertCountEqual(
+            ['FullSyncTestTask/spam', 'FullSyncTestTask/eggs'],
+            [key for key, in self.db_connector.query(
+                'SELECT sync_key FROM full_sync')])
+
+    def test_cancel(self):
+
+        task = FullSyncTestTask()
+        self.assertTrue(task.plan_full_sync())
+        task.cancel_full_syncs()
+
+        self.succeed(task)
+
+        self.assertFalse(self.db_connector.exists('SELECT * FROM full_sync'))
+
+    def test_failure(self):
+
+        task = FullSyncTestTask()
+        self.assertTrue(task.plan_full_sync())
+
+        task.trigger_event(luigi.Event.FAILURE, task, Exception())
+
+        self.assertFalse(self.db_connector.exists('SELECT * FROM full_sync'))
+
+    def store_full_sync(self, key, synced_at):
+
+        self.db_connector.execute((
+            'INSERT INTO full_sync (sync_key, synced_at) VALUES (%s, %s)',
+            (key, synced_at)))
+
+    @staticmethod
+    def succeed(task):
+
+        task.trigger_event(luigi.Event.SUCCESS, task)
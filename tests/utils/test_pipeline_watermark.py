@@ -0,0 +1,171 @@
+import luigi
+from luigi.mock import MockTarget
+
+from _utils.database import CsvToDb
+from _utils.pipeline_watermark import ClaimPosts, claim_posts_query, \
+    confirm_posts_query, pending_posts_query, unprocessed_posts_query
+from db_test import DatabaseTestCase
+
+POST_TABLE = 'test_post'
+TABLE_NAME = 'test_derived_table'
+DOWNSTREAM_TABLE_NAME = 'test_downstream_table'
+
+
+class TestPipelineWatermark(DatabaseTestCase):
+    """Tests the pipeline_watermark helpers."""
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.db_connector.execute(
+            f'''
+                CREATE TABLE {POST_TABLE} (
+                    source TEXT,
+                    post_id TEXT
+                )
+            ''',
+            f'''
+                INSERT INTO {POST_TABLE} VALUES
+                    ('spam', '1'), ('spam', '2'), ('eggs', '1')
+            '''
+        )
+
+    def unprocessed_posts(self):
+
+        return set(self.db_connector.query(
+            unprocessed_posts_query(TABLE_NAME, post_table=POST_TABLE)))
+
+    def pending_posts(self):
+
+        return set(self.db_connector.query(pending_posts_query(TABLE_NAME)))
+
+    def test_claim_and_confirm(self):
+
+        self.assertSetEqual(
+            {('spam', '1'), ('spam', '2'), ('eggs', '1')},
+            self.unprocessed_posts())
+        self.assertFalse(self.pending_posts())
+
+        self.db_connector.execute(
+            claim_posts_query(TABLE_NAME, post_table=POST_TABLE))
+
+        self.assertFalse(self.unprocessed_posts())
+        self.assertSetEqual(
+            {('spam', '1'), ('spam', '2'), ('eggs', '1')},
+            self.pending_posts())
+
+        self.db_connector.execute(
+            (confirm_posts_query(TABLE_NAME), (
+                ['spam', 'spam', 'eggs'],
+                ['1', '2', '1'])),
+            f"INSERT INTO {POST_TABLE} VALUES ('eggs', '2')")
+
+        self.assertSetEqual({('eggs', '2')}, self.unprocessed_posts())
+        self.assertFalse(self.pending_posts())
+
+    def test_confirm_only_given_posts(self):
+
+        self.db_connector.execute(
+            claim_posts_query(TABLE_NAME, post_table=POST_TABLE),
+            (confirm_posts_query(TABLE_NAME), (['spam'], ['2'])))
+
+        self.assertSetEqual(
+            {('spam', '1'), ('eggs', '1')},
+            self.pending_posts())
+
+    def test_claim_upstream(self):
+
+        self.db_connector.execute(
+            claim_posts_query(TABLE_NAME, post_table=POST_TABLE),
+            (confirm_posts_query(TABLE_NAME), (['spam'], ['1'])),
+            claim_posts_query(
+                DOWNSTREAM_TABLE_NAME,
+                upstream_table=TABLE_NAME))
+
+        # Posts that are still pending upstream are not claimed downstream
+        self.assertSetEqual(
+            {('spam', '1')},
+            set(self.db_connector.query(
+                pending_posts_query(DOWNSTREAM_TABLE_NAME))))
+
+    def test_claim_limit(self):
+
+        self.db_connector.execute(
+            claim_posts_query(TABLE_NAME, limit=2, post_table=POST_TABLE))
+
+        self.assertEqual(1, len(self.unprocessed_posts()))
+        self.assertEqual(2, len(self.pending_posts()))
+
+        # Pending posts remain claimed
+        self.db_connector.execute(
+            claim_posts_query(TABLE_NAME, post_table=POST_TABLE))
+
+        self.assertFalse(self.unprocessed_posts())
+        self.assertEqual(3, len(self.pending_posts()))
+
+    def test_claim_task(self):
+
+        claim = DummyClaimPosts(table=TABLE_NAME)
+        claim.run()
+
+        with claim.output().open('r') as claim_file:
+            claimed_csv = claim_file.read()
+        self.assertSetEqual(
+            {'source,post_id', 'spam,1', 'spam,2', 'eggs,1'},
+            set(claimed_csv.splitlines()))
+
+        # Posts arriving after the claim are neither claimed nor confirmed
+        self.db_connector.execute(
+            f"INSERT INTO {POST_TABLE} VALUES ('eggs', '2')",
+            f'''
+                CREATE TABLE {TABLE_NAME} (
+                    source TEXT,
+                    post_id TEXT,
+                    PRIMARY KEY (source, post_id)
+                )
+            ''')
+        self.run_task(DummyClaimedPostsToDb(
+            table=TABLE_NAME,
+            csv='source,post_id\nspam,1\n'))
+
+        self.assertFalse(self.pending_posts())
+        self.assertSetEqual({('eggs', '2')}, self.unprocessed_posts())
+
+
+class DummyClaimPosts(ClaimPosts):
+    """Claims posts from the test post table."""
+
+    post_table = POST_TABLE
+
+    def output(self):
+        return MockTarget(
+            f'claimed_posts_{self.table}',
+            format=luigi.format.UTF8)
+
+
+class DummyCsv(luigi.Task):
+    """Dummy task to write an output file."""
+
+    csv = luigi.Parameter()
+
+    def run(self):
+        with self.output().open('w') as output_file:
+            output_file.write(self.csv)
+
+    def output(self):
+        return MockTarget('dummy_claimed_posts', format=luigi.format.UTF8)
+
+
+class DummyClaimedPostsToDb(CsvToDb):
+    """Stores posts and confirms all claimed posts."""
+
+    table = luigi.Parameter()
+
+    csv = luigi.Parameter()
+
+    def requires(self):
+        return DummyCsv(csv=self.csv)
+
+    def claim_posts(self):
+        return DummyClaimPosts(table=self.table)